@@ -0,0 +1,207 @@
+"""
+Load generator and latency benchmark for the chat server.
+
+Starts a server on localhost (or targets a running one with --server),
+drives simulated clients through a weighted mix of operations and reports
+throughput and latency percentiles per opcode.
+
+Example:
+    python bench.py --mode async --clients 64 --duration 10 \
+        --mix login=10,create=5,send=60,view=15,list=10 --json results.json
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from client import ChatClient
+from operations import Operations
+
+OPERATIONS = {
+    "login": Operations.LOGIN,
+    "create": Operations.CREATE_ACCOUNT,
+    "send": Operations.SEND_MESSAGE,
+    "view": Operations.VIEW_UNDELIVERED_MESSAGES,
+    "list": Operations.LIST_ACCOUNT,
+}
+DEFAULT_MIX = "login=10,create=5,send=60,view=15,list=10"
+PERCENTILES = (50, 99, 99.9)
+
+
+def parse_mix(mix):
+    """
+    Parses "send=60,view=15,..." into a list of (operation name, weight).
+    """
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError("Unknown operation {} in mix".format(name))
+        weights.append((name, float(weight or 1)))
+    return weights
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return float("nan")
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, mode, extra_args=()):
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+         "--host", "127.0.0.1", "--port", str(port), "--mode", mode, "--quiet"] + list(extra_args),
+        stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("Server did not start on port {}".format(port))
+
+
+class SimulatedClient(threading.Thread):
+    """
+    One simulated user with its own connection, issuing operations from the
+    mix back to back and recording the latency of each.
+    """
+
+    def __init__(self, index, addr, mix, users, deadline, seed):
+        super().__init__(daemon=True)
+        self.username = users[index]
+        self.client = ChatClient(addr, pool_size=1)
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.users = users
+        self.deadline = deadline
+        self.random = random.Random(seed)
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.errors = 0
+        self.created = 0
+
+    def next_request(self, name):
+        if name == "login":
+            return Operations.LOGIN, self.username
+        if name == "create":
+            self.created += 1
+            return Operations.CREATE_ACCOUNT, "{}-new-{}".format(self.username, self.created)
+        if name == "send":
+            receiver = self.random.choice(self.users)
+            return Operations.SEND_MESSAGE, "{}\n{}\nbenchmark message from {}".format(
+                self.username, receiver, self.username)
+        if name == "view":
+            return Operations.VIEW_UNDELIVERED_MESSAGES, self.username + "\n100\n"
+        return Operations.LIST_ACCOUNT, "bench\n\n100"
+
+    def run(self):
+        try:
+            while time.perf_counter() < self.deadline:
+                name = self.random.choices(self.names, self.weights)[0]
+                operation, info = self.next_request(name)
+                start = time.perf_counter()
+                try:
+                    self.client.request(operation, info)
+                except OSError:
+                    self.errors += 1
+                    continue
+                self.latencies[name].append(time.perf_counter() - start)
+        finally:
+            self.client.close()
+
+
+def run_benchmark(addr, clients, duration, mix, seed=262):
+    users = ["bench-{:05d}".format(i) for i in range(clients)]
+    setup = ChatClient(addr, pool_size=1)
+    setup.pipeline([(Operations.CREATE_ACCOUNT, username) for username in users])
+    setup.close()
+
+    start = time.perf_counter()
+    workers = [SimulatedClient(i, addr, mix, users, start + duration, seed + i) for i in range(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    results = []
+    for name in OPERATIONS:
+        latencies = sorted(latency for worker in workers for latency in worker.latencies[name])
+        if not latencies:
+            continue
+        row = {"operation": name, "count": len(latencies), "ops_per_sec": len(latencies) / elapsed,
+               "mean_ms": sum(latencies) / len(latencies) * 1000}
+        for p in PERCENTILES:
+            row["p{:g}_ms".format(p)] = percentile(latencies, p) * 1000
+        results.append(row)
+    total = sum(row["count"] for row in results)
+    summary = {"clients": clients, "duration_sec": elapsed, "ops": total, "ops_per_sec": total / elapsed,
+               "errors": sum(worker.errors for worker in workers)}
+    return summary, results
+
+
+def print_results(summary, results):
+    columns = ["operation", "count", "ops_per_sec", "mean_ms"] + ["p{:g}_ms".format(p) for p in PERCENTILES]
+    print(" ".join("{:>12}".format(column) for column in columns))
+    for row in results:
+        print(" ".join("{:>12}".format(row[column]) if isinstance(row[column], str)
+                       else "{:>12.3f}".format(row[column]) if isinstance(row[column], float)
+                       else "{:>12}".format(row[column]) for column in columns))
+    print("{ops} ops in {duration_sec:.1f}s from {clients} clients: {ops_per_sec:,.0f} ops/sec, {errors} errors"
+          .format(**summary))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat server load generator")
+    parser.add_argument("--server", help="host:port of a running server; by default one is started on localhost")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                        help="server mode to start when --server is not given")
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="extra argument for the started server, e.g. --server-arg=--data-dir=/tmp/chat")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operation mix")
+    parser.add_argument("--seed", type=int, default=262)
+    parser.add_argument("--csv", help="write per-opcode results to this CSV file")
+    parser.add_argument("--json", help="write the summary and per-opcode results to this JSON file")
+    args = parser.parse_args()
+
+    server = None
+    if args.server:
+        host, port = args.server.rsplit(":", 1)
+        addr = (host, int(port))
+    else:
+        addr = ("127.0.0.1", free_port())
+        server = start_server(addr[1], args.mode, args.server_arg)
+    try:
+        summary, results = run_benchmark(addr, args.clients, args.duration, parse_mix(args.mix), args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    summary.update({"mode": None if args.server else args.mode, "mix": args.mix})
+
+    print_results(summary, results)
+    if args.csv:
+        with open(args.csv, "w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=list(results[0]) if results else ["operation"])
+            writer.writeheader()
+            writer.writerows(results)
+    if args.json:
+        with open(args.json, "w") as jsonfile:
+            json.dump({"summary": summary, "results": results}, jsonfile, indent=2)
@@ -1,8 +1,15 @@
 import hashlib
 
+from collections import deque
 from dataclasses import dataclass
 
 class user:
     def __init__(self, username):
         self.username = username
-        self.undelivered_msgs = []
\ No newline at end of file
+        self.undelivered_msgs = deque()  # (sequence number, message), oldest first
+        self.next_seq = 1
+        self.groups = set()
+
+    def add_msg(self, msg):
+        self.undelivered_msgs.append((self.next_seq, msg))
+        self.next_seq += 1
\ No newline at end of file
@@ -1,91 +1,402 @@
+import itertools
+import json
+import queue
 import socket
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 from operations import Operations
-from serialize import serialize, deserialize
+from serialize import (COMPRESSION_LEVELS, COMPRESSION_THRESHOLD, FLAG_MORE, FLAG_PARTIAL, Compression,
+                       FrameDecoder, decode_list, serialize)
 
-HEADER = 512
+RECV_SIZE = 4096
 PORT = 5050
 FORMAT = 'utf-8'
-DISCONNECT_MESSAGE = "!DISCONNECT"
 SERVER = "10.250.35.25"
 ADDR = (SERVER, PORT)
-VERSION = "1"
-
-# client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-# client.connect(ADDR)
-
-def send(msg):
-    message = msg.encode(FORMAT)
-    msg_length = len(message)
-    send_length = str(msg_length).encode(FORMAT)
-    send_length += b' ' * (HEADER - len(send_length))
-    client.send(send_length)
-    client.send(message)
-    return client.recv(1024).decode(FORMAT)
-
-def login(username):
-    data = {"operation": Operations.LOGIN, "info": username}
-    new_data = serialize(data)
-    received_info = send(new_data)
-    status = deserialize(received_info)["operation"]
-    if status == "00":
-        return 0
-    print("Account information does not exist")
-    return 1
-
-def create_account(username):
-    data = {"operation": Operations.CREATE_ACCOUNT, "info": username}
-    new_data = serialize(data)
-    received_info = send(new_data)
-    status = deserialize(received_info)["operation"]
-    if status == "00":
-        return 0
-    print("Account information already exists")
-    return 1
-
-def delete_account(username):
-    data = {"operation": Operations.DELETE_ACCOUNT, "info": username}
-    new_data = serialize(data)
-    # received_info = send(new_data)
-    received_info = b'100Operation Successful'
-    status = deserialize(received_info)["operation"]
-    if status == "00":
-        return 0
-    print("Deletion Unsuccessful")
-    return 1
-
-def list_accounts():
-    data = {"operation": Operations.LIST_ACCOUNT, "info": ""}
-    new_data = serialize(data)
-    received_info = send(new_data)
-    status = deserialize(received_info)["operation"]
-    if status == "03":
-        return deserialize(received_info)["info"]
-    print("Account information does not exist")
-    return 1
-
-def send_message(msg, sender, receiver):
-    total_info = sender + "\n" + receiver + "\n" + msg
-    data = {"operation": Operations.SEND_MESSAGE, "info": total_info}
-    new_data = serialize(data)
-    received_info = send(new_data)
-    status = deserialize(received_info)["operation"]
-    if status == "00":
-        return 0
-    print("Message send failure")
-    return 1
-
-def view_msgs(username):
-    data = {"operation": Operations.VIEW_UNDELIVERED_MESSAGES, "info": username}
-    new_data = serialize(data)
-    received_info = send(new_data)
-    status = deserialize(received_info)["operation"]
-    if status == "04":
-        return deserialize(received_info)["info"]
-    print("Cannot retrieve messages")
-    return 1
-
-# send("Hello World!")
-x = serialize({"operation": Operations.CREATE_ACCOUNT, "info": "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla pariatur. Excepteur sint occaecat cupidatat non proident, sunt in culpa qui officia deserunt mollit anim id est laborum."})
-# print(deserialize(x))
-print(delete_account("jothi"))
+POOL_SIZE = 4
+MAX_REQUEST_ID = 0xFFFFFFFF
+
+
+class Connection:
+    """
+    A persistent connection to the server. Requests are tagged with an id and
+    written without waiting for earlier responses; a background reader thread
+    matches each response to its request by id and hands frames the server
+    pushed on its own (request id 0) to `on_push`. A response streamed as
+    several frames resolves once its last frame arrives, with all of its
+    frames under "frames".
+
+    If `compression` is given as a list of algorithms, best first, the
+    connection starts with a HELLO and compresses requests of at least
+    `threshold` bytes with whatever the server agrees to.
+    """
+
+    def __init__(self, addr, on_push=None, compression=None, threshold=COMPRESSION_THRESHOLD):
+        self.sock = socket.create_connection(addr)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.decoder = FrameDecoder()
+        self.pending = {}
+        self.partial = {}
+        self.request_ids = itertools.count()
+        self.lock = threading.Lock()  # guards pending and closed
+        self.send_lock = threading.Lock()
+        self.closed = False
+        self.on_push = on_push
+        self.compression = None
+        self.reader = threading.Thread(target=self._read_responses, daemon=True)
+        self.reader.start()
+        if compression:
+            self._negotiate(compression, threshold)
+
+    def _negotiate(self, algorithms, threshold):
+        response = self.request({"operation": Operations.HELLO,
+                                 "info": ",".join(algorithms) + "\n" + str(threshold)})
+        algorithm, _, threshold = response["info"].decode(FORMAT).partition("\n")
+        if response["operation"] == Operations.SUCCESS and algorithm in COMPRESSION_LEVELS:
+            self.compression = Compression(algorithm, int(threshold))
+
+    def submit(self, requests):
+        """
+        Writes a batch of requests in a single sendall().
+
+        Args:
+            requests (list): dicts of the form {"operation": Operations, "info": str or bytes}.
+
+        Returns:
+            list: one Future per request, resolved with the response frame.
+        """
+        futures = []
+        # send_lock puts batches on the wire in the order their ids were
+        # registered. The reader only needs `lock`, which is released before
+        # writing, so it keeps taking responses off the socket while a batch
+        # too large for the socket buffers is still being sent.
+        with self.send_lock:
+            with self.lock:
+                if self.closed:
+                    raise ConnectionError("Connection is closed")
+                request_ids = []
+                for data in requests:
+                    request_id = next(self.request_ids) % MAX_REQUEST_ID + 1
+                    future = Future()
+                    self.pending[request_id] = future
+                    futures.append(future)
+                    request_ids.append(request_id)
+            frames = [serialize(data, request_id=request_id, compression=self.compression)
+                      for data, request_id in zip(requests, request_ids)]
+            self.sock.sendall(b"".join(frames))
+        return futures
+
+    def request(self, data):
+        return self.submit([data])[0].result()
+
+    def _read_responses(self):
+        try:
+            while True:
+                data = self.sock.recv(RECV_SIZE)
+                if not data:
+                    break
+                for response in self.decoder.feed(data):
+                    if response["request_id"] == 0:
+                        if self.on_push is not None:
+                            self.on_push(response)
+                        continue
+                    if response["flags"] & FLAG_MORE:
+                        self.partial.setdefault(response["request_id"], []).append(response)
+                        continue
+                    frames = self.partial.pop(response["request_id"], None)
+                    if frames is not None:
+                        frames.append(response)
+                        response["frames"] = frames
+                    with self.lock:
+                        future = self.pending.pop(response["request_id"], None)
+                    if future is not None:
+                        future.set_result(response)
+        except OSError:
+            pass
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("Server closed the connection"))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ConnectionPool:
+    """
+    A fixed-size pool of persistent connections. Connections are opened
+    lazily, handed out one caller at a time and reused afterwards.
+    """
+
+    def __init__(self, addr, size=POOL_SIZE, on_push=None, compression=None, threshold=COMPRESSION_THRESHOLD):
+        self.addr = addr
+        self.size = size
+        self.on_push = on_push
+        self.compression = compression
+        self.threshold = threshold
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.closed:
+                with self.lock:
+                    self.opened -= 1
+            else:
+                self.idle.put(conn)
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return Connection(self.addr, self.on_push, self.compression, self.threshold)
+                except OSError:
+                    self.opened -= 1
+                    raise
+        return self.idle.get()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class ChatClient:
+    """
+    Client API for the chat server. Each call borrows a connection from the
+    pool, so one ChatClient can be shared between threads. Once logged in,
+    messages for the user are pushed by the server and passed to
+    `on_message(sender, msg)`, and group messages to
+    `on_group_message(group, sender, msg)`, from the connection's reader thread.
+
+    Pass `compression`, e.g. ["zlib-fast", "zlib"], to compress payloads of
+    at least `compression_threshold` bytes in both directions.
+    """
+
+    def __init__(self, addr=ADDR, pool_size=POOL_SIZE, on_message=None, on_group_message=None,
+                 compression=None, compression_threshold=COMPRESSION_THRESHOLD):
+        self.on_message = on_message
+        self.on_group_message = on_group_message
+        self.pool = ConnectionPool(addr, pool_size, self._handle_push, compression, compression_threshold)
+
+    def request(self, operation, info=""):
+        with self.pool.connection() as conn:
+            return conn.request({"operation": operation, "info": info})
+
+    def pipeline(self, requests):
+        """
+        Sends many requests on one connection in a single write and waits for all responses.
+
+        Args:
+            requests (list): (operation, info) pairs.
+
+        Returns:
+            list: response frames, in request order.
+        """
+        with self.pool.connection() as conn:
+            futures = conn.submit([{"operation": operation, "info": info} for operation, info in requests])
+            return [future.result() for future in futures]
+
+    def close(self):
+        self.pool.close()
+
+    def _handle_push(self, frame):
+        if frame["operation"] == Operations.DELIVER_MESSAGE and self.on_message is not None:
+            sender, msg = frame["info"].decode(FORMAT).split("\n", 1)
+            self.on_message(sender, msg)
+        elif frame["operation"] == Operations.DELIVER_GROUP_MESSAGE and self.on_group_message is not None:
+            group, sender, msg = frame["info"].decode(FORMAT).split("\n", 2)
+            self.on_group_message(group, sender, msg)
+
+    def stats(self):
+        """
+        Returns the server's metrics report (see server.stats()).
+        """
+        response = self.request(Operations.STATS)
+        if response["operation"] == Operations.STATS_REPORT:
+            return json.loads(response["info"])
+        print("Cannot retrieve stats")
+        return 1
+
+    def login(self, username):
+        status = self.request(Operations.LOGIN, username)["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Account information does not exist")
+        return 1
+
+    def create_account(self, username):
+        status = self.request(Operations.CREATE_ACCOUNT, username)["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Account information already exists")
+        return 1
+
+    def delete_account(self, username):
+        status = self.request(Operations.DELETE_ACCOUNT, username)["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Deletion Unsuccessful")
+        return 1
+
+    def list_accounts(self, pattern="*"):
+        """
+        Returns every account name matching `pattern`, fetching it page by page.
+        """
+        names = []
+        cursor = ""
+        while True:
+            page = self.list_accounts_page(pattern, cursor)
+            if page == 1:
+                return 1
+            page_names, cursor = page
+            names.extend(page_names)
+            if cursor is None:
+                return names
+
+    def list_accounts_page(self, pattern="*", cursor="", limit=None):
+        """
+        Fetches one page of account names matching a shell-style pattern.
+
+        Args:
+            pattern (str): e.g. "jo*"; a pattern without wildcards matches as a prefix.
+            cursor (str): the cursor returned with the previous page, or "" for the first page.
+            limit (int): page size; the server's default and maximum apply when omitted.
+
+        Returns:
+            tuple: (names, next_cursor), with next_cursor None on the last page.
+        """
+        info = "\n".join([pattern, cursor, str(limit) if limit else ""])
+        response = self.request(Operations.LIST_ACCOUNT, info)
+        if response["operation"] != Operations.LIST_OF_ACCOUNTS:
+            print("Account information does not exist")
+            return 1
+        names = []
+        for frame in response.get("frames", [response]):
+            names.extend(decode_list(frame["info"]))
+        if response["flags"] & FLAG_PARTIAL and names:
+            return names, names[-1]
+        return names, None
+
+    def send_message(self, msg, sender, receiver):
+        return self.send_messages([(msg, sender, receiver)])[0]
+
+    def send_messages(self, messages):
+        """
+        Sends a batch of messages, pipelined on one connection and flushed in one write.
+
+        Args:
+            messages (list): (msg, sender, receiver) tuples.
+
+        Returns:
+            list: 0 for each message that was accepted, 1 for each failure.
+        """
+        requests = [(Operations.SEND_MESSAGE, sender + "\n" + receiver + "\n" + msg)
+                    for msg, sender, receiver in messages]
+        statuses = []
+        for response in self.pipeline(requests):
+            if response["operation"] == Operations.SUCCESS:
+                statuses.append(0)
+            else:
+                print("Message send failure")
+                statuses.append(1)
+        return statuses
+
+    def create_group(self, group, members=()):
+        status = self.request(Operations.CREATE_GROUP, "\n".join([group] + list(members)))["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Group creation unsuccessful")
+        return 1
+
+    def join_group(self, group, username):
+        status = self.request(Operations.JOIN_GROUP, group + "\n" + username)["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Group or account does not exist")
+        return 1
+
+    def leave_group(self, group, username):
+        status = self.request(Operations.LEAVE_GROUP, group + "\n" + username)["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Group does not exist")
+        return 1
+
+    def send_group_message(self, msg, sender, group):
+        """
+        Sends one message to every other member of `group`, which `sender` must belong to.
+
+        Returns:
+            int: the number of members it was pushed to or queued for, or -1 on failure.
+        """
+        response = self.request(Operations.SEND_GROUP_MESSAGE, sender + "\n" + group + "\n" + msg)
+        if response["operation"] == Operations.SUCCESS:
+            return int(response["info"])
+        print("Message send failure")
+        return -1
+
+    def view_msgs(self, username):
+        """
+        Retrieves every undelivered message, batch by batch, acknowledging each batch once received.
+        """
+        messages = []
+        while True:
+            batch = self.fetch_msgs(username)
+            if batch == 1:
+                return 1
+            batch_msgs, token = batch
+            if not batch_msgs:
+                return messages
+            messages.extend(batch_msgs)
+            if self.ack_msgs(username, token):
+                return messages
+
+    def fetch_msgs(self, username, max_count=None, max_bytes=None):
+        """
+        Fetches the oldest batch of undelivered messages without removing them from the server.
+
+        Returns:
+            tuple: (messages, token); pass the token to ack_msgs() once the batch is handled.
+            The messages are an EncodedList, decoded as they are accessed.
+        """
+        info = "\n".join([username, str(max_count or ""), str(max_bytes or "")])
+        response = self.request(Operations.VIEW_UNDELIVERED_MESSAGES, info)
+        if response["operation"] == Operations.LIST_OF_MESSAGES:
+            batch = decode_list(response["info"])
+            return batch[1:], batch[0]
+        print("Cannot retrieve messages")
+        return 1
+
+    def ack_msgs(self, username, token):
+        status = self.request(Operations.ACK_MESSAGES, username + "\n" + token)["operation"]
+        if status == Operations.SUCCESS:
+            return 0
+        print("Acknowledgement failed")
+        return 1
+
+if __name__ == "__main__":
+    client = ChatClient(ADDR)
+    print(client.delete_account("jothi"))
+    client.close()
@@ -0,0 +1,169 @@
+import threading
+
+# Latencies are recorded in microseconds into log-linear buckets: values are
+# grouped by power of two and each power of two is split into SUB_BUCKETS
+# equal parts, which keeps the relative error under 1 / SUB_BUCKETS.
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return ((shift + 1) << SUB_BITS) + ((value >> shift) & (SUB_BUCKETS - 1))
+
+
+def bucket_value(index):
+    """
+    Returns the upper bound of the values counted in bucket `index`.
+    """
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BITS) - 1
+    return (((index & (SUB_BUCKETS - 1)) | SUB_BUCKETS) + 1 << shift) - 1
+
+
+class Histogram:
+    """
+    HDR-style latency histogram. Buckets grow on demand, so recording is an
+    index computation and a list increment.
+    """
+
+    def __init__(self):
+        self.counts = []
+        self.total = 0
+        self.sum = 0
+
+    def record(self, micros):
+        index = bucket_index(micros)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.total += 1
+        self.sum += micros
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+
+    def percentile(self, p):
+        if not self.total:
+            return 0
+        target = p / 100 * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return bucket_value(index)
+        return bucket_value(len(self.counts) - 1)
+
+    def summary(self):
+        summary = {"count": self.total, "mean_us": self.sum / self.total if self.total else 0}
+        for p in PERCENTILES:
+            summary["p{:g}_us".format(p)] = self.percentile(p)
+        summary["max_us"] = bucket_value(max((i for i, c in enumerate(self.counts) if c), default=0))
+        return summary
+
+
+class Shard:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class Metrics:
+    """
+    Process-wide counters and per-operation latency histograms.
+
+    Every thread updates its own shard, so the hot path takes no lock and
+    threads never write to shared state; snapshot() merges the shards when
+    the numbers are asked for. Gauges are callables evaluated at snapshot
+    time for values that already live elsewhere, such as queue depths.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.register_lock = threading.Lock()
+        self.retired = Shard()
+        self.gauges = {}
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = Shard()
+            with self.register_lock:
+                self.shards.append(shard)
+            return shard
+
+    def incr(self, name, amount=1):
+        counters = self._shard().counters
+        counters[name] = counters.get(name, 0) + amount
+
+    def observe(self, operation, seconds, bytes_in, bytes_out):
+        """
+        Records one handled request under the operation's name: its latency,
+        the size of its payload and the size of the response frames.
+        """
+        shard = self._shard()
+        histogram = shard.histograms.get(operation)
+        if histogram is None:
+            histogram = shard.histograms[operation] = Histogram()
+        histogram.record(int(seconds * 1000000))
+        counters = shard.counters
+        counters["requests"] = counters.get("requests", 0) + 1
+        counters["request_payload_bytes"] = counters.get("request_payload_bytes", 0) + bytes_in
+        counters["response_bytes"] = counters.get("response_bytes", 0) + bytes_out
+
+    def retire(self):
+        """
+        Folds the calling thread's shard into a shared one. Connection
+        threads call this before exiting so that shards don't pile up.
+        """
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            return
+        del self.local.shard
+        with self.register_lock:
+            self.shards.remove(shard)
+            for name, value in shard.counters.items():
+                self.retired.counters[name] = self.retired.counters.get(name, 0) + value
+            for operation, histogram in shard.histograms.items():
+                self.retired.histograms.setdefault(operation, Histogram()).merge(histogram)
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {"counters": {...}, "gauges": {...}, "latency": {operation: summary}}.
+        """
+        counters = {}
+        histograms = {}
+        with self.register_lock:
+            shards = list(self.shards)
+            counters.update(self.retired.counters)
+            for operation, histogram in self.retired.histograms.items():
+                histograms.setdefault(operation, Histogram()).merge(histogram)
+        for shard in shards:
+            for name, value in list(shard.counters.items()):
+                counters[name] = counters.get(name, 0) + value
+            for operation, histogram in list(shard.histograms.items()):
+                histograms.setdefault(operation, Histogram()).merge(histogram)
+        return {
+            "counters": counters,
+            "gauges": {name: function() for name, function in self.gauges.items()},
+            "latency": {operation: histogram.summary() for operation, histogram in histograms.items()},
+        }
+
+
+METRICS = Metrics()
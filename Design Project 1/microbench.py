@@ -0,0 +1,172 @@
+"""
+Microbenchmarks for the chat server's building blocks.
+
+Usage: python microbench.py {compression,encoding,registry,all}
+"""
+import argparse
+import pickle
+import threading
+import time
+
+from operations import Operations
+from registry import UserRegistry
+from serialize import COMPRESSION_LEVELS, Compression, FrameDecoder, decode_list, encode_list, serialize
+
+
+class CountingLock:
+    """
+    A lock that counts how many acquisitions found it already held.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.contended = 0
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            self.lock.acquire()
+            self.contended += 1
+        self.acquired += 1
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def bench_registry(thread_counts=(1, 4, 16), shard_counts=(1, 16), ops_per_thread=50000,
+                   journal_seconds=0.00002, journal_ops_per_thread=2000):
+    """
+    Measures what lock striping changes as handler threads are added. Each
+    thread owns a set of users and runs a create / send / view mix against
+    them. A single shard is the same as one global lock around the old USERS
+    dict. "contended" is the share of lock acquisitions that had to wait.
+
+    With the registry in memory, the GIL lets only one thread run Python
+    at a time, so wall-clock throughput is not expected to grow with threads
+    or shards, and a thread rarely loses the GIL while it holds a lock.
+    The "blocking" workload gives the registry a journal that sleeps for
+    `journal_seconds` with the GIL released, as a journal that wrote
+    synchronously would, while the shard lock is held. There one lock
+    serializes the threads, and striping lets throughput scale.
+    """
+    print("{:>9} {:>7} {:>8} {:>14} {:>10}".format("journal", "shards", "threads", "ops/sec", "contended"))
+    workloads = (("memory", None, ops_per_thread),
+                 ("blocking", lambda *fields: time.sleep(journal_seconds), journal_ops_per_thread))
+    for journal_name, journal, ops in workloads:
+        for shards in shard_counts:
+            for threads in thread_counts:
+                registry = UserRegistry(shards, journal=journal)
+                for shard in registry.shards:
+                    shard.lock = CountingLock()
+                barrier = threading.Barrier(threads + 1)
+
+                def worker(index):
+                    names = ["user-{}-{}".format(index, i) for i in range(64)]
+                    for name in names:
+                        registry.create(name)
+                    barrier.wait()
+                    for i in range(ops):
+                        name = names[i % len(names)]
+                        if i % 8 == 7:
+                            messages, token = registry.peek(name, 100, 64 * 1024)
+                            registry.ack(name, token)
+                        else:
+                            registry.enqueue(name, "hello", names[0])
+
+                workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+                for thread in workers:
+                    thread.start()
+                barrier.wait()
+                start = time.perf_counter()
+                for thread in workers:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                acquired = sum(shard.lock.acquired for shard in registry.shards)
+                contended = sum(shard.lock.contended for shard in registry.shards)
+                print("{:>9} {:>7} {:>8} {:>14,.0f} {:>10.2%}".format(
+                    journal_name, shards, threads, threads * ops / elapsed, contended / acquired))
+
+
+def _best_of(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_encoding(sizes=(100, 10000, 100000)):
+    """
+    Compares pickle with the list encoding used for LIST_OF_ACCOUNTS and
+    LIST_OF_MESSAGES bodies: encode time, time to open the result and read
+    one item, time to decode every item, and encoded size.
+    """
+    print("{:>8} {:>7} {:>6} {:>11} {:>11} {:>11} {:>11}".format(
+        "items", "kind", "codec", "encode ms", "open+1 ms", "all ms", "bytes"))
+    for size in sizes:
+        for kind, items in (("names", ["user{:07d}".format(i) for i in range(size)]),
+                            ("msgs", ["message number {} ".format(i) * 5 for i in range(size)])):
+            pickled = pickle.dumps(items)
+            encoded = encode_list(items)
+            rows = (
+                ("pickle", pickled,
+                 lambda: pickle.dumps(items), lambda: pickle.loads(pickled)[size // 2],
+                 lambda: pickle.loads(pickled)),
+                ("list", encoded,
+                 lambda: encode_list(items), lambda: decode_list(encoded)[size // 2],
+                 lambda: list(decode_list(encoded))),
+            )
+            for codec, data, encode, open_one, decode_all in rows:
+                print("{:>8} {:>7} {:>6} {:>11.3f} {:>11.3f} {:>11.3f} {:>11,}".format(
+                    size, kind, codec, _best_of(encode) * 1000, _best_of(open_one) * 1000,
+                    _best_of(decode_all) * 1000, len(data)))
+
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut "
+         "aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum "
+         "dolore eu fugiat nulla pariatur. Excepteur sint occaecat cupidatat non proident, sunt in culpa qui "
+         "officia deserunt mollit anim id est laborum.")
+
+
+def bench_compression(repeat=200):
+    """
+    CPU cost against bytes saved for each compression algorithm, on the
+    payloads that are typically large enough to cross the threshold: one
+    long message, a page of account names and a batch of messages.
+    """
+    payloads = (
+        ("lorem msg", LOREM),
+        ("4 KB msg", (LOREM + " ") * 9),
+        ("1000 names", encode_list(["user{:07d}".format(i) for i in range(1000)])),
+        ("64 KB batch", encode_list(["message number {} from user{:04d}".format(i, i % 97) for i in range(1800)])),
+    )
+    print("{:>12} {:>10} {:>9} {:>7} {:>12} {:>12} {:>10}".format(
+        "payload", "codec", "bytes", "saved", "encode us", "decode us", "MB/s"))
+    for name, info in payloads:
+        data = {"operation": Operations.SEND_MESSAGE, "info": info}
+        for algorithm in [None] + list(COMPRESSION_LEVELS):
+            compression = Compression(algorithm, 0) if algorithm else None
+            frame = serialize(data, compression=compression)
+            plain = len(serialize(data))
+            encode = _best_of(lambda: [serialize(data, compression=compression) for _ in range(repeat)]) / repeat
+            decode = _best_of(lambda: [FrameDecoder().feed(frame) for _ in range(repeat)]) / repeat
+            print("{:>12} {:>10} {:>9,} {:>6.0%} {:>12.1f} {:>12.1f} {:>10.0f}".format(
+                name, algorithm or "none", len(frame), 1 - len(frame) / plain, encode * 1e6, decode * 1e6,
+                plain / encode / 1e6))
+
+
+BENCHMARKS = {
+    "compression": bench_compression,
+    "encoding": bench_encoding,
+    "registry": bench_registry,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    args = parser.parse_args()
+    for name in sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]:
+        print("== {}".format(name))
+        BENCHMARKS[name]()
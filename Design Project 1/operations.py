@@ -2,12 +2,19 @@ from enum import Enum
 
 
 class Operations(Enum):
+    # Values are the opcodes as two hex digits: server statuses are 0x, client requests 1x and up.
     # SERVER SIDE OPERATIONS (sent to client)
     SUCCESS = "00"
     ACCOUNT_ALREADY_EXISTS = "01"
     ACCOUNT_DOES_NOT_EXIST = "02"
     LIST_OF_ACCOUNTS = "03"
     LIST_OF_MESSAGES = "04"
+    DELIVER_MESSAGE = "05"  # pushed to logged-in recipients, request id 0
+    INBOX_FULL = "06"
+    STATS_REPORT = "07"
+    DELIVER_GROUP_MESSAGE = "08"  # pushed to logged-in group members, request id 0
+    GROUP_DOES_NOT_EXIST = "09"
+    INVALID_REQUEST = "0A"  # answers a request with an unknown opcode or a malformed payload
 
     # CLIENT SIDE OPERATIONS (sent to server)
     LOGIN = "10"
@@ -16,3 +23,10 @@ class Operations(Enum):
     LIST_ACCOUNT = "13"
     SEND_MESSAGE = "14"
     VIEW_UNDELIVERED_MESSAGES = "15"
+    ACK_MESSAGES = "16"
+    STATS = "17"  # admin: server metrics as JSON
+    CREATE_GROUP = "18"
+    JOIN_GROUP = "19"
+    LEAVE_GROUP = "20"
+    SEND_GROUP_MESSAGE = "21"
+    HELLO = "22"  # negotiates compression for the connection
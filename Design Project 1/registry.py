@@ -0,0 +1,392 @@
+import bisect
+import contextlib
+import fnmatch
+import os
+import threading
+import zlib
+
+from classes import user
+from storage import CREATE, DELETE, DELIVER, GROUP_CREATE, GROUP_JOIN, GROUP_LEAVE, GROUP_SEND, SEND
+
+SHARDS = 16
+WILDCARDS = "*?["
+
+# What enqueue() does when a user already has INBOX_CAP undelivered messages.
+DROP_OLDEST = "drop-oldest"
+REJECT = "reject"
+OVERFLOW_POLICIES = (DROP_OLDEST, REJECT)
+INBOX_CAP = 10000
+
+
+class Shard:
+    def __init__(self):
+        self.users = {}
+        self.undelivered = 0
+        self.lock = threading.Lock()
+
+
+class UserRegistry:
+    """
+    Concurrent registry of accounts and their undelivered messages.
+
+    Accounts are spread over independently locked shards by a hash of the
+    username, so handlers working on different users rarely contend. Each
+    change is passed to `journal(event, *fields)` (the write-ahead log) while
+    its shard lock is held, so the log sees a user's changes in the same
+    order they were applied.
+
+    A sorted index of all usernames is kept alongside the shards so that
+    prefix and wildcard searches only visit the matching range.
+
+    Each inbox holds at most `inbox_cap` messages; `overflow` decides whether
+    a new message evicts the oldest one or is rejected. Messages are read in
+    bounded batches with peek() and only removed once ack() confirms them.
+
+    Groups map a name to a set of members. A message sent to a group is
+    stored once: every member's inbox holds a reference to the same string,
+    and the log records it once with the list of receivers.
+
+    Locks are always taken in the order shard locks (by shard index), then
+    groups_lock, then index_lock.
+    """
+
+    def __init__(self, shards=SHARDS, journal=None, inbox_cap=INBOX_CAP, overflow=DROP_OLDEST):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {}".format(overflow))
+        self.shards = [Shard() for _ in range(shards)]
+        self.journal = journal
+        self.inbox_cap = inbox_cap
+        self.overflow = overflow
+        # Ack tokens carry this epoch so that a token handed out before a
+        # restart, when sequence numbers restart from 1, is ignored.
+        self.epoch = os.urandom(4).hex()
+        self.index = []
+        self.index_lock = threading.Lock()
+        self.groups = {}
+        self.groups_lock = threading.Lock()
+
+    def _shard_index(self, username):
+        return zlib.crc32(username.encode()) % len(self.shards)
+
+    def _shard(self, username):
+        return self.shards[self._shard_index(username)]
+
+    def _log(self, event, *fields):
+        if self.journal is not None:
+            self.journal(event, *fields)
+
+    def __contains__(self, username):
+        return username in self._shard(username).users
+
+    def __len__(self):
+        return sum(len(shard.users) for shard in self.shards)
+
+    def undelivered_count(self):
+        return sum(shard.undelivered for shard in self.shards)
+
+    def usernames(self):
+        with self.index_lock:
+            return list(self.index)
+
+    def search(self, pattern="*", cursor="", limit=None):
+        """
+        Returns one page of usernames matching a shell-style pattern, in sorted order.
+
+        The literal prefix of `pattern` (everything before its first
+        wildcard) selects a range of the sorted index by binary search, and
+        only that range is scanned, starting after `cursor`.
+
+        Args:
+            pattern (str): fnmatch-style pattern, e.g. "jo*" or "user-?"; a pattern
+                without wildcards matches as a prefix. Defaults to "*".
+            cursor (str): the last username of the previous page, or "" for the first page.
+            limit (int): maximum number of usernames to return, at least 1. Defaults to no limit.
+
+        Returns:
+            tuple: (usernames, next_cursor); next_cursor is "" when there are no further matches.
+
+        Raises:
+            ValueError: if `limit` is less than 1, which would leave no name to resume after.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1, got {}".format(limit))
+        pattern = pattern or "*"
+        split = min((pattern.find(c) for c in WILDCARDS if c in pattern), default=len(pattern))
+        prefix, wildcard = pattern[:split], split < len(pattern)
+        matches = []
+        with self.index_lock:
+            position = bisect.bisect_left(self.index, prefix)
+            if cursor:
+                position = max(position, bisect.bisect_right(self.index, cursor))
+            while position < len(self.index):
+                name = self.index[position]
+                position += 1
+                if not name.startswith(prefix):
+                    break
+                if wildcard and not fnmatch.fnmatchcase(name, pattern):
+                    continue
+                if limit is not None and len(matches) == limit:
+                    return matches, matches[-1]
+                matches.append(name)
+        return matches, ""
+
+    def load(self, state, groups=None):
+        """
+        Replaces the registry's contents with `state`, a dict of username ->
+        list of messages, and `groups`, a dict of group -> set of members.
+        Equal message texts are loaded as one shared string.
+        """
+        for shard in self.shards:
+            with shard.lock:
+                shard.users.clear()
+                shard.undelivered = 0
+        with self.index_lock:
+            self.index = sorted(state)
+        bodies = {}
+        for username, messages in state.items():
+            shard = self._shard(username)
+            with shard.lock:
+                account = shard.users[username] = user(username)
+                for msg in messages:
+                    account.add_msg(bodies.setdefault(msg, msg))
+                shard.undelivered += len(messages)
+        with self.groups_lock:
+            self.groups = {}
+            for group, members in (groups or {}).items():
+                members = self.groups[group] = {name for name in members if name in self}
+                for name in members:
+                    self._shard(name).users[name].groups.add(group)
+
+    def create(self, username):
+        """
+        Returns:
+            bool: False if the account already exists.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            if username in shard.users:
+                return False
+            shard.users[username] = user(username)
+            self._log(CREATE, username)
+            with self.index_lock:
+                bisect.insort(self.index, username)
+            return True
+
+    def delete(self, username):
+        """
+        Returns:
+            bool: False if the account does not exist.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.pop(username, None)
+            if account is None:
+                return False
+            shard.undelivered -= len(account.undelivered_msgs)
+            self._log(DELETE, username)
+            with self.groups_lock:
+                for group in account.groups:
+                    self.groups[group].discard(username)
+            with self.index_lock:
+                position = bisect.bisect_left(self.index, username)
+                if position < len(self.index) and self.index[position] == username:
+                    del self.index[position]
+            return True
+
+    def enqueue(self, username, msg, sender):
+        """
+        Appends `msg` to the user's undelivered messages, applying the overflow policy when the inbox is full.
+
+        Returns:
+            int: the message's sequence number in the inbox, which starts at 1;
+            0 if the account does not exist or the message was rejected.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.get(username)
+            if account is None:
+                return False
+            inbox = account.undelivered_msgs
+            if len(inbox) >= self.inbox_cap:
+                if self.overflow == REJECT:
+                    return False
+                inbox.popleft()
+                shard.undelivered -= 1
+                self._log(DELIVER, username, "1")
+            seq = account.next_seq
+            account.add_msg(msg)
+            shard.undelivered += 1
+            self._log(SEND, username, sender, msg)
+            return seq
+
+    def retract(self, username, seq):
+        """
+        Removes the undelivered message numbered `seq` if it is still queued.
+        Worker processes queue a message before pushing it and retract it
+        once a push is accepted. They keep no log, so this is not journaled.
+
+        Returns:
+            bool: True if the message was removed.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.get(username)
+            if account is None:
+                return False
+            for entry in account.undelivered_msgs:
+                if entry[0] == seq:
+                    account.undelivered_msgs.remove(entry)
+                    shard.undelivered -= 1
+                    return True
+                if entry[0] > seq:
+                    break
+            return False
+
+    def enqueue_many(self, usernames, msg, sender):
+        """
+        Appends the same `msg` object to several inboxes. The shards involved
+        are locked together, once each, and the delivery is logged as a
+        single record.
+
+        Returns:
+            list: the usernames whose inbox received the message.
+        """
+        by_shard = {}
+        for username in usernames:
+            by_shard.setdefault(self._shard_index(username), []).append(username)
+        received = []
+        with contextlib.ExitStack() as stack:
+            for index in sorted(by_shard):
+                stack.enter_context(self.shards[index].lock)
+            for index in sorted(by_shard):
+                shard = self.shards[index]
+                for username in by_shard[index]:
+                    account = shard.users.get(username)
+                    if account is None:
+                        continue
+                    inbox = account.undelivered_msgs
+                    if len(inbox) >= self.inbox_cap:
+                        if self.overflow == REJECT:
+                            continue
+                        inbox.popleft()
+                        shard.undelivered -= 1
+                        self._log(DELIVER, username, "1")
+                    account.add_msg(msg)
+                    shard.undelivered += 1
+                    received.append(username)
+            if received:
+                self._log(GROUP_SEND, sender, msg, *received)
+        return received
+
+    def members(self, group):
+        """
+        Returns:
+            list: the group's members, or None if the group does not exist.
+        """
+        with self.groups_lock:
+            members = self.groups.get(group)
+            return None if members is None else list(members)
+
+    def create_group(self, group):
+        """
+        Returns:
+            bool: False if the group already exists.
+        """
+        with self.groups_lock:
+            if group in self.groups:
+                return False
+            self.groups[group] = set()
+            self._log(GROUP_CREATE, group)
+            return True
+
+    def join_group(self, group, username):
+        """
+        Returns:
+            bool: False if the group or the account does not exist.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.get(username)
+            if account is None:
+                return False
+            with self.groups_lock:
+                members = self.groups.get(group)
+                if members is None:
+                    return False
+                if username not in members:
+                    members.add(username)
+                    account.groups.add(group)
+                    self._log(GROUP_JOIN, group, username)
+                return True
+
+    def leave_group(self, group, username):
+        """
+        Returns:
+            bool: False if the group does not exist.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.get(username)
+            with self.groups_lock:
+                members = self.groups.get(group)
+                if members is None:
+                    return False
+                if username in members:
+                    members.discard(username)
+                    if account is not None:
+                        account.groups.discard(group)
+                    self._log(GROUP_LEAVE, group, username)
+                return True
+
+    def peek(self, username, max_count, max_bytes):
+        """
+        Returns the oldest undelivered messages without removing them. The
+        batch holds at most `max_count` messages and stops before exceeding
+        `max_bytes` of UTF-8 encoded message text, but always includes at
+        least one message.
+
+        Returns:
+            tuple: (messages, token), where ack(username, token) removes the
+            batch; None if the account does not exist.
+        """
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.get(username)
+            if account is None:
+                return None
+            messages = []
+            size = 0
+            last = 0
+            for seq, msg in account.undelivered_msgs:
+                size += len(msg.encode())
+                if len(messages) == max_count or (messages and size > max_bytes):
+                    break
+                messages.append(msg)
+                last = seq
+            return messages, "{}:{}".format(self.epoch, last)
+
+    def ack(self, username, token):
+        """
+        Removes every message up to and including the batch identified by `token`.
+
+        Returns:
+            bool: False if the account does not exist or the token is not from this registry.
+        """
+        epoch, _, last = token.partition(":")
+        if epoch != self.epoch or not last.isdigit():
+            return False
+        last = int(last)
+        shard = self._shard(username)
+        with shard.lock:
+            account = shard.users.get(username)
+            if account is None:
+                return False
+            inbox = account.undelivered_msgs
+            count = 0
+            while inbox and inbox[0][0] <= last:
+                inbox.popleft()
+                count += 1
+            if count:
+                shard.undelivered -= count
+                self._log(DELIVER, username, str(count))
+            return True
@@ -1,23 +1,304 @@
-VERSION = "1"
+import itertools
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+
+from operations import Operations
+
+VERSION = 2
 FORMAT = "utf-8"
 
-def serialize(data):
-    data_string = VERSION.encode(FORMAT)
-    data_string += data["operation"].value.encode(FORMAT)
-    # msgsize = str(len(data["info"])).encode(FORMAT)
-    # print(HEADER - len(msgsize))
-    # data_string += msgsize + b' ' * (HEADER - len(msgsize))
-    data_string += data["info"].encode(FORMAT)
-    return data_string
+# Every frame starts with a fixed header: version, opcode, flags, request id
+# and payload length, all in network byte order. The payload follows
+# immediately. Responses carry the id of the request they answer, so several
+# requests can be in flight on one connection; id 0 is never used by clients.
+HEADER = struct.Struct("!BBHII")
+HEADER_SIZE = HEADER.size
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+# Header flags.
+FLAG_MORE = 0x0001  # more frames of the same response follow this one
+FLAG_PARTIAL = 0x0002  # the result is one page; ask again with the returned cursor for the rest
+FLAG_COMPRESSED = 0x0004  # the payload is a zlib stream
+
+# Compression is off until a connection negotiates it with HELLO. The
+# algorithms differ only in the zlib level used to compress, so any
+# compressed frame is decompressed the same way. Payloads shorter than the
+# negotiated threshold are sent as they are, as are payloads that don't shrink.
+COMPRESSION_LEVELS = {"zlib": 6, "zlib-fast": 1}
+COMPRESSION_THRESHOLD = 512
+Compression = namedtuple("Compression", ["algorithm", "threshold"])
+
+OPCODES = {operation: int(operation.value, 16) for operation in Operations}
+OPERATIONS = {code: operation for operation, code in OPCODES.items()}
+
+
+def _payload(info):
+    if isinstance(info, str):
+        return info.encode(FORMAT)
+    return info
+
+
+def _compress(payload, flags, compression):
+    if compression is not None and len(payload) >= compression.threshold:
+        compressed = zlib.compress(payload, COMPRESSION_LEVELS[compression.algorithm])
+        if len(compressed) < len(payload):
+            return compressed, flags | FLAG_COMPRESSED
+    return payload, flags
+
+
+def _decompress(payload):
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, MAX_PAYLOAD)
+    except zlib.error as error:
+        raise ValueError("Corrupt compressed payload: {}".format(error)) from None
+    if decompressor.unconsumed_tail:
+        raise ValueError("Decompressed payload exceeds the maximum frame size")
+    return data
+
+
+def serialize(data, flags=0, request_id=0, compression=None):
+    """
+    Builds a single wire frame for `data`.
+
+    Args:
+        data (dict): {"operation": Operations, "info": str or bytes-like}.
+        flags (int): 16-bit flag field carried in the header. Defaults to 0.
+        request_id (int): id that the response to this frame will echo. Defaults to 0.
+        compression (Compression): the connection's negotiated compression, if any.
+
+    Returns:
+        bytearray: the header followed by the payload, ready for sendall().
+    """
+    payload, flags = _compress(_payload(data.get("info", b"")), flags, compression)
+    length = len(payload)
+    if length > MAX_PAYLOAD:
+        raise ValueError("Payload of {} bytes exceeds the maximum frame size".format(length))
+    frame = bytearray(HEADER_SIZE + length)
+    HEADER.pack_into(frame, 0, VERSION, OPCODES[data["operation"]], flags, request_id, length)
+    frame[HEADER_SIZE:] = payload
+    return frame
+
+
+def compress_frame(frame, compression):
+    """
+    Returns `frame` with its payload compressed for a connection that
+    negotiated `compression`, or `frame` itself if it stays as it is. Used
+    for pushes, which are built once for every session that receives them.
+    """
+    if compression is None or len(frame) - HEADER_SIZE < compression.threshold:
+        return frame
+    version, opcode, flags, request_id, length = HEADER.unpack_from(frame)
+    if flags & FLAG_COMPRESSED:
+        return frame
+    payload, flags = _compress(bytes(memoryview(frame)[HEADER_SIZE:]), flags, compression)
+    if not flags & FLAG_COMPRESSED:
+        return frame
+    return HEADER.pack(version, opcode, flags, request_id, len(payload)) + payload
+
+
+def _decode_header(version, opcode, length):
+    if version != VERSION:
+        raise ValueError("Wire Protocols do not match up")
+    if length > MAX_PAYLOAD:
+        raise ValueError("Payload of {} bytes exceeds the maximum frame size".format(length))
+    return OPERATIONS.get(opcode)
+
 
 def deserialize(data):
-    data = data.decode()
-    decoded_data = {}
-    VERSION_SIZE = data[0]
-    if VERSION_SIZE != VERSION:
-        return "Wire Protocols do not match up"
-    decoded_data["version"] = VERSION_SIZE
-    decoded_data["operation"] = data[1:3]
-    decoded_data["info"] = data[3:]
-
-    return decoded_data
\ No newline at end of file
+    """
+    Decodes one complete frame.
+
+    Args:
+        data (bytes-like): exactly one frame, header included.
+
+    Returns:
+        dict: {"version", "operation", "flags", "request_id", "info"} with info
+        as bytes, decompressed if the frame was compressed.
+    """
+    view = memoryview(data)
+    version, opcode, flags, request_id, length = HEADER.unpack_from(view)
+    operation = _decode_header(version, opcode, length)
+    if operation is None:
+        raise ValueError("Unknown opcode {}".format(opcode))
+    if len(view) != HEADER_SIZE + length:
+        raise ValueError("Frame length does not match its header")
+    info = bytes(view[HEADER_SIZE:])
+    if flags & FLAG_COMPRESSED:
+        info = _decompress(info)
+    return {"version": version, "operation": operation, "flags": flags,
+            "request_id": request_id, "info": info}
+
+
+class FrameDecoder:
+    """
+    Incremental decoder that turns a byte stream into frames. Bytes are fed in
+    as they arrive from recv() and every complete frame in the buffer is
+    returned, so several frames can come out of a single read and a frame may
+    be split across many reads.
+
+    A frame with an unknown opcode or a corrupt compressed payload is still
+    consumed, and comes out with operation None so that the connection can
+    answer it with an error. A bad version or an oversized length leaves no
+    way to find the next frame, and raises ValueError.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Adds received bytes to the buffer and extracts all complete frames.
+
+        Args:
+            data (bytes-like): bytes read from the socket.
+
+        Returns:
+            list: decoded frames, in arrival order, as returned by deserialize().
+        """
+        self.buffer += data
+        frames = []
+        offset = 0
+        available = len(self.buffer)
+        view = memoryview(self.buffer)
+        try:
+            while available - offset >= HEADER_SIZE:
+                version, opcode, flags, request_id, length = HEADER.unpack_from(view, offset)
+                operation = _decode_header(version, opcode, length)
+                end = offset + HEADER_SIZE + length
+                if end > available:
+                    break
+                info = bytes(view[offset + HEADER_SIZE:end])
+                if flags & FLAG_COMPRESSED:
+                    try:
+                        info = _decompress(info)
+                    except ValueError:
+                        operation, info = None, b""
+                frames.append({"version": version, "operation": operation, "flags": flags,
+                               "request_id": request_id, "info": info})
+                offset = end
+        finally:
+            view.release()
+        if offset:
+            del self.buffer[:offset]
+        return frames
+
+
+# Lists of strings (account names, messages) are encoded as a count, the end
+# offset of every item and then the UTF-8 bodies back to back. Counts and
+# offsets are little-endian 32-bit integers so that on little-endian hosts the
+# offset table can be used in place through memoryview.cast().
+LIST_COUNT = struct.Struct("<I")
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def encode_list(items):
+    """
+    Encodes a list of strings.
+
+    Args:
+        items (list): the strings to encode.
+
+    Returns:
+        bytes: count, offset table and concatenated UTF-8 bodies.
+    """
+    text = "".join(items)
+    body = text.encode(FORMAT)
+    if len(body) == len(text):
+        # ASCII only: character and byte lengths agree, so one encode is enough
+        lengths = map(len, items)
+    else:
+        lengths = (len(item.encode(FORMAT)) for item in items)
+    offsets = array("I", itertools.accumulate(lengths))
+    if not LITTLE_ENDIAN:
+        offsets.byteswap()
+    return b"".join((LIST_COUNT.pack(len(items)), offsets.tobytes(), body))
+
+
+class EncodedList(Sequence):
+    """
+    Read-only, lazily decoded view of a list produced by encode_list(). Only
+    the offset table is looked at up front; each item is decoded when it is
+    accessed, and slicing returns another view over the same buffer.
+    """
+
+    def __init__(self, data, start=0, stop=None):
+        self.view = memoryview(data)
+        if len(self.view) < LIST_COUNT.size:
+            raise ValueError("Truncated list encoding")
+        (count,) = LIST_COUNT.unpack_from(self.view)
+        end = LIST_COUNT.size + 4 * count
+        if len(self.view) < end:
+            raise ValueError("Truncated list encoding")
+        if count:
+            (last,) = LIST_COUNT.unpack_from(self.view, end - 4)
+            if last > len(self.view) - end:
+                raise ValueError("Truncated list encoding")
+        table = self.view[LIST_COUNT.size:end]
+        if LITTLE_ENDIAN:
+            self.offsets = table.cast("I")
+        else:
+            self.offsets = array("I", table)
+            self.offsets.byteswap()
+        self.bodies = self.view[end:]
+        self.start, self.stop, _ = slice(start, stop).indices(count)
+
+    def __len__(self):
+        return max(self.stop - self.start, 0)
+
+    def raw(self, index):
+        """
+        Returns the UTF-8 bytes of item `index` as a memoryview, without copying.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        index += self.start
+        begin = self.offsets[index - 1] if index else 0
+        return self.bodies[begin:self.offsets[index]]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            encoded = EncodedList.__new__(EncodedList)
+            encoded.view, encoded.offsets, encoded.bodies = self.view, self.offsets, self.bodies
+            encoded.start, encoded.stop = self.start + start, self.start + max(stop, start)
+            return encoded
+        return str(self.raw(index), FORMAT)
+
+    def __iter__(self):
+        if self.stop <= self.start:
+            return
+        first = self.offsets[self.start - 1] if self.start else 0
+        body = self.bodies[first:self.offsets[self.stop - 1]]
+        text = str(body, FORMAT)
+        if len(text) != len(body):
+            for index in range(len(self)):
+                yield self[index]
+            return
+        # ASCII only: byte offsets are also character offsets, so the whole
+        # range is decoded once and sliced
+        begin = 0
+        for offset in self.offsets[self.start:self.stop]:
+            end = offset - first
+            yield text[begin:end]
+            begin = end
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, (str, bytes)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return "EncodedList({!r})".format(list(self))
+
+
+def decode_list(data):
+    return EncodedList(data)
@@ -1,92 +1,605 @@
-from copyreg import pickle
+import argparse
+import asyncio
+import json
 import socket
+import struct
 import threading
+import time
 
-from psutil import users
-
-from classes import user
+from metrics import METRICS
 from operations import Operations
+from registry import INBOX_CAP, OVERFLOW_POLICIES, UserRegistry
+from serialize import (COMPRESSION_LEVELS, COMPRESSION_THRESHOLD, FLAG_MORE, FLAG_PARTIAL, Compression,
+                       FrameDecoder, compress_frame, encode_list, serialize)
+from storage import Storage
 
-HEADER = 64
+RECV_SIZE = 4096
 PORT = 5050
 SERVER = "10.250.35.25"
 ADDR = (SERVER, PORT)
 FORMAT = 'utf-8'
-DISCONNECT_MESSAGE = "!DISCONNECT"
-VERSION = 1
-USERS = {}
+USERS = UserRegistry()
+STORAGE = None  # write-ahead log, enabled with --data-dir
+LOG_REQUESTS = True  # print every connection and request; --quiet turns this off
+ROUTER = None  # workers.Router when running as one of several worker processes
+
+# username -> set of sessions logged in as that user, for push delivery
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+# LIST_ACCOUNT returns at most MAX_PAGE_SIZE names per request, streamed in
+# frames of roughly LIST_FRAME_BYTES each.
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+LIST_FRAME_BYTES = 16 * 1024
+
+# VIEW_UNDELIVERED_MESSAGES returns at most this many messages / bytes of text per batch.
+VIEW_COUNT = 500
+VIEW_BYTES = 64 * 1024
+
+# Once this many response bytes are waiting to be written to a client, the
+# async server stops reading its requests until the client catches up.
+WRITE_BUFFER_HIGH = 256 * 1024
+
+# A threaded connection that can't take a frame within this many seconds is
+# closed, so a client that stops reading can't block the threads pushing to it.
+SEND_TIMEOUT = 5.0
+
+# Compression algorithms clients may negotiate with HELLO; --compression narrows this.
+COMPRESSION = list(COMPRESSION_LEVELS)
+
+
+class ThreadedSession:
+    """
+    A connection served by its own thread. Responses and pushes from other
+    handler threads share one send lock so their frames never interleave.
+
+    Sends time out after `send_timeout` seconds. A send that fails or times
+    out may have written part of a frame, so the connection is shut down
+    and every later push is refused; pushed messages are then queued.
+    """
+
+    def __init__(self, conn, addr, send_timeout=SEND_TIMEOUT):
+        self.conn = conn
+        self.addr = addr
+        self.usernames = set()
+        self.compression = None
+        self.send_lock = threading.Lock()
+        self.closed = False
+        # SO_SNDTIMEO bounds sends without the recv() timeout that settimeout() would add
+        seconds = int(send_timeout)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                        struct.pack("ll", seconds, int((send_timeout - seconds) * 1000000)))
+
+    def push(self, frame):
+        with self.send_lock:
+            if self.closed:
+                return False
+            try:
+                self.conn.sendall(frame)
+                return True
+            except OSError:
+                self.closed = True
+        # wakes the connection's own thread from recv(), which then unregisters the session
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return False
+
+
+class AsyncSession:
+    """
+    A connection served by the event loop. Pushes are refused once the
+    client's write buffer is over the high-water mark, so a slow reader
+    gets its messages queued instead of buffered in the server.
+    """
+
+    def __init__(self, writer, addr):
+        self.writer = writer
+        self.addr = addr
+        self.usernames = set()
+        self.compression = None
+
+    def push(self, frame):
+        transport = self.writer.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > WRITE_BUFFER_HIGH:
+            return False
+        self.writer.write(frame)
+        return True
+
+
+def register_session(username, session):
+    with SESSIONS_LOCK:
+        SESSIONS.setdefault(username, set()).add(session)
+        session.usernames.add(username)
+
+
+def unregister_session(session):
+    with SESSIONS_LOCK:
+        for username in session.usernames:
+            sessions = SESSIONS.get(username)
+            if sessions is not None:
+                sessions.discard(session)
+                if not sessions:
+                    del SESSIONS[username]
+            if ROUTER is not None:
+                ROUTER.session_closed(username, session)
+        session.usernames.clear()
+
+
+def open_storage(directory):
+    """
+    Enables durable storage in `directory`, loads the stored accounts and
+    messages into USERS and journals every later change.
+    """
+    global STORAGE
+    STORAGE = Storage(directory)
+    USERS.load(*STORAGE.load())
+    USERS.journal = STORAGE.append
+
+
+def durable_mark():
+    return STORAGE.appended if STORAGE is not None else 0
+
+
+def serve_request(request, session, addr):
+    """
+    Handles one request on behalf of a connection loop, recording its latency and sizes.
+
+    Returns:
+        bytearray: the response frames, or in a worker process an asyncio.Future
+        of them for requests that are applied by every worker.
+    """
+    if LOG_REQUESTS:
+        print("[{}], {}".format(addr, request["operation"]))
+    name = request["operation"].name if request["operation"] is not None else Operations.INVALID_REQUEST.name
+    start = time.perf_counter()
+    if ROUTER is not None and request["operation"] in ROUTER.sequenced:
+        future = ROUTER.submit(request, session)
+        future.add_done_callback(lambda future: future.cancelled() or METRICS.observe(
+            name, time.perf_counter() - start, len(request["info"]), len(future.result())))
+        return future
+    response = handle_request(request, session)
+    METRICS.observe(name, time.perf_counter() - start, len(request["info"]), len(response))
+    return response
 
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.bind(ADDR)
 
 def handle_client(conn, addr):
-    print("[NEW CONNECTION] {} connected.".format(addr))
+    if LOG_REQUESTS:
+        print("[NEW CONNECTION] {} connected.".format(addr))
+    METRICS.incr("connections_opened")
 
+    session = ThreadedSession(conn, addr)
+    decoder = FrameDecoder()
     connected = True
-    while connected:
-        msg_length = conn.recv(HEADER).decode(FORMAT)
-        if msg_length:
-            msg_length = int(msg_length)
-            msg = conn.recv(msg_length).decode(FORMAT)
-            if msg == DISCONNECT_MESSAGE:
+    try:
+        while connected:
+            data = conn.recv(RECV_SIZE)
+            if not data:
                 connected = False
+            METRICS.incr("bytes_in", len(data))
+            responses = []
+            mark = durable_mark()
+            for request in decoder.feed(data):
+                responses.append(serve_request(request, session, addr))
+            # acknowledge changes only once the log holding them is on disk
+            if durable_mark() != mark:
+                STORAGE.wait()
+            if responses:
+                data = b"".join(responses)
+                METRICS.incr("bytes_out", len(data))
+                if not session.push(data):
+                    connected = False
+    except (OSError, ValueError):
+        # ValueError: a frame with a bad version or length, after which the stream can't be read
+        pass
+    finally:
+        unregister_session(session)
+        conn.close()
+        METRICS.incr("connections_closed")
+        METRICS.retire()
 
-            print("[{}], {}".format(addr, msg))
-
-    conn.close()
 
-
-def start():
-    server.listen(PORT)
-    print("[LISTENING] Server is listening on {}".format(SERVER))
+def start(addr=ADDR):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(addr)
+    server.listen()
+    print("[LISTENING] Server is listening on {}".format(addr[0]))
     while True:
         conn, addr = server.accept()
+        # responses and pushes are small separate writes; don't let Nagle hold them back
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         thread = threading.Thread(target=handle_client, args=(conn, addr))
         thread.start()
-        print("[ACTIVE CONNECTIONS] {}".format(threading.activeCount() - 1))
-def encode(message, operation):
-    pass
+        if LOG_REQUESTS:
+            print("[ACTIVE CONNECTIONS] {}".format(threading.active_count() - 1))
+
+
+async def handle_client_async(reader, writer):
+    """
+    Serves one connection on the event loop. Requests are dispatched to the
+    same handlers as the threaded server; after each read the coroutine waits
+    for the responses to drain, so a client that stops reading stops being
+    read from instead of growing the server's write buffer without bound.
+    """
+    addr = writer.get_extra_info("peername")
+    if LOG_REQUESTS:
+        print("[NEW CONNECTION] {} connected.".format(addr))
+    METRICS.incr("connections_opened")
+    writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+
+    session = AsyncSession(writer, addr)
+    decoder = FrameDecoder()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                break
+            METRICS.incr("bytes_in", len(data))
+            responses = []
+            mark = durable_mark()
+            for request in decoder.feed(data):
+                responses.append(serve_request(request, session, addr))
+            if durable_mark() != mark:
+                # other connections keep running while this one waits for the group commit
+                await loop.run_in_executor(None, STORAGE.wait, durable_mark())
+            responses = [await response if isinstance(response, asyncio.Future) else response
+                         for response in responses]
+            METRICS.incr("bytes_out", sum(map(len, responses)))
+            writer.writelines(responses)
+            await writer.drain()
+    except (OSError, ValueError):
+        pass
+    finally:
+        unregister_session(session)
+        writer.close()
+        METRICS.incr("connections_closed")
+
+
+async def serve_async(addr, reuse_port=False):
+    server = await asyncio.start_server(handle_client_async, addr[0], addr[1], reuse_address=True,
+                                        reuse_port=reuse_port)
+    print("[LISTENING] Server is listening on {}".format(addr[0]))
+    async with server:
+        await server.serve_forever()
+
+
+def start_async(addr=ADDR):
+    asyncio.run(serve_async(addr))
+
+def handle_request(request, session=None):
+    """
+    Dispatches a decoded request frame to its handler and builds the response frame.
 
-def decode(message):
-    pass
+    Args:
+        request (dict): a frame as returned by FrameDecoder.feed().
+        session: the connection the request arrived on, used to register logins for push delivery.
 
-def login(username):
+    Returns:
+        bytearray: the serialized response frame, tagged with the request's id;
+        INVALID_REQUEST if the request could not be parsed.
+    """
+    try:
+        response = dispatch(request["operation"], request["info"].decode(FORMAT), session)
+    except ValueError:
+        # a bad opcode, missing fields, a number that doesn't parse or text that isn't UTF-8
+        response = {"status": Operations.INVALID_REQUEST}
+    compression = session.compression if session is not None else None
+    if "chunks" in response:
+        return stream_frames(response["status"], response["chunks"], request["request_id"],
+                             FLAG_PARTIAL if response["cursor"] else 0, compression)
+    return serialize({"operation": response["status"], "info": response.get("info", b"")},
+                     request_id=request["request_id"], compression=compression)
+
+def split_fields(info, count):
+    """
+    Splits a request payload into exactly `count` newline separated fields,
+    the last of which may itself contain newlines.
+
+    Raises:
+        ValueError: if the payload has fewer fields.
+    """
+    fields = info.split("\n", count - 1)
+    if len(fields) != count:
+        raise ValueError("Expected {} fields, got {}".format(count, len(fields)))
+    return fields
+
+def dispatch(operation, info, session=None):
+    """
+    Calls the handler for `operation` with the fields of its decoded payload.
+
+    Returns:
+        dict: the handler's response.
+
+    Raises:
+        ValueError: if the operation is unknown or the payload is malformed.
+    """
+    if operation == Operations.LOGIN:
+        return login(info, session)
+    if operation == Operations.CREATE_ACCOUNT:
+        return create_account(info)
+    if operation == Operations.DELETE_ACCOUNT:
+        return delete_account(info)
+    if operation == Operations.LIST_ACCOUNT:
+        return list_accounts(*info.split("\n", 2))
+    if operation == Operations.SEND_MESSAGE:
+        sender, receiver, msg = split_fields(info, 3)
+        return send_message(msg, sender, receiver)
+    if operation == Operations.VIEW_UNDELIVERED_MESSAGES:
+        return view_msgs(*info.split("\n", 2))
+    if operation == Operations.ACK_MESSAGES:
+        return ack_msgs(*split_fields(info, 2))
+    if operation == Operations.STATS:
+        return stats()
+    if operation == Operations.CREATE_GROUP:
+        group, *members = info.split("\n")
+        return create_group(group, members)
+    if operation == Operations.JOIN_GROUP:
+        return join_group(*split_fields(info, 2))
+    if operation == Operations.LEAVE_GROUP:
+        return leave_group(*split_fields(info, 2))
+    if operation == Operations.SEND_GROUP_MESSAGE:
+        sender, group, msg = split_fields(info, 3)
+        return send_group_message(msg, sender, group)
+    if operation == Operations.HELLO:
+        return hello(info, session)
+    raise ValueError("Unexpected operation {}".format(operation))
+
+def stream_frames(operation, chunks, request_id, flags=0, compression=None):
+    """
+    Serializes a response split into several payloads. Every frame but the
+    last carries FLAG_MORE; `flags` is set on the last frame.
+    """
+    frames = [serialize({"operation": operation, "info": chunk}, FLAG_MORE, request_id, compression)
+              for chunk in chunks[:-1]]
+    frames.append(serialize({"operation": operation, "info": chunks[-1] if chunks else b""},
+                            flags, request_id, compression))
+    return b"".join(frames)
+
+def hello(info, session=None):
+    """
+    Negotiates compression for the connection. The client lists the
+    algorithms it accepts, best first, and optionally the smallest payload
+    worth compressing; the server picks the first algorithm it allows.
+
+    Returns:
+        dict: SUCCESS with "algorithm\nthreshold", or "none\n" if nothing matched.
+    """
+    algorithms, _, threshold = info.partition("\n")
+    algorithm = next((name for name in algorithms.split(",") if name in COMPRESSION), None)
+    compression = None
+    if algorithm is not None:
+        compression = Compression(algorithm, int(threshold) if threshold else COMPRESSION_THRESHOLD)
+    if session is not None:
+        session.compression = compression
+    if compression is None:
+        return {"status": Operations.SUCCESS, "info": "none\n"}
+    return {"status": Operations.SUCCESS, "info": "{}\n{}".format(*compression)}
+
+def login(username, session=None):
     if username in USERS:
+        if session is not None:
+            register_session(username, session)
         return {"status": Operations.SUCCESS}
     return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
 
 def create_account(username):
-    if username in USERS:
+    if not USERS.create(username):
         return {"status": Operations.ACCOUNT_ALREADY_EXISTS}
-    new_user = user(username)
-    USERS[username] = new_user
     return {"status": Operations.SUCCESS}
 
 def delete_account(username):
-    if username in USERS:
-        USERS.pop(username)
+    if USERS.delete(username):
+        with SESSIONS_LOCK:
+            for session in SESSIONS.pop(username, ()):
+                session.usernames.discard(username)
         return {"status": Operations.SUCCESS}
     return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
 
-def list_accounts():
-    user_list = pickle.dumps(list(USERS.keys()))
-    return {"status": Operations.LIST_OF_ACCOUNTS, "info": user_list}
+def list_accounts(pattern="*", cursor="", limit=""):
+    """
+    Returns one page of account names matching `pattern`, starting after
+    `cursor`, as a list of encoded chunks of about LIST_FRAME_BYTES each.
+    The returned cursor is "" on the last page. `limit` is clamped to
+    1..MAX_PAGE_SIZE; a limit that isn't a number raises ValueError, which
+    is answered with INVALID_REQUEST.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE)) if limit else PAGE_SIZE
+    names, next_cursor = USERS.search(pattern, cursor, limit)
+    chunks = []
+    start = size = 0
+    for end, name in enumerate(names, 1):
+        size += len(name) + 4
+        if size >= LIST_FRAME_BYTES:
+            chunks.append(encode_list(names[start:end]))
+            start, size = end, 0
+    if start < len(names) or not chunks:
+        chunks.append(encode_list(names[start:]))
+    return {"status": Operations.LIST_OF_ACCOUNTS, "chunks": chunks, "cursor": next_cursor}
+
+def push_message(msg, sender, receiver, frame=None):
+    """
+    Pushes a message to every session logged in as `receiver`.
+
+    Args:
+        frame (bytes): the push frame, when it is already built; defaults to a DELIVER_MESSAGE frame.
+
+    Returns:
+        bool: True if at least one session accepted the message.
+    """
+    with SESSIONS_LOCK:
+        sessions = list(SESSIONS.get(receiver, ()))
+    if not sessions:
+        return False
+    if frame is None:
+        frame = serialize({"operation": Operations.DELIVER_MESSAGE, "info": sender + "\n" + msg})
+    compressed = {None: frame}
+    delivered = False
+    for session in sessions:
+        if session.compression not in compressed:
+            compressed[session.compression] = compress_frame(frame, session.compression)
+        delivered = session.push(compressed[session.compression]) or delivered
+    return delivered
+
+def deliver(msg, sender, receiver, frame=None):
+    """
+    Pushes a message to a logged in receiver. In a worker process the
+    router decides, since the receiver may be connected to another worker.
+
+    Returns:
+        bool: True if the message was taken care of; False if the caller
+        should queue it.
+    """
+    if ROUTER is None:
+        return push_message(msg, sender, receiver, frame)
+    return ROUTER.deliver(msg, sender, receiver, frame)
 
 def send_message(msg, sender, receiver):
     if receiver in USERS and sender in USERS:
-        USERS[receiver].undelivered_messages.append(msg)
+        if deliver(msg, sender, receiver) or USERS.enqueue(receiver, msg, sender):
+            return {"status": Operations.SUCCESS}
+        if receiver in USERS:
+            return {"status": Operations.INBOX_FULL}
+    return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
+
+def create_group(group, members=()):
+    """
+    Creates a group with the given initial members, all of which must be existing accounts.
+    """
+    if any(member not in USERS for member in members):
+        return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
+    if not USERS.create_group(group):
+        # groups have their own namespace, but share the "already exists" status with accounts
+        return {"status": Operations.ACCOUNT_ALREADY_EXISTS}
+    for member in members:
+        USERS.join_group(group, member)
+    return {"status": Operations.SUCCESS}
+
+def join_group(group, username):
+    if USERS.members(group) is None:
+        return {"status": Operations.GROUP_DOES_NOT_EXIST}
+    if USERS.join_group(group, username):
         return {"status": Operations.SUCCESS}
     return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
 
-def view_msgs(username):
-    if username in USERS:
-        messages = pickle.dumps(USERS[username].undelivered_messages)
-        USERS[username].undelivered_messages.clear()
-        return {"status": Operations.LIST_OF_MESSAGES, "info": messages}
+def leave_group(group, username):
+    if USERS.leave_group(group, username):
+        return {"status": Operations.SUCCESS}
+    return {"status": Operations.GROUP_DOES_NOT_EXIST}
+
+def send_group_message(msg, sender, group):
+    """
+    Fans a message out to every member of `group` except the sender. The
+    push frame is built once and written to each logged in member; everyone
+    else gets a reference to the same message text queued in their inbox.
+
+    Returns:
+        dict: SUCCESS with the number of members that received or queued the
+        message; ACCOUNT_DOES_NOT_EXIST if the sender is not a member.
+    """
+    members = USERS.members(group)
+    if members is None:
+        return {"status": Operations.GROUP_DOES_NOT_EXIST}
+    if sender not in members or sender not in USERS:
+        return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
+    frame = serialize({"operation": Operations.DELIVER_GROUP_MESSAGE,
+                       "info": group + "\n" + sender + "\n" + msg})
+    offline = []
+    delivered = 0
+    for member in members:
+        if member == sender:
+            continue
+        if deliver(msg, sender, member, frame):
+            delivered += 1
+        else:
+            offline.append(member)
+    if offline:
+        delivered += len(USERS.enqueue_many(offline, msg, sender))
+    return {"status": Operations.SUCCESS, "info": str(delivered)}
+
+def view_msgs(username, max_count="", max_bytes=""):
+    """
+    Returns the oldest batch of undelivered messages, capped at VIEW_COUNT
+    messages and VIEW_BYTES of text, encoded as a list whose first item is
+    the ack token and the rest are the messages.
+    The messages stay queued until the client acknowledges the token.
+    """
+    max_count = max(1, min(int(max_count), VIEW_COUNT)) if max_count else VIEW_COUNT
+    max_bytes = max(1, min(int(max_bytes), VIEW_BYTES)) if max_bytes else VIEW_BYTES
+    batch = USERS.peek(username, max_count, max_bytes)
+    if batch is not None:
+        messages, token = batch
+        return {"status": Operations.LIST_OF_MESSAGES, "info": encode_list([token] + messages)}
+    return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
+
+def ack_msgs(username, token):
+    if USERS.ack(username, token):
+        return {"status": Operations.SUCCESS}
     return {"status": Operations.ACCOUNT_DOES_NOT_EXIST}
 
+def stats():
+    """
+    Returns the server's metrics as JSON: request, byte and connection
+    counters, gauges and per-operation latency percentiles in microseconds.
+    """
+    report = METRICS.snapshot()
+    counters = report["counters"]
+    report["gauges"]["active_connections"] = (counters.get("connections_opened", 0)
+                                              - counters.get("connections_closed", 0))
+    return {"status": Operations.STATS_REPORT, "info": json.dumps(report)}
+
+
+METRICS.gauge("accounts", lambda: len(USERS))
+METRICS.gauge("undelivered_messages", USERS.undelivered_count)
+METRICS.gauge("logged_in_users", lambda: len(SESSIONS))
+METRICS.gauge("groups", lambda: len(USERS.groups))
+METRICS.gauge("uncommitted_log_records", lambda: STORAGE.appended - STORAGE.durable if STORAGE else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat server")
+    parser.add_argument("--host", default=SERVER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                        help="one thread per connection, or a single asyncio event loop")
+    parser.add_argument("--data-dir", help="keep accounts and messages in a write-ahead log in this directory")
+    parser.add_argument("--inbox-cap", type=int, default=INBOX_CAP,
+                        help="maximum undelivered messages kept per user")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default=USERS.overflow,
+                        help="what happens to a new message when the recipient's inbox is full")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="run this many async server processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--compression", default=",".join(COMPRESSION),
+                        help="comma-separated compression algorithms clients may negotiate, or 'none'")
+    parser.add_argument("--quiet", action="store_true",
+                        help="don't print every connection and request (printing serializes all handlers on stdout)")
+    args = parser.parse_args()
+
+    LOG_REQUESTS = not args.quiet
+    USERS.inbox_cap = args.inbox_cap
+    USERS.overflow = args.overflow
+    COMPRESSION = [name for name in args.compression.split(",") if name in COMPRESSION_LEVELS]
+
+    if args.workers > 1:
+        if args.data_dir:
+            parser.error("--data-dir is not supported with --workers")
+        from workers import start_workers
+        print("[STARTING] server is starting with {} workers...".format(args.workers))
+        start_workers((args.host, args.port), args.workers, {
+            "log_requests": LOG_REQUESTS, "inbox_cap": USERS.inbox_cap,
+            "overflow": USERS.overflow, "epoch": USERS.epoch, "compression": COMPRESSION})
+        raise SystemExit
+
+    if args.data_dir:
+        open_storage(args.data_dir)
 
+    print("[STARTING] server is starting in {} mode...".format(args.mode))
+    if args.mode == "async":
+        start_async((args.host, args.port))
+    else:
+        start((args.host, args.port))
 
-print("[STARTING] server is starting...")
-start()
 
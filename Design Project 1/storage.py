@@ -0,0 +1,328 @@
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+
+FORMAT = "utf-8"
+
+# Event types written to the log.
+CREATE = 1
+DELETE = 2
+SEND = 3
+DELIVER = 4
+GROUP_CREATE = 5
+GROUP_JOIN = 6
+GROUP_LEAVE = 7
+GROUP_SEND = 8  # one record for a message fanned out to several inboxes
+
+# A log record is its payload length and CRC32 followed by the payload: one
+# byte of event type, then each field as a 4-byte length and UTF-8 bytes.
+RECORD_HEADER = struct.Struct("!II")
+FIELD_LENGTH = struct.Struct("!I")
+EVENT_TYPE = struct.Struct("!B")
+SNAPSHOT_MAGIC = b"CHATSNP1"
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+# A segment is also closed once it is this old, so a server that writes
+# slowly still has its log compacted and replays little on restart.
+SEGMENT_SECONDS = 600
+LOG_PATTERN = "wal-{:08d}.log"
+SNAPSHOT_PATTERN = "snapshot-{:08d}.bin"
+
+
+def encode_record(event, *fields):
+    parts = [EVENT_TYPE.pack(event)]
+    for field in fields:
+        data = field.encode(FORMAT) if isinstance(field, str) else field
+        parts.append(FIELD_LENGTH.pack(len(data)))
+        parts.append(data)
+    payload = b"".join(parts)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data):
+    """
+    Yields (event, fields) for every intact record in `data`. Decoding stops
+    at the first truncated or corrupt record, which is where a crash in the
+    middle of a write leaves the tail of the last segment.
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(view):
+        length, checksum = RECORD_HEADER.unpack_from(view, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if end > len(view) or zlib.crc32(view[start:end]) != checksum:
+            return
+        event = view[start]
+        fields = []
+        position = start + EVENT_TYPE.size
+        while position < end:
+            (size,) = FIELD_LENGTH.unpack_from(view, position)
+            position += FIELD_LENGTH.size
+            fields.append(str(view[position:position + size], FORMAT))
+            position += size
+        yield event, fields
+        offset = end
+
+
+def apply_event(state, groups, event, fields):
+    """
+    Applies one logged event to `state`, a dict of username -> list of
+    undelivered messages, and `groups`, a dict of group -> set of members.
+    """
+    if event == CREATE:
+        state.setdefault(fields[0], [])
+    elif event == DELETE:
+        state.pop(fields[0], None)
+        for members in groups.values():
+            members.discard(fields[0])
+    elif event == SEND:
+        receiver, sender, msg = fields
+        if receiver in state:
+            state[receiver].append(msg)
+    elif event == DELIVER:
+        username, count = fields
+        if username in state:
+            del state[username][:int(count)]
+    elif event == GROUP_CREATE:
+        groups.setdefault(fields[0], set())
+    elif event == GROUP_JOIN:
+        group, username = fields
+        if group in groups and username in state:
+            groups[group].add(username)
+    elif event == GROUP_LEAVE:
+        group, username = fields
+        if group in groups:
+            groups[group].discard(username)
+    elif event == GROUP_SEND:
+        sender, msg = fields[:2]
+        for receiver in fields[2:]:
+            if receiver in state:
+                state[receiver].append(msg)
+
+
+def _segment_number(path):
+    return int(os.path.basename(path).split("-")[1].split(".")[0])
+
+
+class Storage:
+    """
+    Durable storage for accounts and undelivered messages.
+
+    Every change is appended to a write-ahead log. Appends only queue the
+    record; a single writer thread writes everything queued since its last
+    pass and fsyncs once for the whole batch (group commit), and callers
+    that need durability block in wait() until their record is on disk.
+
+    The log is split into segments, closed when they reach `segment_bytes`
+    or, if they hold any records, `segment_seconds` after they were opened.
+    Closed segments are folded into a compacted snapshot in the background,
+    so startup reads the latest snapshot and replays only the segments
+    written after it.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, segment_seconds=SEGMENT_SECONDS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        self.condition = threading.Condition()
+        self.pending = []
+        self.appended = 0  # sequence number of the last queued record
+        self.durable = 0  # sequence number of the last fsynced record
+        self.closing = False
+        self.error = None  # the OSError that stopped the writer thread
+
+        self.compact_lock = threading.Lock()
+        self.log = None
+        self.segment = 0
+        self.opened = 0.0  # time.monotonic() when the current segment was opened
+        self.writer = None
+
+    def _path(self, pattern, number):
+        return os.path.join(self.directory, pattern.format(number))
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "wal-*.log")), key=_segment_number)
+
+    def _latest_snapshot(self):
+        snapshots = sorted(glob.glob(os.path.join(self.directory, "snapshot-*.bin")), key=_segment_number)
+        return snapshots[-1] if snapshots else None
+
+    def load(self):
+        """
+        Rebuilds the stored state and opens a fresh log segment for appends.
+        Must be called once, before any append.
+
+        Returns:
+            tuple: (state, groups); state maps username -> list of undelivered
+            messages and groups maps group -> set of members.
+        """
+        state, groups, covered = self._read_snapshot(self._latest_snapshot())
+        last = covered
+        for path in self._segments():
+            number = _segment_number(path)
+            if number <= covered:
+                continue
+            with open(path, "rb") as log:
+                for event, fields in decode_records(log.read()):
+                    apply_event(state, groups, event, fields)
+            last = number
+
+        self._open_segment(last + 1)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        if last > covered:
+            threading.Thread(target=self.compact, daemon=True).start()
+        return state, groups
+
+    def _read_snapshot(self, path):
+        if path is None:
+            return {}, {}, 0
+        with open(path, "rb") as snapshot:
+            data = snapshot.read()
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("{} is not a snapshot".format(path))
+        # snapshots store each account as a CREATE record whose extra fields
+        # are its undelivered messages, and each group as a GROUP_CREATE
+        # record whose extra fields are its members
+        state = {}
+        groups = {}
+        for event, fields in decode_records(data[len(SNAPSHOT_MAGIC):]):
+            if event == CREATE:
+                state[fields[0]] = fields[1:]
+            elif event == GROUP_CREATE:
+                groups[fields[0]] = set(fields[1:])
+        return state, groups, _segment_number(path)
+
+    def _sync_directory(self):
+        # a new or renamed file survives a crash only once its directory entry is on disk
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open_segment(self, number):
+        self.segment = number
+        self.log = open(self._path(LOG_PATTERN, number), "ab")
+        self._sync_directory()
+        self.opened = time.monotonic()
+
+    def append(self, event, *fields):
+        """
+        Queues a record for the next group commit.
+
+        Returns:
+            int: the record's sequence number, to pass to wait().
+        """
+        record = encode_record(event, *fields)
+        with self.condition:
+            self.pending.append(record)
+            self.appended += 1
+            self.condition.notify_all()
+            return self.appended
+
+    def wait(self, sequence=None):
+        """
+        Blocks until the record with `sequence` (default: everything appended so far) is fsynced.
+
+        Raises:
+            OSError: if the log could not be written; nothing appended since is durable.
+        """
+        with self.condition:
+            if sequence is None:
+                sequence = self.appended
+            while self.durable < sequence:
+                if self.error is not None:
+                    raise OSError("Write-ahead log failed: {}".format(self.error)) from self.error
+                self.condition.wait()
+
+    def _segment_timeout(self):
+        """
+        Seconds until the current segment is old enough to close, or None
+        while it holds no records, since an empty segment is never closed.
+        """
+        if not self.log.tell():
+            return None
+        return max(0.0, self.opened + self.segment_seconds - time.monotonic())
+
+    def _write_loop(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self.pending and not self.closing:
+                        # wake up when the segment is due to close even if nothing is written
+                        timeout = self._segment_timeout()
+                        if timeout == 0:
+                            break
+                        self.condition.wait(timeout)
+                    if not self.pending and self.closing:
+                        return
+                    batch, self.pending = self.pending, []
+                    sequence = self.appended
+                if batch:
+                    self.log.write(b"".join(batch))
+                    self.log.flush()
+                    os.fsync(self.log.fileno())
+                    with self.condition:
+                        self.durable = sequence
+                        self.condition.notify_all()
+                if self.log.tell() >= self.segment_bytes or self._segment_timeout() == 0:
+                    self.log.close()
+                    self._open_segment(self.segment + 1)
+                    threading.Thread(target=self.compact, daemon=True).start()
+        except OSError as error:
+            # after a failed write or fsync the log can't be trusted, so stop and fail every waiter
+            with self.condition:
+                self.error = error
+                self.condition.notify_all()
+
+    def compact(self):
+        """
+        Folds the latest snapshot and every closed log segment into a new
+        snapshot, then removes the files it replaces. Works only from files
+        on disk, so it never blocks the handlers.
+        """
+        with self.compact_lock:
+            previous = self._latest_snapshot()
+            state, groups, covered = self._read_snapshot(previous)
+            closed = [path for path in self._segments()
+                      if covered < _segment_number(path) < self.segment]
+            if not closed:
+                return
+            for path in closed:
+                with open(path, "rb") as log:
+                    for event, fields in decode_records(log.read()):
+                        apply_event(state, groups, event, fields)
+            last = _segment_number(closed[-1])
+
+            target = self._path(SNAPSHOT_PATTERN, last)
+            with open(target + ".tmp", "wb") as snapshot:
+                snapshot.write(SNAPSHOT_MAGIC)
+                for username, messages in state.items():
+                    snapshot.write(encode_record(CREATE, username, *messages))
+                for group, members in groups.items():
+                    snapshot.write(encode_record(GROUP_CREATE, group, *sorted(members)))
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(target + ".tmp", target)
+            self._sync_directory()
+
+            for path in closed:
+                os.remove(path)
+            if previous is not None:
+                os.remove(previous)
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        if self.writer is not None:
+            self.writer.join()
+        if self.log is not None:
+            self.log.close()
@@ -0,0 +1,843 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import Mock, call, patch
+import client
+import metrics
+from operations import Operations
+from registry import DROP_OLDEST, REJECT, UserRegistry
+from serialize import (FLAG_COMPRESSED, FLAG_PARTIAL, HEADER, VERSION, EncodedList, FrameDecoder, decode_list, deserialize,
+                       encode_list, serialize)
+import server
+import storage
+from workers import Router
+
+class ChatServerTests(TestCase):
+
+    def serve(self, handler, buffer_size=None):
+        '''
+        Description:
+        - This function starts a server on a free local port that runs `handler(conn, addr)`
+        in a new thread for every connection it accepts, until the test ends.
+
+        Parameters:
+        - self: the instance of the test class
+        - handler: the function serving one connection
+        - buffer_size: if given, the send and receive buffer size of the accepted sockets
+
+        Return:
+        - the address the server is listening on
+        '''
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if buffer_size is not None:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        self.addCleanup(listener.close)
+
+        def accept():
+            while True:
+                try:
+                    conn, addr = listener.accept()
+                except OSError:
+                    return
+                threading.Thread(target=handler, args=(conn, addr), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        return listener.getsockname()
+
+
+    def test_frame_decoder(self):
+        '''
+        Description:
+        - This function tests that the frame decoder turns a byte stream back into frames
+        however it is split into reads. It feeds one frame a byte at a time, then several
+        frames coalesced into one read, and asserts that each frame comes out once, whole,
+        and in order, with its opcode, flags and request id.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        first = serialize({"operation": Operations.CREATE_ACCOUNT, "info": "alice"}, request_id=1)
+        second = serialize({"operation": Operations.SEND_MESSAGE, "info": "alice\nbob\nhi"}, request_id=2)
+        third = serialize({"operation": Operations.LIST_OF_ACCOUNTS, "info": b""}, flags=2, request_id=3)
+
+        # a frame split across many reads comes out only once its last byte arrives
+        decoder = FrameDecoder()
+        frames = [decoder.feed(first[i:i + 1]) for i in range(len(first))]
+        self.assertEqual(frames[:-1], [[]] * (len(first) - 1))
+        self.assertEqual(frames[-1], [{"version": VERSION, "operation": Operations.CREATE_ACCOUNT, "flags": 0,
+                                       "request_id": 1, "info": b"alice"}])
+
+        # coalesced frames come out of one read, and a trailing partial frame waits for the rest
+        frames = decoder.feed(bytes(second + third + first[:5]))
+        self.assertEqual([(frame["operation"], frame["flags"], frame["request_id"], frame["info"]) for frame in frames],
+                         [(Operations.SEND_MESSAGE, 0, 2, b"alice\nbob\nhi"), (Operations.LIST_OF_ACCOUNTS, 2, 3, b"")])
+        self.assertEqual(decoder.feed(first[5:])[0]["info"], b"alice")
+
+        # a frame with an unknown opcode is still consumed, so the frames after it can be read
+        unknown = HEADER.pack(VERSION, 99, 0, 4, 3) + b"???"
+        frames = decoder.feed(unknown + first)
+        self.assertEqual([(frame["operation"], frame["request_id"]) for frame in frames],
+                         [(None, 4), (Operations.CREATE_ACCOUNT, 1)])
+
+        # a frame from another version of the protocol can't be read past
+        with self.assertRaises(ValueError):
+            FrameDecoder().feed(HEADER.pack(VERSION + 1, 10, 0, 1, 0))
+
+
+    def test_invalid_requests(self):
+        '''
+        Description:
+        - This function tests that the server answers a malformed request with an
+        INVALID_REQUEST status instead of raising, which used to close the connection.
+        It sends requests with missing fields, numbers that don't parse, text that isn't
+        UTF-8 and an unknown opcode, and asserts that each is answered with the id of the
+        request, and that the server still handles a valid request afterwards.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        def respond(operation, info):
+            frame = deserialize(server.handle_request({"operation": operation, "request_id": 9, "info": info}))
+            self.assertEqual(frame["request_id"], 9)
+            return frame["operation"]
+
+        with patch.object(server, "USERS", UserRegistry()):
+            self.assertEqual(respond(Operations.CREATE_ACCOUNT, b"alice"), Operations.SUCCESS)
+            for operation, info in [(Operations.SEND_MESSAGE, b"alice\nbob"), (Operations.ACK_MESSAGES, b"alice"),
+                                    (Operations.JOIN_GROUP, b"group"), (Operations.LIST_ACCOUNT, b"*\n\nten"),
+                                    (Operations.VIEW_UNDELIVERED_MESSAGES, b"alice\nmany"),
+                                    (Operations.HELLO, b"zlib\nsmall"), (Operations.LOGIN, b"\xff"),
+                                    (None, b"unknown opcode"), (Operations.SUCCESS, b"")]:
+                self.assertEqual(respond(operation, info), Operations.INVALID_REQUEST)
+            self.assertEqual(respond(Operations.LOGIN, b"alice"), Operations.SUCCESS)
+
+
+    def test_storage(self):
+        '''
+        Description:
+        - This function tests the write-ahead log. It appends accounts, a message and a group,
+        tears the last record in half as a crash in the middle of a write would, and asserts
+        that loading replays every intact record and ignores the torn one. It then asserts
+        that compaction folds the replayed segment into a snapshot, that later records are
+        replayed on top of the snapshot, and that a segment older than segment_seconds is
+        closed and compacted too.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        def open_log(directory, **kwargs):
+            # the background compactions are replaced by a mock, and run here instead when the test is ready
+            log = storage.Storage(directory, **kwargs)
+            log.compact = Mock()
+            return log
+
+        with tempfile.TemporaryDirectory() as directory:
+            log = open_log(directory)
+            self.assertEqual(log.load(), ({}, {}))
+            log.compact.assert_not_called()
+            log.append(storage.CREATE, "alice")
+            log.append(storage.CREATE, "bob")
+            log.append(storage.SEND, "alice", "bob", "hi")
+            log.append(storage.GROUP_CREATE, "group")
+            log.wait(log.append(storage.GROUP_JOIN, "group", "bob"))
+            log.close()
+
+            # a crash left half of a record at the end of the segment
+            with open(os.path.join(directory, "wal-00000001.log"), "ab") as segment:
+                segment.write(storage.encode_record(storage.SEND, "bob", "alice", "lost")[:-3])
+
+            log = open_log(directory)
+            self.assertEqual(log.load(), ({"alice": ["hi"], "bob": []}, {"group": {"bob"}}))
+            # the replayed segment is compacted into a snapshot
+            log.compact.assert_called_once()
+            storage.Storage.compact(log)
+            self.assertEqual(sorted(os.listdir(directory)), ["snapshot-00000001.bin", "wal-00000002.log"])
+            log.wait(log.append(storage.DELIVER, "alice", "1"))
+            log.close()
+
+            # the snapshot is read and only the segment written after it is replayed
+            log = open_log(directory, segment_seconds=0)
+            self.assertEqual(log.load(), ({"alice": [], "bob": []}, {"group": {"bob"}}))
+            storage.Storage.compact(log)
+            log.compact.reset_mock()
+            # a segment that is old enough is closed after its next commit, and compacted
+            log.wait(log.append(storage.GROUP_LEAVE, "group", "bob"))
+            log.close()
+            self.assertEqual(log.segment, 4)
+            log.compact.assert_called_once()
+            storage.Storage.compact(log)
+            self.assertEqual(sorted(os.listdir(directory)), ["snapshot-00000003.bin", "wal-00000004.log"])
+
+            log = open_log(directory)
+            self.assertEqual(log.load(), ({"alice": [], "bob": []}, {"group": set()}))
+            log.close()
+
+
+    def test_storage_failures(self):
+        '''
+        Description:
+        - This function tests the write-ahead log's writer thread away from the happy path. It
+        asserts that a segment holding records is closed and compacted once it is old enough
+        even if nothing else is written, that new segments and snapshots are followed by an
+        fsync of the directory, and that when a write fails every waiter gets the error
+        instead of blocking forever.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        with tempfile.TemporaryDirectory() as directory:
+            with patch.object(storage.Storage, "_sync_directory", autospec=True) as sync:
+                log = storage.Storage(directory, segment_seconds=0.2)
+                log.compact = Mock()
+                log.load()
+                self.assertEqual(sync.call_count, 1)
+                log.wait(log.append(storage.CREATE, "alice"))
+                # the segment is closed on age alone, with no later write to notice it
+                deadline = time.monotonic() + 5
+                while log.segment == 1 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(log.segment, 2)
+                log.compact.assert_called_once()
+                self.assertEqual(sync.call_count, 2)
+                storage.Storage.compact(log)
+                self.assertEqual(sync.call_count, 3)
+                # an empty segment stays open however old it gets
+                time.sleep(0.3)
+                self.assertEqual(log.segment, 2)
+                log.close()
+            self.assertEqual(sorted(os.listdir(directory)), ["snapshot-00000001.bin", "wal-00000002.log"])
+
+            log = storage.Storage(directory)
+            log.compact = Mock()
+            self.assertEqual(log.load(), ({"alice": []}, {}))
+            with patch.object(storage.os, "fsync", side_effect=OSError(5, "Input/output error")):
+                sequence = log.append(storage.CREATE, "bob")
+                with self.assertRaises(OSError):
+                    log.wait(sequence)
+            log.writer.join(5)
+            self.assertFalse(log.writer.is_alive())
+            # later waiters fail too, instead of waiting for a writer that is gone
+            with self.assertRaises(OSError):
+                log.wait(log.append(storage.CREATE, "carol"))
+            log.close()
+
+
+    def test_user_registry_search(self):
+        '''
+        Description:
+        - This function tests the paginated account search. It creates accounts out of
+        order and asserts that searches by prefix and by wildcard return them sorted, that
+        following the cursor pages through every match exactly once, and that LIST_ACCOUNT
+        clamps its limit to at least one name and at most MAX_PAGE_SIZE.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        users = UserRegistry()
+        for name in ["bob", "alice", "alan", "carol", "al", "albert"]:
+            users.create(name)
+
+        # a pattern without wildcards matches as a prefix, and wildcards are matched in full
+        self.assertEqual(users.search("al"), (["al", "alan", "albert", "alice"], ""))
+        self.assertEqual(users.search("al*n"), (["alan"], ""))
+        self.assertEqual(users.search("?o*"), (["bob"], ""))
+
+        # following the cursor visits every match once
+        pages = []
+        cursor = ""
+        while True:
+            names, cursor = users.search("*", cursor, 4)
+            pages.append(names)
+            if not cursor:
+                break
+        self.assertEqual(pages, [["al", "alan", "albert", "alice"], ["bob", "carol"]])
+        with self.assertRaises(ValueError):
+            users.search("*", "", 0)
+
+        def list_accounts(limit):
+            frame = deserialize(server.handle_request({"operation": Operations.LIST_ACCOUNT, "request_id": 1,
+                                                       "info": "a*\n\n{}".format(limit).encode()}))
+            return list(decode_list(frame["info"])), bool(frame["flags"] & FLAG_PARTIAL)
+
+        with patch.object(server, "USERS", users), patch.object(server, "MAX_PAGE_SIZE", 3):
+            self.assertEqual(list_accounts(0), (["al"], True))
+            self.assertEqual(list_accounts(-1), (["al"], True))
+            self.assertEqual(list_accounts(2), (["al", "alan"], True))
+            self.assertEqual(list_accounts(100), (["al", "alan", "albert"], True))
+            self.assertEqual(list_accounts(""), (["al", "alan", "albert", "alice"], False))
+
+
+    def test_user_registry_inbox(self):
+        '''
+        Description:
+        - This function tests fetching and acknowledging undelivered messages. It asserts that
+        peek() returns the oldest batch within its count and byte limits, counting encoded
+        bytes, without removing it, that ack() removes exactly that batch and ignores a token from another registry, and
+        that a full inbox drops its oldest message or rejects the new one depending on the
+        overflow policy.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        users = UserRegistry(inbox_cap=3)
+        users.create("alice")
+        for text in ["one", "two", "three"]:
+            self.assertTrue(users.enqueue("alice", text, "bob"))
+
+        # a batch is limited by count and by bytes, but always holds at least one message
+        messages, token = users.peek("alice", 2, 1000)
+        self.assertEqual(messages, ["one", "two"])
+        self.assertEqual(users.peek("alice", 10, 4)[0], ["one"])
+        self.assertEqual(users.peek("alice", 10, 1)[0], ["one"])
+        self.assertIsNone(users.peek("nobody", 10, 1000))
+        # the byte limit counts encoded bytes, not characters
+        accented = UserRegistry()
+        accented.create("carol")
+        for text in ["ééé", "ééé", "ééé"]:
+            accented.enqueue("carol", text, "bob")
+        self.assertEqual(accented.peek("carol", 10, 12)[0], ["ééé", "ééé"])
+        self.assertEqual(accented.peek("carol", 10, 11)[0], ["ééé"])
+
+        # peeking again returns the same batch until it is acknowledged
+        self.assertEqual(users.peek("alice", 2, 1000), (messages, token))
+        # a token handed out before a restart, by another registry, acknowledges nothing
+        other = UserRegistry()
+        other.create("alice")
+        self.assertFalse(users.ack("alice", other.peek("alice", 2, 1000)[1]))
+        self.assertEqual(users.peek("alice", 2, 1000), (messages, token))
+        self.assertTrue(users.ack("alice", token))
+        self.assertEqual(users.peek("alice", 10, 1000)[0], ["three"])
+        self.assertEqual(users.undelivered_count(), 1)
+
+        # drop-oldest makes room in a full inbox, reject turns the new message away
+        for text in ["four", "five", "six"]:
+            self.assertTrue(users.enqueue("alice", text, "bob"))
+        self.assertEqual(users.peek("alice", 10, 1000)[0], ["four", "five", "six"])
+        users.overflow = REJECT
+        self.assertFalse(users.enqueue("alice", "seven", "bob"))
+        self.assertEqual(users.peek("alice", 10, 1000)[0], ["four", "five", "six"])
+        self.assertEqual(users.undelivered_count(), 3)
+        with self.assertRaises(ValueError):
+            UserRegistry(overflow="drop-newest")
+        self.assertEqual(UserRegistry().overflow, DROP_OLDEST)
+
+
+    def test_encoded_list(self):
+        '''
+        Description:
+        - This function tests the list encoding used for account names and messages. It
+        asserts that ASCII and non-ASCII lists, including empty strings, come back unchanged,
+        that slices are views that decode the same items as slicing a list, and that a
+        truncated or corrupt encoding raises ValueError instead of being read.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        for items in [[], ["alice"], ["alice", "", "bob", "carol"], ["héllo", "wörld", "", "✓"]]:
+            decoded = decode_list(encode_list(items))
+            self.assertEqual(len(decoded), len(items))
+            self.assertEqual(list(decoded), items)
+            self.assertEqual([decoded[i] for i in range(-len(items), len(items))], items + items)
+            self.assertEqual(decoded, items)
+
+        items = ["zero", "one", "twö", "three", "four", "five"]
+        decoded = decode_list(encode_list(items))
+        for start, stop in [(1, 4), (0, 0), (4, 2), (-2, None), (None, 100)]:
+            self.assertIsInstance(decoded[start:stop], EncodedList)
+            self.assertEqual(list(decoded[start:stop]), items[start:stop])
+        self.assertEqual(list(decoded[1:5][1:3]), items[2:4])
+        self.assertEqual(decoded[::2], items[::2])
+        self.assertEqual(bytes(decoded.raw(2)), "twö".encode())
+        with self.assertRaises(IndexError):
+            decoded[6]
+
+        # the count, the offset table and the last offset must all fit in the buffer
+        data = encode_list(items)
+        for truncated in [b"", data[:2], data[:4 + 4 * len(items) - 1], data[:-1],
+                          b"\xff\xff\xff\x7f", data[:4] + b"\xff" * (len(data) - 4)]:
+            with self.assertRaises(ValueError):
+                decode_list(truncated)
+
+
+    def test_groups(self):
+        '''
+        Description:
+        - This function tests group messaging. It creates, joins and leaves groups and asserts
+        the statuses returned for missing groups and accounts. It then sends a group message
+        and asserts that it is pushed to the logged in member, queued for the others as one
+        shared string and journaled as a single record, and that a sender who is not a member
+        of the group is refused.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        journal = Mock()
+        users = UserRegistry(journal=journal)
+        for name in ["alice", "bob", "carol", "dave", "eve"]:
+            users.create(name)
+        session = server.ThreadedSession(Mock(), None)
+        with patch.object(server, "USERS", users), patch.object(server, "SESSIONS", {}):
+            self.assertEqual(server.create_group("team", ["alice", "nobody"]),
+                             {"status": Operations.ACCOUNT_DOES_NOT_EXIST})
+            self.assertIsNone(users.members("team"))
+            self.assertEqual(server.create_group("team", ["alice", "bob"]), {"status": Operations.SUCCESS})
+            self.assertEqual(server.create_group("team"), {"status": Operations.ACCOUNT_ALREADY_EXISTS})
+            self.assertEqual(server.join_group("team", "carol"), {"status": Operations.SUCCESS})
+            self.assertEqual(server.join_group("team", "dave"), {"status": Operations.SUCCESS})
+            self.assertEqual(server.join_group("team", "nobody"), {"status": Operations.ACCOUNT_DOES_NOT_EXIST})
+            self.assertEqual(server.join_group("other", "carol"), {"status": Operations.GROUP_DOES_NOT_EXIST})
+            self.assertEqual(server.leave_group("team", "dave"), {"status": Operations.SUCCESS})
+            self.assertEqual(server.leave_group("other", "dave"), {"status": Operations.GROUP_DOES_NOT_EXIST})
+            self.assertEqual(sorted(users.members("team")), ["alice", "bob", "carol"])
+
+            # bob is logged in and gets the message pushed, carol gets it queued
+            server.login("bob", session)
+            journal.reset_mock()
+            self.assertEqual(server.send_group_message("hello team", "alice", "team"),
+                             {"status": Operations.SUCCESS, "info": "2"})
+            frame = deserialize(session.conn.sendall.call_args.args[0])
+            self.assertEqual((frame["operation"], frame["info"]),
+                             (Operations.DELIVER_GROUP_MESSAGE, b"team\nalice\nhello team"))
+            self.assertEqual(users.peek("bob", 10, 1000)[0], [])
+            self.assertEqual(users.peek("carol", 10, 1000)[0], ["hello team"])
+            self.assertEqual(users.peek("alice", 10, 1000)[0], [])
+            self.assertEqual(journal.call_args_list, [call(storage.GROUP_SEND, "alice", "hello team", "carol")])
+
+            # the body is stored once and referenced from every inbox
+            server.unregister_session(session)
+            server.send_group_message("x" * 100, "alice", "team")
+            self.assertIs(users.peek("bob", 10, 1000)[0][-1], users.peek("carol", 10, 1000)[0][-1])
+
+            # only members can send to a group
+            for sender, group in [("dave", "team"), ("nobody", "team"), ("alice", "other")]:
+                journal.reset_mock()
+                self.assertNotEqual(server.send_group_message("spam", sender, group)["status"], Operations.SUCCESS)
+                journal.assert_not_called()
+            self.assertEqual(users.undelivered_count(), 3)
+
+
+    def test_metrics(self):
+        '''
+        Description:
+        - This function tests the metrics layer. It asserts that every value falls in a bucket
+        whose bounds contain it, within the histogram's relative error, that percentiles of a
+        known uniform distribution are accurate to that error, and that snapshot() merges the
+        shards of several threads, including threads that retired their shard when they
+        finished, without losing or double counting anything.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        # each bucket holds the values above the previous bucket's bound, up to its own
+        for value in list(range(5000)) + [2 ** 20 - 1, 2 ** 20, 2 ** 20 + 1, 10 ** 9]:
+            index = metrics.bucket_index(value)
+            self.assertLessEqual(value, metrics.bucket_value(index))
+            if index:
+                self.assertLess(metrics.bucket_value(index - 1), value)
+            self.assertLessEqual(metrics.bucket_value(index) - value, value / metrics.SUB_BUCKETS)
+        # values below SUB_BUCKETS are counted exactly
+        self.assertEqual([metrics.bucket_value(metrics.bucket_index(value)) for value in range(metrics.SUB_BUCKETS)],
+                         list(range(metrics.SUB_BUCKETS)))
+
+        histogram = metrics.Histogram()
+        for value in range(1, 100001):
+            histogram.record(value)
+        for p in metrics.PERCENTILES:
+            exact = p / 100 * 100000
+            self.assertGreaterEqual(histogram.percentile(p), exact)
+            self.assertLessEqual(histogram.percentile(p), exact * (1 + 1 / metrics.SUB_BUCKETS))
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100000)
+        self.assertAlmostEqual(summary["mean_us"], 50000.5)
+        self.assertEqual(metrics.Histogram().percentile(50), 0)
+
+        # the shards of running threads and of retired ones are merged into one report
+        registry = metrics.Metrics()
+        barrier = threading.Barrier(4)
+
+        def handler(retire):
+            for value in range(1000):
+                # half a microsecond over, so that truncating to whole microseconds gives `value`
+                registry.observe("LOGIN", (value + 0.5) / 1000000, 10, 20)
+            registry.incr("connections_opened")
+            if retire:
+                registry.retire()
+            barrier.wait()
+
+        threads = [threading.Thread(target=handler, args=(index % 2,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(registry.shards), 2)
+        report = registry.snapshot()
+        self.assertEqual(report["counters"], {"connections_opened": 4, "requests": 4000,
+                                              "request_payload_bytes": 40000, "response_bytes": 80000})
+        expected = metrics.Histogram()
+        for value in list(range(1000)) * 4:
+            expected.record(value)
+        self.assertEqual(report["latency"], {"LOGIN": expected.summary()})
+        # retiring again, or from a thread that recorded nothing, changes nothing
+        registry.retire()
+        self.assertEqual(registry.snapshot(), report)
+
+
+    def test_hello_compression(self):
+        '''
+        Description:
+        - This function tests compression negotiation with HELLO. It asserts that the server
+        picks the first algorithm in the client's list that it allows, with the client's
+        threshold, or none if nothing matches, and that once compression is negotiated only
+        responses at least as long as the threshold are compressed, and decompress unchanged.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        def hello(session, info):
+            frame = deserialize(server.handle_request({"operation": Operations.HELLO, "request_id": 1,
+                                                       "info": info.encode()}, session))
+            self.assertEqual(frame["operation"], Operations.SUCCESS)
+            return frame["info"].decode()
+
+        session = server.ThreadedSession(Mock(), None)
+        with patch.object(server, "COMPRESSION", ["zlib-fast"]):
+            self.assertEqual(hello(session, "brotli,zlib"), "none\n")
+            self.assertIsNone(session.compression)
+            self.assertEqual(hello(session, "brotli,zlib-fast,zlib\n100"), "zlib-fast\n100")
+            self.assertEqual(session.compression, ("zlib-fast", 100))
+
+        users = UserRegistry()
+        for index in range(50):
+            users.create("user-{:04d}".format(index))
+        with patch.object(server, "USERS", users):
+            for limit, compressed in [(2, False), (50, True)]:
+                request = {"operation": Operations.LIST_ACCOUNT, "request_id": 2,
+                           "info": "user-\n\n{}".format(limit).encode()}
+                data = server.handle_request(request, session)
+                version, opcode, flags, request_id, length = HEADER.unpack_from(data)
+                self.assertEqual(bool(flags & FLAG_COMPRESSED), compressed)
+                frame = FrameDecoder().feed(data)[0]
+                self.assertEqual(list(decode_list(frame["info"])), users.search("user-", "", limit)[0])
+
+
+    def test_connection_pool(self):
+        '''
+        Description:
+        - This function tests the client's connection pool. It asserts that connections are
+        opened lazily up to the pool size, that a returned connection is handed out again
+        instead of opening another, that a caller waits for a connection when all of them are
+        in use, and that a connection the server closed is dropped from the pool.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        accepted = []
+
+        def handler(conn, addr):
+            accepted.append(conn)
+            decoder = FrameDecoder()
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                for request in decoder.feed(data):
+                    conn.sendall(serialize({"operation": Operations.SUCCESS, "info": ""},
+                                           request_id=request["request_id"]))
+            conn.close()
+
+        pool = client.ConnectionPool(self.serve(handler), size=2)
+        self.addCleanup(pool.close)
+        self.assertEqual(pool.opened, 0)
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+                self.assertEqual(pool.opened, 2)
+                # with both connections in use, a third caller waits for one to be returned
+                borrowed = []
+                waiter = threading.Thread(target=lambda: borrowed.append(pool._acquire()))
+                waiter.start()
+                waiter.join(0.2)
+                self.assertTrue(waiter.is_alive())
+            waiter.join(5)
+            self.assertEqual(borrowed, [second])
+            pool.idle.put(second)
+        # connections are reused, most recently returned first
+        with pool.connection() as conn:
+            self.assertIs(conn, first)
+            self.assertEqual(conn.request({"operation": Operations.LOGIN, "info": "alice"})["operation"],
+                             Operations.SUCCESS)
+        self.assertEqual(pool.opened, 2)
+        self.assertEqual(len(accepted), 2)
+
+        # a connection that was closed is not put back, and a new one is opened in its place
+        with pool.connection() as conn:
+            conn.close()
+        self.assertEqual(pool.opened, 1)
+        with pool.connection() as conn:
+            self.assertIsNot(conn, first)
+            self.assertIs(conn, second)
+            with pool.connection() as third:
+                self.assertNotIn(third, [first, second])
+        self.assertEqual(len(accepted), 3)
+
+
+    def test_pipelined_responses(self):
+        '''
+        Description:
+        - This function tests that a connection matches responses to requests by request id.
+        The server reads a batch of requests and answers them in reverse order, with a push
+        frame in between, and the test asserts that every future resolves with the response
+        to its own request, that the push goes to on_push, and that requests still waiting
+        when the server closes the connection fail instead of hanging.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        def handler(conn, addr):
+            decoder = FrameDecoder()
+            requests = []
+            while len(requests) < 3:
+                requests += decoder.feed(conn.recv(4096))
+            responses = [serialize({"operation": Operations.SUCCESS, "info": request["info"]},
+                                   request_id=request["request_id"]) for request in requests]
+            responses.insert(1, serialize({"operation": Operations.DELIVER_MESSAGE, "info": "bob\nhi"}))
+            conn.sendall(b"".join(reversed(responses)))
+            # the fourth request is never answered
+            while len(requests) < 4:
+                requests += decoder.feed(conn.recv(4096))
+            conn.close()
+
+        pushes = []
+        conn = client.Connection(self.serve(handler), on_push=pushes.append)
+        self.addCleanup(conn.close)
+        futures = conn.submit([{"operation": Operations.LOGIN, "info": name} for name in ["a", "b", "c"]])
+        self.assertEqual([future.result(5)["info"] for future in futures], [b"a", b"b", b"c"])
+        self.assertEqual(len({future.result()["request_id"] for future in futures}), 3)
+        self.assertEqual([push["info"] for push in pushes], [b"bob\nhi"])
+        with self.assertRaises(ConnectionError):
+            conn.request({"operation": Operations.LOGIN, "info": "d"})
+        with self.assertRaises(ConnectionError):
+            conn.submit([{"operation": Operations.LOGIN, "info": "e"}])
+
+
+    def test_large_pipeline(self):
+        '''
+        Description:
+        - This function tests a pipeline much larger than the socket buffers against the
+        threaded server. The server stops reading requests while it can't write responses,
+        so the client has to keep reading responses while it is still writing requests;
+        the test asserts that every response arrives, in order, instead of both ends
+        waiting on each other forever.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        users = UserRegistry()
+        for index in range(300):
+            users.create("user-{:04d}".format(index))
+        with patch.object(server, "USERS", users), patch.object(server, "LOG_REQUESTS", False):
+            addr = self.serve(server.handle_client, buffer_size=16 * 1024)
+            chat = client.ChatClient(addr, pool_size=1)
+            self.addCleanup(chat.close)
+            with chat.pool.connection() as conn:
+                conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16 * 1024)
+                conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+
+            results = []
+            count = 5000
+            sender = threading.Thread(target=lambda: results.append(
+                chat.pipeline([(Operations.LIST_ACCOUNT, "user\n\n300")] * count)), daemon=True)
+            sender.start()
+            sender.join(30)
+            self.assertFalse(sender.is_alive(), "the pipeline deadlocked")
+            responses = results[0]
+            self.assertEqual(len(responses), count)
+            self.assertEqual({response["operation"] for response in responses}, {Operations.LIST_OF_ACCOUNTS})
+            self.assertEqual([len(decode_list(responses[i]["info"])) for i in [0, -1]], [300, 300])
+            self.assertEqual(chat.send_messages([("hi", "user-0000", "user-0001")] * 3), [0, 0, 0])
+
+
+    def test_push_delivery(self):
+        '''
+        Description:
+        - This function tests push delivery on the threaded server. It asserts that a message
+        for a logged in user is written to their connection instead of queued, and that when
+        the receiver has stopped reading, the push times out, the connection is shut down and
+        the message is queued, with later messages queued without waiting again.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        users = UserRegistry()
+        for name in ["alice", "bob", "carol"]:
+            users.create(name)
+        with patch.object(server, "USERS", users), patch.object(server, "SESSIONS", {}):
+            reading, bob = socket.socketpair()
+            self.addCleanup(reading.close)
+            self.addCleanup(bob.close)
+            server.login("bob", server.ThreadedSession(reading, None))
+            self.assertEqual(server.send_message("hi bob", "alice", "bob"), {"status": Operations.SUCCESS})
+            frame = FrameDecoder().feed(bob.recv(4096))[0]
+            self.assertEqual((frame["operation"], frame["request_id"], frame["info"]),
+                             (Operations.DELIVER_MESSAGE, 0, b"alice\nhi bob"))
+            self.assertEqual(users.peek("bob", 10, 1000)[0], [])
+
+            # carol's client never reads, so her socket buffers fill up and the push times out
+            stalled, carol = socket.socketpair()
+            self.addCleanup(stalled.close)
+            self.addCleanup(carol.close)
+            stalled.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+            session = server.ThreadedSession(stalled, None, send_timeout=0.2)
+            server.login("carol", session)
+            large = "x" * (1024 * 1024)
+            start = time.monotonic()
+            self.assertEqual(server.send_message(large, "alice", "carol"), {"status": Operations.SUCCESS})
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertTrue(session.closed)
+            self.assertEqual(users.peek("carol", 10, 10 ** 7)[0], [large])
+            # the shut down connection is skipped straight away
+            start = time.monotonic()
+            self.assertEqual(server.send_message("again", "alice", "carol"), {"status": Operations.SUCCESS})
+            self.assertLess(time.monotonic() - start, 0.2)
+            self.assertEqual(users.peek("carol", 10, 10 ** 7)[0], [large, "again"])
+            # the client sees the end of the stream once it reads what was written
+            while carol.recv(65536):
+                pass
+
+
+    def test_router_deliver(self):
+        '''
+        Description:
+        - This function tests how worker processes deliver a message to a receiver who is
+        logged in on some of them. It sets up three worker replicas, applies a message on
+        each and feeds the events they publish back to all of them in one order, as the hub
+        does. It asserts that the message is queued by every replica before the sender is
+        answered, that every worker hosting the receiver pushes to its own sessions, and that
+        the message is taken off every queue once one of them reports a push, or stays queued
+        if none could push it. A message the receiver's inbox rejects is reported to the
+        sender and not pushed.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+
+        replicas = []
+        for worker in range(3):
+            router = Router(worker, Mock(), Mock())
+            router.publish = Mock()
+            router.users = UserRegistry()
+            router.users.create("alice")
+            router.users.create("bob")
+            # bob is logged in on workers 0 and 2
+            router.online = {"bob": {(0, 10), (2, 20)}}
+            replicas.append(router)
+
+        def inboxes():
+            return [router.users.peek("bob", 10, 1000)[0] for router in replicas]
+
+        def send(pushed, status=Operations.SUCCESS):
+            # apply the message on every worker, with push_message answering for that worker's sessions
+            events = []
+            for router in replicas:
+                with patch.object(server, "ROUTER", router), patch.object(server, "USERS", router.users), \
+                        patch.object(server, "push_message", return_value=pushed.get(router.worker)) as push:
+                    self.assertEqual(server.send_message("hi", "alice", "bob"), {"status": status})
+                self.assertEqual(push.called, router.worker in pushed)
+                events += [call.args[0] for call in router.publish.call_args_list]
+                router.publish.reset_mock()
+            # the sender has been answered, and the message is already queued everywhere
+            queued = inboxes()
+            if status == Operations.SUCCESS:
+                self.assertEqual([inbox[-1:] for inbox in queued], [["hi"]] * 3)
+            for event in events:
+                for router in replicas:
+                    with patch.object(server, "USERS", router.users):
+                        router.apply(event)
+            return inboxes()
+
+        # one worker's session took the message, so it is retracted, whatever the order of the results
+        self.assertEqual(send({0: False, 2: True}), [[], [], []])
+        self.assertEqual(send({0: True, 2: False}), [[], [], []])
+        self.assertEqual(send({0: True, 2: True}), [[], [], []])
+        # neither could push it, so it stays queued on every replica
+        self.assertEqual(send({0: False, 2: False}), [["hi"], ["hi"], ["hi"]])
+        self.assertEqual([router.deliveries for router in replicas], [{}, {}, {}])
+
+        # with bob logged out everywhere, the message is queued without any push
+        for router in replicas:
+            router.online = {}
+        self.assertEqual(send({}), [["hi", "hi"]] * 3)
+
+        # a full inbox that rejects new messages is reported to the sender, and nothing is pushed
+        for router in replicas:
+            router.online = {"bob": {(0, 10), (2, 20)}}
+            router.users.inbox_cap = 2
+            router.users.overflow = REJECT
+        self.assertEqual(send({}, Operations.INBOX_FULL), [["hi", "hi"], ["hi", "hi"], ["hi", "hi"]])
+        self.assertEqual([router.deliveries for router in replicas], [{}, {}, {}])
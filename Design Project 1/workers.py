@@ -0,0 +1,265 @@
+"""
+Multi-process mode for the chat server.
+
+The parent process starts --workers processes. Every worker runs the async
+server on the same port with SO_REUSEPORT, so the kernel spreads incoming
+connections across them, and keeps a full replica of the accounts and
+inboxes so that reads (LIST_ACCOUNT, VIEW_UNDELIVERED_MESSAGES) never leave
+the worker.
+
+Requests that change that state are not applied where they arrive. The
+worker sends them to the hub in the parent, which broadcasts every event to
+all workers in one global order; each worker applies them in that order, so
+the replicas stay identical and the worker the client is connected to
+answers once its own event comes back. The same stream carries the routing
+table: which workers have a session logged in as which user. A message for
+a user who is logged in is queued by every replica before the sender is
+answered, pushed by every worker holding a connection for the receiver,
+and taken off the queue again as soon as one of them reports a push.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+
+import server
+from operations import Operations
+
+# Requests applied through the hub. Everything else is answered from the local replica.
+SEQUENCED = frozenset([
+    Operations.LOGIN,
+    Operations.CREATE_ACCOUNT,
+    Operations.DELETE_ACCOUNT,
+    Operations.SEND_MESSAGE,
+    Operations.ACK_MESSAGES,
+    Operations.CREATE_GROUP,
+    Operations.JOIN_GROUP,
+    Operations.LEAVE_GROUP,
+    Operations.SEND_GROUP_MESSAGE,
+])
+
+
+class Hub:
+    """
+    Runs in the parent. One thread per worker reads its events and appends
+    them, under a single lock, to every worker's outbox; one thread per
+    worker writes its outbox. Taking the lock once per event is what puts
+    all events in one order, and the outboxes keep a worker that is slow to
+    read from stalling the others.
+    """
+
+    def __init__(self, connections):
+        self.connections = connections
+        self.outboxes = [queue.SimpleQueue() for _ in connections]
+        self.lock = threading.Lock()
+
+    def start(self):
+        for conn, outbox in zip(self.connections, self.outboxes):
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+            threading.Thread(target=self._write, args=(conn, outbox), daemon=True).start()
+
+    def _read(self, conn):
+        while True:
+            try:
+                event = conn.recv()
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                for outbox in self.outboxes:
+                    outbox.put(event)
+
+    def _write(self, conn, outbox):
+        while True:
+            try:
+                conn.send(outbox.get())
+            except OSError:
+                return
+
+
+class Router:
+    """
+    A worker's end of the hub. Events are sent from a background thread so
+    the event loop never blocks on the pipe, and received on the event loop
+    itself, which is the only place the replica is changed.
+
+    Events:
+        ("request", worker, correlation, opcode, request_id, info, session_key)
+        ("offline", username, worker, session_key)
+        ("pushed", delivery, worker, accepted)
+    """
+
+    sequenced = SEQUENCED
+
+    def __init__(self, worker, conn, loop):
+        self.worker = worker
+        self.conn = conn
+        self.loop = loop
+        # username -> set of (worker, session_key) logged in as that user
+        self.online = {}
+        # delivery id -> [workers yet to report, receiver, sequence number in the inbox] for pushes in flight
+        self.deliveries = {}
+        self.delivery_ids = itertools.count(1)
+        # correlation id -> (future, session) for requests sent from this worker
+        self.pending = {}
+        self.correlations = itertools.count(1)
+        self.outbox = queue.SimpleQueue()
+        threading.Thread(target=self._send_loop, daemon=True).start()
+        loop.add_reader(conn.fileno(), self._receive)
+
+    def _send_loop(self):
+        while True:
+            self.conn.send(self.outbox.get())
+
+    def publish(self, event):
+        self.outbox.put(event)
+
+    def submit(self, request, session):
+        """
+        Sends a request to be applied by every worker.
+
+        Returns:
+            asyncio.Future: resolves to this worker's response frame.
+        """
+        correlation = next(self.correlations)
+        future = self.loop.create_future()
+        self.pending[correlation] = (future, session)
+        self.publish(("request", self.worker, correlation, request["operation"].value,
+                      request["request_id"], bytes(request["info"]), id(session)))
+        return future
+
+    def session_closed(self, username, session):
+        self.publish(("offline", username, self.worker, id(session)))
+
+    def deliver(self, msg, sender, receiver, frame=None):
+        """
+        Called while a SEND_MESSAGE is applied. If `receiver` is logged in
+        anywhere, every replica queues the message first, so the sender is
+        only answered once it can't be lost whatever happens to the pushes.
+        Every worker with a session for `receiver` then pushes the message
+        to its own sessions and reports whether any of them accepted it.
+        Deliveries are numbered in the order they are applied, which is the
+        same on every worker, so all replicas retract the queued message at
+        the same point, on the first report of a push. A receiver who was
+        pushed a message they also fetched before it was retracted sees it
+        twice.
+
+        Returns:
+            bool: True if the message was queued and is being pushed; False if
+            the receiver is logged in nowhere, or their inbox rejected the
+            message, in which case the caller's own enqueue reports it.
+        """
+        hosts = self.online.get(receiver)
+        if not hosts:
+            return False
+        seq = server.USERS.enqueue(receiver, msg, sender)
+        if not seq:
+            return False
+        delivery = next(self.delivery_ids)
+        workers = {worker for worker, _ in hosts}
+        self.deliveries[delivery] = [workers, receiver, seq]
+        if self.worker in workers:
+            self.publish(("pushed", delivery, self.worker, server.push_message(msg, sender, receiver, frame)))
+        return True
+
+    def _receive(self):
+        while self.conn.poll():
+            try:
+                event = self.conn.recv()
+            except EOFError:
+                self.loop.remove_reader(self.conn.fileno())
+                return
+            self.apply(event)
+
+    def apply(self, event):
+        kind = event[0]
+        if kind == "request":
+            _, origin, correlation, opcode, request_id, info, session_key = event
+            request = {"operation": Operations(opcode), "request_id": request_id, "info": info}
+            if origin == self.worker:
+                future, session = self.pending.pop(correlation)
+                response = server.handle_request(request, session)
+                if not future.cancelled():
+                    future.set_result(response)
+            else:
+                server.handle_request(request)
+            username = info.decode(server.FORMAT, "replace")
+            if request["operation"] == Operations.LOGIN and username in server.USERS:
+                self.online.setdefault(username, set()).add((origin, session_key))
+            elif request["operation"] == Operations.DELETE_ACCOUNT:
+                self.online.pop(username, None)
+        elif kind == "offline":
+            _, username, origin, session_key = event
+            hosts = self.online.get(username)
+            if hosts is not None:
+                hosts.discard((origin, session_key))
+                if not hosts:
+                    del self.online[username]
+        elif kind == "pushed":
+            _, delivery, origin, accepted = event
+            pending = self.deliveries.get(delivery)
+            if pending is None:
+                return
+            workers, receiver, seq = pending
+            workers.discard(origin)
+            if accepted:
+                server.USERS.retract(receiver, seq)
+            if accepted or not workers:
+                del self.deliveries[delivery]
+
+
+async def watch_parent(parent):
+    while os.getppid() == parent:
+        await asyncio.sleep(1)
+
+
+async def serve_worker(index, addr, conn):
+    server.ROUTER = Router(index, conn, asyncio.get_running_loop())
+    serving = asyncio.ensure_future(server.serve_async(addr, reuse_port=True))
+    # a worker whose parent died, even by SIGKILL, stops serving instead of holding the port
+    await asyncio.wait([serving, asyncio.ensure_future(watch_parent(os.getppid()))],
+                       return_when=asyncio.FIRST_COMPLETED)
+    serving.cancel()
+
+
+def run_worker(index, addr, conn, settings):
+    server.LOG_REQUESTS = settings["log_requests"]
+    server.USERS.inbox_cap = settings["inbox_cap"]
+    server.USERS.overflow = settings["overflow"]
+    server.COMPRESSION = settings["compression"]
+    # ack tokens are handed out by one worker and applied by all of them
+    server.USERS.epoch = settings["epoch"]
+    asyncio.run(serve_worker(index, addr, conn))
+
+
+def start_workers(addr, count, settings):
+    """
+    Starts `count` worker processes listening on `addr` and runs the hub until they exit.
+    """
+    connections = []
+    processes = []
+    for index in range(count):
+        parent_end, worker_end = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=run_worker, args=(index, addr, worker_end, settings),
+                                          name="chat-worker-{}".format(index), daemon=True)
+        process.start()
+        worker_end.close()
+        connections.append(parent_end)
+        processes.append(process)
+    Hub(connections).start()
+    print("[WORKERS] {} workers sharing port {}".format(count, addr[1]))
+    # exit through the finally below on SIGTERM too, so no worker outlives the hub
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
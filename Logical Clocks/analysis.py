@@ -0,0 +1,267 @@
+"""
+Analysis of logical clock experiment output.
+
+Loads every run under an experiment tree (any directory holding
+csvs/log_<machine>_<clock speed>.csv files or binary traces in traces/, e.g.
+no_manipulation or a sweep directory) into one pandas DataFrame, with one
+row per event. The first load parses the csv files, memory-maps the traces
+and saves the columns as numpy arrays in .analysis_cache.npz at the top of
+the tree; later loads read the arrays back as long as no file has changed
+since.
+
+The metrics are computed on whole columns at once, grouped by run and
+machine, instead of looping over rows:
+
+- jump_sizes / jump_summary: how far the logical clock moves per event
+- drift: how far apart the machines' logical clocks are, second by second
+- queue_percentiles: queue length percentiles per machine
+- event_rates: send, receive and internal event rates per clock speed
+
+Example:
+    python analysis.py no_manipulation clock_variation internal_event_variation
+"""
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import event_trace
+from event_trace import EVENT_TYPES
+
+CACHE_NAME = ".analysis_cache.npz"
+LOG_NAME = re.compile(r"log_(\d+)_(\d+)\.(csv|trace)$")
+# the layout of a trace record, for reading traces straight into arrays
+TRACE_FIELDS = [("timestamp", "<f8"), ("logical_clock_time", "<u8"), ("queue_length", "<u4"),
+                ("peer", "<i4"), ("event_code", "u1")]
+COLUMNS = ["timestamp", "logical_clock_time", "queue_length", "event_type"]
+# so that a csv file with only a header reads as numbers too, not as object columns
+CSV_DTYPES = {"timestamp": np.float64, "logical_clock_time": np.int64, "queue_length": np.int32, "event_type": str}
+
+
+def find_runs(root):
+    """
+    Finds every csv file and trace of an experiment tree. A run with both uses its traces.
+
+    Args:
+        root (str): the top of the tree.
+
+    Returns:
+        list: (run, machine, clock speed, path) for every file, where run is the path of the
+        run's directory relative to `root`, sorted so every load sees the files in the same order.
+    """
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        if os.path.basename(directory) not in ("csvs", "traces"):
+            continue
+        run = os.path.relpath(os.path.dirname(directory), root)
+        for filename in filenames:
+            match = LOG_NAME.match(filename)
+            if match:
+                key = (run, int(match.group(1)), int(match.group(2)))
+                if match.group(3) == "trace" or key not in files:
+                    files[key] = os.path.join(directory, filename)
+    return sorted(key + (path,) for key, path in files.items())
+
+
+def signature(files):
+    """
+    Identifies the contents of the tree by the path, size and modification time of each file.
+    """
+    return json.dumps([[path, os.path.getsize(path), os.path.getmtime(path)] for _, _, _, path in files])
+
+
+def read_trace(path):
+    """
+    Reads a binary trace into a DataFrame through a memory map, without parsing it record by record.
+    The vectors of a vector clock's trace are skipped over.
+    """
+    with open(path, "rb") as tracefile:
+        _, _, entries = event_trace.read_header(tracefile.read(event_trace.HEADER.size))
+    dtype = np.dtype(TRACE_FIELDS + ([("vector", "<u8", (entries,))] if entries else []))
+    records = (os.path.getsize(path) - event_trace.HEADER.size) // dtype.itemsize
+    if records <= 0:
+        return pd.DataFrame({column: [] for column in COLUMNS})
+    data = np.memmap(path, dtype=dtype, mode="r", offset=event_trace.HEADER.size, shape=(records,))
+    return pd.DataFrame({
+        "timestamp": data["timestamp"], "logical_clock_time": data["logical_clock_time"].astype(np.int64),
+        "queue_length": data["queue_length"],
+        "event_type": pd.Categorical.from_codes(data["event_code"], categories=EVENT_TYPES),
+    })
+
+
+def read_logs(files):
+    frames = []
+    for run, machine, clock_speed, path in files:
+        frame = read_trace(path) if path.endswith(".trace") else pd.read_csv(path, usecols=COLUMNS, dtype=CSV_DTYPES)
+        if frame.empty:
+            # a machine that recorded nothing adds no rows, and would only make concat guess the column types
+            continue
+        frame["run"] = run
+        frame["machine"] = machine
+        frame["clock_speed"] = clock_speed
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame({"run": pd.Series(dtype=str), "machine": pd.Series(dtype=np.int32),
+                             "clock_speed": pd.Series(dtype=np.int32),
+                             **{column: pd.Series(dtype=dtype) for column, dtype in CSV_DTYPES.items()}})
+    return pd.concat(frames, ignore_index=True)
+
+
+def to_arrays(frame):
+    runs = pd.Categorical(frame["run"])
+    events = pd.Categorical(frame["event_type"], categories=EVENT_TYPES)
+    return {
+        "run_codes": runs.codes.astype(np.int32), "runs": np.asarray(runs.categories, dtype=str),
+        "machine": frame["machine"].to_numpy(np.int32), "clock_speed": frame["clock_speed"].to_numpy(np.int32),
+        "timestamp": frame["timestamp"].to_numpy(np.float64),
+        "logical_clock_time": frame["logical_clock_time"].to_numpy(np.int64),
+        "queue_length": frame["queue_length"].to_numpy(np.int32),
+        "event_codes": events.codes.astype(np.int8),
+    }
+
+
+def from_arrays(arrays):
+    return pd.DataFrame({
+        "run": pd.Categorical.from_codes(arrays["run_codes"], categories=arrays["runs"]),
+        "machine": arrays["machine"], "clock_speed": arrays["clock_speed"],
+        "timestamp": arrays["timestamp"], "logical_clock_time": arrays["logical_clock_time"],
+        "queue_length": arrays["queue_length"],
+        "event_type": pd.Categorical.from_codes(arrays["event_codes"], categories=EVENT_TYPES),
+    })
+
+
+def load_experiment(root, use_cache=True):
+    """
+    Loads every run of an experiment tree.
+
+    Args:
+        root (str): the top of the tree.
+        use_cache (bool): read and write the cached arrays in `root`. Defaults to True.
+
+    Returns:
+        pandas.DataFrame: one row per event, with columns run, machine, clock_speed, timestamp,
+        logical_clock_time, queue_length and event_type, in the order the events were recorded.
+    """
+    files = find_runs(root)
+    key = signature(files)
+    cache = os.path.join(root, CACHE_NAME)
+    if use_cache and os.path.exists(cache):
+        with np.load(cache) as arrays:
+            if str(arrays["signature"]) == key:
+                return from_arrays(arrays)
+    # uncached loads go through the same arrays, so they have the same column types as cached ones
+    arrays = to_arrays(read_logs(files))
+    if use_cache:
+        np.savez(cache, signature=np.array(key), **arrays)
+    return from_arrays(arrays)
+
+
+def load_experiments(roots, use_cache=True):
+    """
+    Loads several experiment trees into one DataFrame, with each run named after its tree.
+    """
+    frames = []
+    for root in roots:
+        frame = load_experiment(root, use_cache)
+        frame["run"] = [os.path.normpath(os.path.join(root, run)) for run in frame["run"].astype(str)]
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    frame["run"] = frame["run"].astype("category")
+    return frame
+
+
+def jump_sizes(frame):
+    """
+    Returns how far each event moved its machine's logical clock: the difference from the
+    machine's previous event, or the clock time itself for its first event.
+    """
+    times = frame["logical_clock_time"]
+    return times.groupby([frame["run"], frame["machine"]], observed=True).diff().fillna(times).astype(np.int64)
+
+
+def jump_summary(frame):
+    """
+    Summarises the logical clock jumps of every machine.
+
+    Returns:
+        pandas.DataFrame: per run and machine, its clock speed, the mean and largest jump, and
+        the share of events that moved the clock by more than 1.
+    """
+    jumps = jump_sizes(frame)
+    grouped = jumps.groupby([frame["run"], frame["machine"], frame["clock_speed"]], observed=True)
+    return pd.DataFrame({"mean_jump": grouped.mean(), "max_jump": grouped.max(),
+                         "jumped": (jumps > 1).groupby([frame["run"], frame["machine"], frame["clock_speed"]],
+                                                       observed=True).mean()})
+
+
+def jump_distribution(frame):
+    """
+    Returns the number of events with each jump size, per clock speed.
+    """
+    jumps = jump_sizes(frame).rename("jump")
+    return jumps.groupby([frame["clock_speed"], jumps], observed=True).size().unstack(fill_value=0)
+
+
+def drift(frame, interval=1.0):
+    """
+    Measures how far apart the machines of each run are against wall time.
+
+    Args:
+        frame (pandas.DataFrame): events, from load_experiment().
+        interval (float): width of the wall time buckets, in seconds. Defaults to 1.
+
+    Returns:
+        pandas.DataFrame: per run and bucket (seconds since the run's first event), the lowest
+        and highest logical clock time reached by any machine by the end of the bucket, and the
+        drift between them.
+    """
+    start = frame.groupby("run", observed=True)["timestamp"].transform("min")
+    buckets = ((frame["timestamp"] - start) // interval * interval).rename("elapsed")
+    latest = frame["logical_clock_time"].groupby([frame["run"], buckets, frame["machine"]], observed=True).max()
+    # a machine with no events in a bucket is still at the time it last reached
+    latest = latest.unstack("machine").groupby(level="run", observed=True).ffill()
+    result = pd.DataFrame({"slowest": latest.min(axis=1), "fastest": latest.max(axis=1)})
+    result["drift"] = result["fastest"] - result["slowest"]
+    return result
+
+
+def queue_percentiles(frame, percentiles=(50, 90, 99)):
+    """
+    Returns the given percentiles of the queue length, per run, machine and clock speed.
+    """
+    grouped = frame.groupby(["run", "machine", "clock_speed"], observed=True)["queue_length"]
+    result = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    result.columns = ["p{:g}".format(p) for p in percentiles]
+    return result
+
+
+def event_rates(frame):
+    """
+    Returns the mean number of events of each type per second, by clock speed.
+    """
+    grouped = frame.groupby(["run", "machine"], observed=True)["timestamp"]
+    seconds = (grouped.max() - grouped.min()).clip(lower=1e-9)
+    counts = frame.groupby(["run", "machine", "clock_speed", "event_type"], observed=False).size()
+    counts = counts.unstack("event_type", fill_value=0)
+    counts = counts[counts.sum(axis=1) > 0] # drop the run, machine and speed combinations that do not exist
+    rates = counts.div(seconds.reindex(counts.index.droplevel("clock_speed")).to_numpy(), axis=0)
+    return rates.groupby(level="clock_speed").mean()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse the output of logical clock experiments")
+    parser.add_argument("roots", nargs="+", help="experiment directories, e.g. no_manipulation")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="always parse the csv files, and do not write the cache")
+    args = parser.parse_args()
+
+    events = load_experiments(args.roots, args.use_cache)
+    pd.set_option("display.width", 160)
+    print("{} events from {} runs\n".format(len(events), events["run"].nunique()))
+    print("Logical clock jumps\n{}\n".format(jump_summary(events)))
+    print("Queue length percentiles\n{}\n".format(queue_percentiles(events)))
+    print("Events per second by clock speed\n{}\n".format(event_rates(events)))
+    print("Largest drift between machines\n{}".format(drift(events)["drift"].groupby(level="run", observed=True).max()))
@@ -0,0 +1,169 @@
+"""
+Binary event traces.
+
+A trace holds one machine's events as fixed-width records, so it is a
+fraction of the size of the csv file and can be memory-mapped and read
+without parsing. A trace file starts with a header:
+
+    magic (4 bytes, b"LCTR"), version (2), machine id (4), clock speed (4),
+    vector entries (4)
+
+followed by one record per event, all little-endian and unpadded:
+
+    wall time (float64), logical clock time (uint64), queue length (uint32),
+    peer (int32), event type (uint8), vector (uint64 per vector entry)
+
+The peer is the sender of a received message, or the neighbour a message
+was sent to; it is NO_PEER for internal events and for messages sent to
+more than one neighbour. The vector is the machine's vector time after the
+event when it keeps a vector clock; other clocks write no vector entries.
+Traces are written by Machine with --trace binary to
+traces/log_<machine>_<clock speed>.trace, and `python event_trace.py DIR`
+converts the traces of a run to the usual csvs/log_<machine>_<clock speed>.csv
+files, whose vector column holds the vector's entries separated by spaces.
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+
+MAGIC = b"LCTR"
+VERSION = 2
+HEADER = struct.Struct("<4sHIII")
+RECORD = struct.Struct("<dQIiB")
+CSV_COLUMNS = ["timestamp", "logical_clock_time", "queue_length", "event_type"]
+NO_PEER = -1
+EVENT_TYPES = ["Send", "Received", "Internal"]
+EVENT_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+
+
+def trace_path(log_directory, name, clock_speed):
+    return f"{log_directory}/traces/log_{name}_{clock_speed}.trace"
+
+
+def write_header(tracefile, name, clock_speed, entries=0):
+    tracefile.write(HEADER.pack(MAGIC, VERSION, name, clock_speed, entries))
+
+
+def record_struct(entries=0):
+    """
+    Returns the layout of a record that carries a vector of `entries` entries.
+    """
+    return struct.Struct("{}{}Q".format(RECORD.format, entries)) if entries else RECORD
+
+
+def csv_header(vector=False):
+    """
+    Returns the header row of a machine's csv file, with a vector column if the machine keeps a vector clock.
+    """
+    return CSV_COLUMNS + ["vector"] if vector else list(CSV_COLUMNS)
+
+
+def format_vector(vector):
+    return " ".join(map(str, vector))
+
+
+def parse_vector(text):
+    return [int(entry) for entry in text.split()]
+
+
+def pack_records(timestamps, clock_times, queue_lengths, event_types, peers, vectors=None):
+    """
+    Packs a batch of events, given as columns, into consecutive records.
+
+    Args:
+        vectors (list): the vector time of every event, for a trace of a vector clock. Defaults to None.
+
+    Returns:
+        bytearray: the records, ready to append to a trace file.
+    """
+    record = record_struct(len(vectors[0]) if vectors else 0)
+    records = bytearray(record.size * len(timestamps))
+    for index, row in enumerate(zip(timestamps, clock_times, queue_lengths, peers, event_types)):
+        record.pack_into(records, index * record.size, row[0], row[1], row[2], row[3], EVENT_CODES[row[4]],
+                         *(vectors[index] if vectors else ()))
+    return records
+
+
+def read_header(data):
+    """
+    Returns:
+        tuple: the machine id, its clock speed and the number of vector entries in each record.
+    """
+    magic, version, name, clock_speed, entries = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a trace file")
+    if version != VERSION:
+        raise ValueError("Trace versions do not match up")
+    return name, clock_speed, entries
+
+
+def read_trace(path):
+    """
+    Reads a trace file through a memory map.
+
+    Args:
+        path (str): the trace file.
+
+    Returns:
+        tuple: the machine id, its clock speed, and a list of (timestamp, logical clock time,
+        queue length, event type, peer, vector) for every event, where vector is a tuple, or
+        None if the trace holds no vectors.
+    """
+    with open(path, "rb") as tracefile, mmap.mmap(tracefile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        name, clock_speed, entries = read_header(data)
+        record = record_struct(entries)
+        body = memoryview(data)[HEADER.size:]
+        # a writer that was killed can leave part of a record at the end; it is ignored
+        body = body[:len(body) - len(body) % record.size]
+        events = [(timestamp, clock_time, queue_length, EVENT_TYPES[code], peer, tuple(vector) if entries else None)
+                  for timestamp, clock_time, queue_length, peer, code, *vector in record.iter_unpack(body)]
+        body.release()
+    return name, clock_speed, events
+
+
+def trace_to_csv(path, csv_path):
+    """
+    Writes the events of a trace file to a csv file in the layout Machine writes.
+
+    Returns:
+        int: the number of events converted.
+    """
+    with open(path, "rb") as tracefile:
+        vectors = read_header(tracefile.read(HEADER.size))[2] > 0
+    _, _, events = read_trace(path)
+    with open(csv_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(csv_header(vectors))
+        if vectors:
+            writer.writerows(event[:4] + (format_vector(event[5]),) for event in events)
+        else:
+            writer.writerows(event[:4] for event in events)
+    return len(events)
+
+
+def convert_run(log_directory):
+    """
+    Converts every trace of a run to a csv file, in `log_directory`/csvs.
+
+    Returns:
+        int: the number of traces converted.
+    """
+    traces = os.path.join(log_directory, "traces")
+    os.makedirs(os.path.join(log_directory, "csvs"), exist_ok=True)
+    converted = 0
+    for filename in sorted(os.listdir(traces)):
+        if filename.endswith(".trace"):
+            csv_name = filename[:-len(".trace")] + ".csv"
+            trace_to_csv(os.path.join(traces, filename), os.path.join(log_directory, "csvs", csv_name))
+            converted += 1
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert binary traces to csv files")
+    parser.add_argument("runs", nargs="+", help="run directories holding a traces directory")
+    args = parser.parse_args()
+    for run in args.runs:
+        print("{}: converted {} traces".format(run, convert_run(run)))
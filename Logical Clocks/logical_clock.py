@@ -1,33 +1,57 @@
+from array import array
 import threading
+import time
 
 class LogicalClock:
-    def __init__(self, initial_time=0):
+    def __init__(self, initial_time=0, single_owner=False):
         """
         A class to represent a logical clock.
 
+        Every clock in this module has the same interface, so a machine can run
+        with any of them: tick() for a local or send event, stamp() for the
+        timestamp put on an outgoing message, merge() for a received message and
+        get_time() for the single number recorded in the logs. tick(), update()
+        and merge() return the new time, read under the same lock as the change,
+        so the time an event is logged with is always the time it set.
+
+        Each method takes the clock's lock around its underscored version, which
+        does the work. A clock that only one thread ever uses can be made with
+        `single_owner`, which skips the lock by calling the underscored versions
+        directly.
+
         Args:
             initial_time (int): The initial value of the logical clock. Defaults to 0.
+            single_owner (bool): If True, the clock is not locked, and must only be used by one thread. Defaults to False.
         """
         self.time = initial_time
         self.lock = threading.Lock()
-        
+        if single_owner:
+            for method in ("tick", "update", "merge", "stamp", "get_time"):
+                setattr(self, method, getattr(self, "_" + method))
+
     def tick(self):
         """
         Increments the logical clock by 1.
+
+        Returns:
+            int: The new value of the logical clock.
         """
         with self.lock:
-            self.time += 1
-        
-    def update(self, other):
+            return self._tick()
+
+    def update(self, *other):
         """
         Updates the logical clock based on the value of another logical clock.
 
         Args:
             other (int): The value of the other logical clock.
+
+        Returns:
+            int: The new value of the logical clock.
         """
         with self.lock:
-            self.time = max(self.time, other) + 1
-        
+            return self._update(*other)
+
     def get_time(self):
         """
         Returns the current value of the logical clock.
@@ -38,3 +62,217 @@ class LogicalClock:
         with self.lock:
             return self.time
 
+    def stamp(self, peer=None):
+        """
+        Returns the timestamp to send to machine `peer`.
+
+        Returns:
+            tuple: the scalar timestamp and the vector timestamp for the message header.
+        """
+        with self.lock:
+            return self._stamp(peer)
+
+    def merge(self, message):
+        """
+        Updates the clock for a received Message.
+
+        Returns:
+            int: The new value of the logical clock.
+        """
+        with self.lock:
+            return self._merge(message)
+
+    def forget(self, peer):
+        """
+        Called when the connection to `peer` is lost, so messages to it may have been lost.
+        """
+
+    def _tick(self):
+        self.time += 1
+        return self.time
+
+    def _update(self, other):
+        self.time = max(self.time, other) + 1
+        return self.time
+
+    def _get_time(self):
+        return self.time
+
+    def _stamp(self, peer):
+        return self.time, None
+
+    def _merge(self, message):
+        return self._update(message.timestamp)
+
+
+class VectorClock(LogicalClock):
+    def __init__(self, name, machines, delta=False, single_owner=False):
+        """
+        A vector clock, which can tell causally ordered events from concurrent ones.
+
+        The vector is an array of unsigned 64 bit integers, one entry per machine.
+        It keeps a Lamport clock alongside, which is what get_time() returns and
+        the scalar timestamp of its messages, so the logs read as before.
+
+        Messages carry only the non-zero entries of the vector. With `delta`, they
+        carry only the entries that changed since the last message to the same
+        machine (Singhal and Kshemkalyani's technique), which keeps messages small
+        when there are many machines. That relies on messages to a machine
+        arriving in order and none being lost, so the next message to a machine
+        whose connection was lost carries the whole vector again.
+
+        Args:
+            name (int): this machine's entry in the vector.
+            machines (int): the number of machines.
+            delta (bool): send only the entries changed since the last message to each machine. Defaults to False.
+            single_owner (bool): If True, the clock is not locked, as in LogicalClock. Defaults to False.
+        """
+        self.name = name
+        self.vector = array('Q', bytes(8 * machines))
+        self.delta = delta
+        self.updated = array('Q', bytes(8 * machines)) # own entry at the time each entry last changed
+        self.sent = {} # peer -> own entry when the last message was sent to it
+        super().__init__(single_owner=single_owner)
+        if single_owner:
+            self.get_vector = self._get_vector
+
+    def _tick(self):
+        self.time += 1
+        self.vector[self.name] += 1
+        self.updated[self.name] = self.vector[self.name]
+        return self.time
+
+    def _update(self, other, vector=()):
+        """
+        Updates the clock with another machine's Lamport time and vector, given dense or as
+        {index: value} for the entries it sent.
+        """
+        self.time = max(self.time, other) + 1
+        now = self.vector[self.name] + 1
+        for index, value in (vector.items() if isinstance(vector, dict) else enumerate(vector)):
+            if value > self.vector[index]:
+                self.vector[index] = value
+                self.updated[index] = now
+        self.vector[self.name] = now
+        self.updated[self.name] = now
+        return self.time
+
+    def _merge(self, message):
+        return self._update(message.timestamp, message.vector or ())
+
+    def _stamp(self, peer):
+        since = self.sent.get(peer, 0) if self.delta else 0
+        entries = {index: value for index, value in enumerate(self.vector)
+                   if value and self.updated[index] > since}
+        if self.delta and peer is not None:
+            self.sent[peer] = self.vector[self.name]
+        return self.time, entries
+
+    def forget(self, peer):
+        with self.lock:
+            self.sent.pop(peer, None)
+
+    def get_vector(self):
+        """
+        Returns a copy of the vector.
+        """
+        with self.lock:
+            return self._get_vector()
+
+    def _get_vector(self):
+        return list(self.vector)
+
+
+def compare(vector, other):
+    """
+    Compares two dense vector timestamps.
+
+    Returns:
+        str: "before" if `vector` happened before `other`, "after" if after, "equal", or "concurrent".
+    """
+    not_after = all(a <= b for a, b in zip(vector, other))
+    not_before = all(a >= b for a, b in zip(vector, other))
+    if not_after and not_before:
+        return "equal"
+    if not_after:
+        return "before"
+    if not_before:
+        return "after"
+    return "concurrent"
+
+
+class HybridLogicalClock(LogicalClock):
+    COUNTER_BITS = 16
+
+    def __init__(self, physical_time=None, single_owner=False):
+        """
+        A hybrid logical clock (Kulkarni et al.): a Lamport clock that stays within the clock skew
+        of physical time. Its time is the largest physical time seen, in milliseconds, and a
+        counter that orders events within the same millisecond. get_time() and the timestamps
+        it sends pack both into one 64 bit integer, time << 16 | counter, which orders the same way.
+
+        Args:
+            physical_time (function): returns the physical time in milliseconds. Defaults to the system clock.
+            single_owner (bool): If True, the clock is not locked, as in LogicalClock. Defaults to False.
+        """
+        super().__init__(single_owner=single_owner)
+        self.physical_time = physical_time or (lambda: time.time_ns() // 1000000)
+        self.wall = 0 # largest physical time seen, in milliseconds
+        self.counter = 0
+
+    def _tick(self):
+        wall = max(self.wall, self.physical_time())
+        self.counter = self.counter + 1 if wall == self.wall else 0
+        self.wall = wall
+        self.time = self.pack(self.wall, self.counter)
+        return self.time
+
+    def _update(self, other):
+        """
+        Updates the clock with another machine's packed hybrid time.
+        """
+        other_wall, other_counter = self.unpack(other)
+        wall = max(self.wall, other_wall, self.physical_time())
+        if wall == self.wall and wall == other_wall:
+            self.counter = max(self.counter, other_counter) + 1
+        elif wall == self.wall:
+            self.counter += 1
+        elif wall == other_wall:
+            self.counter = other_counter + 1
+        else:
+            self.counter = 0
+        self.wall = wall
+        self.time = self.pack(self.wall, self.counter)
+        return self.time
+
+    @classmethod
+    def pack(cls, wall, counter):
+        return wall << cls.COUNTER_BITS | counter
+
+    @classmethod
+    def unpack(cls, time):
+        return time >> cls.COUNTER_BITS, time & ((1 << cls.COUNTER_BITS) - 1)
+
+
+CLOCKS = ("lamport", "vector", "vector-delta", "hybrid")
+
+
+def make_clock(kind, name, machines, physical_time=None, single_owner=False):
+    """
+    Creates the clock for machine `name` of `machines`.
+
+    Args:
+        kind (str): one of CLOCKS.
+        physical_time (function): physical time in milliseconds for a hybrid clock. Defaults to the system clock.
+        single_owner (bool): If True, the clock is not locked and must only be used by one thread. Defaults to False.
+
+    Returns:
+        LogicalClock: the clock.
+    """
+    if kind == "lamport":
+        return LogicalClock(single_owner=single_owner)
+    if kind in ("vector", "vector-delta"):
+        return VectorClock(name, machines, kind == "vector-delta", single_owner)
+    if kind == "hybrid":
+        return HybridLogicalClock(physical_time, single_owner)
+    raise ValueError("Unknown clock {}".format(kind))
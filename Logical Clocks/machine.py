@@ -1,11 +1,17 @@
 from multiprocessing import Process
 
-import sys
-
-from logical_clock import LogicalClock
+import argparse
+
+from logical_clock import CLOCKS, VectorClock, make_clock
+from messages import MessageDecoder, encode_message
+from recorder import EventRecorder
+from scheduler import POLICIES, TickScheduler
+from event_trace import NO_PEER, csv_header, trace_path, write_header
+from topology import TOPOLOGIES, build_topology
 from queue import Queue
 import logging
 import random
+import selectors
 import socket
 import signal
 import threading
@@ -13,61 +19,97 @@ import time
 import csv
 import os
 
+SEND_TASKS = 3 # tasks 1 to SEND_TASKS send a message; any higher task is an internal event
+
+
+def send_count(task, fanout):
+    """
+    Return how many random neighbours a task sends a message to.
+
+    Args:
+    - task: the task number, drawn from 1 up to the size of the task range.
+    - fanout: the number of neighbours the last sending task sends to.
+
+    Returns:
+    - 0 for an internal event, `fanout` for task SEND_TASKS and 1 for the other sending tasks.
+    """
+    if task > SEND_TASKS:
+        return 0
+    return fanout if task == SEND_TASKS else 1
+
 
 class Machine:
 
     # constructor that initializes an instance of Machine
-    def __init__(self, name, port, log_directory="logs") -> None:
+    def __init__(self, name, port, log_directory="logs", machines=3, topology="ring", fanout=2, degree=4, seed=262,
+                 speeds=(1, 6), tasks=10, duration=60, text_log=True, trace="csv",
+                 clock="lamport", behind="catch-up") -> None:
         # setting constants
-        self.HEADER = 64 
+        self.RECV_SIZE = 4096 # most bytes read from a socket at once; a read may hold many messages
         self.FORMAT = 'utf-8'
 
         # setting instance variables
         self.name = name # name of the machine instance
-        self.clock_speed = random.randint(1, 6) # clock speed of the machine instance, randomly generated between 1 and 6
+        self.clock_speed = random.randint(*speeds) # clock speed of the machine instance, randomly generated in the `speeds` range
+        self.tasks = tasks # tasks are drawn from 1 to `tasks`, so a larger range means more internal events
+        self.duration = duration # seconds that run() keeps ticking for
+        self.scheduler = TickScheduler(self.clock_speed, behind) # paces the ticks; `behind` is what to do when ticks run late
+        self.rates_log = f'{log_directory}/rates/log_{self.name}_{self.clock_speed}.csv' # target and achieved tick rate per second
 
         self.message_queue = Queue() # creating a Queue instance to store messages received by the machine instance
+        self.decoders = {} # one MessageDecoder per connected socket, holding any partially received message
+
+        # initializing the machine instance's clock: a Lamport, vector or hybrid logical clock. Only the main loop
+        # touches it (the I/O thread just queues messages), so it is used without locking
+        self.logical_clock = make_clock(clock, name, machines, single_owner=True)
+
+        # a vector clock's vector time is recorded with every event, alongside its Lamport time
+        vectors = isinstance(self.logical_clock, VectorClock)
 
         # creating directories to store logs and csv files
         os.makedirs(log_directory, exist_ok=True) # creating the top-level directory to store logs and csv files
         os.makedirs(f"{log_directory}/logs", exist_ok=True) # creating a subdirectory to store log files
-        os.makedirs(f"{log_directory}/csvs", exist_ok=True) # creating a subdirectory to store csv files
-
-        # creating csv log file to store machine instance data
-        self.csv_log = f'{log_directory}/csvs/log_{self.name}_{self.clock_speed}.csv'
-        with open(self.csv_log, 'w', newline='') as csvfile: # opening csv file
-            writer = csv.writer(csvfile)
-            writer.writerow(["timestamp", "logical_clock_time", "queue_length", "event_type"]) # writing headers to csv file
+        if trace == "binary":
+            # creating a binary trace file (see event_trace.py) to store machine instance data
+            os.makedirs(f"{log_directory}/traces", exist_ok=True) # creating a subdirectory to store trace files
+            self.trace_log = trace_path(log_directory, self.name, self.clock_speed)
+            with open(self.trace_log, 'wb') as tracefile:
+                write_header(tracefile, self.name, self.clock_speed, machines if vectors else 0)
+        else:
+            os.makedirs(f"{log_directory}/csvs", exist_ok=True) # creating a subdirectory to store csv files
+            # creating csv log file to store machine instance data
+            self.csv_log = f'{log_directory}/csvs/log_{self.name}_{self.clock_speed}.csv'
+            with open(self.csv_log, 'w', newline='') as csvfile: # opening csv file
+                writer = csv.writer(csvfile)
+                writer.writerow(csv_header(vectors)) # writing headers to csv file
+        # events are buffered in memory and appended to the csv file or trace (and text log) in batches by a background thread
+        self.recorder = EventRecorder(self.trace_log if trace == "binary" else self.csv_log, text_log,
+                                      binary=trace == "binary", vectors=vectors)
 
         # configuring logging information to be written to log file
         logging.basicConfig(filename=f'{log_directory}/logs/log_{name}.log', level=logging.INFO, filemode='w') # setting up logging configuration
         logging.info(f"Clock Speed: {self.clock_speed}") # writing clock speed information to log file
 
-        # setting variables that represent the client and server connections
-        self.first_other_client_name = (self.name + 1) % 3 # client connection variable that represents the first client connection
-        self.second_other_client_name = (self.name - 1) % 3 # client connection variable that represents the second client connection
-
-        self.logical_clock = LogicalClock() # initializing an instance of the LogicalClock class for the machine instance
+        # setting variables that represent the machines this one can send to
+        self.neighbours = build_topology(topology, machines, degree, seed)[self.name] # ids of the machines linked to this one
+        self.fanout = fanout # number of random neighbours that a task 3 message is sent to
+        self.peers = {} # pooled outgoing connections, by machine id, opened the first time a message is sent there
+        self.connections = [] # incoming connections accepted by the machine instance's server
 
         # setting up socket configuration for the machine instance's server
         self.SERVER = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # creating a socket object to communicate over the network
         self.SERVER_HOST_NAME = socket.gethostname() # getting the host name of the machine instance
         self.SERVER_HOST = socket.gethostbyname(self.SERVER_HOST_NAME) # getting the IP address of the machine instance
+        self.BASE_PORT = port # machine i listens on BASE_PORT + i
         self.PORT = port + name # port that the machine instance's server is listening to
         self.ADDR = (self.SERVER_HOST, self.PORT) # server address that the machine instance is listening to
 
-        self.SERVER_LISTEN = True # boolean variable that is True if the machine instance's server is listening
-        self.CLIENT_LISTEN = True # boolean variable that is True if the machine instance's client is listening
-
         self.cleanup_lock = threading.Lock() # creating a lock to ensure that cleanup tasks are performed correctly
+        self.selector = selectors.DefaultSelector() # wakes the I/O loop only when a socket has something to accept or read
         self.CLEANED_UP = False # boolean variable that is True if we have already closed existing sockets
-
-        # Set up socket connection for the object's client
-        self.CLIENT = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.CLIENT_PORT = port + self.first_other_client_name
-        self.CLIENT_ADDR = (self.SERVER_HOST, self.CLIENT_PORT)
         self.ACTIVE = True
-        signal.signal(signal.SIGTERM, self.cleanup)  # Set up signal handler for cleanup
+        self.TERMINATED = False # set on SIGTERM; run() then stops ticking, and start_machine() cleans up
+        signal.signal(signal.SIGTERM, self.terminate)  # Set up signal handler for termination
 
     def run(self, write_data=True):
         """
@@ -79,82 +121,88 @@ class Machine:
         Returns:
             None
         """
-        # Start the server thread
-        server_thread = threading.Thread(target=self.start_server)
-        server_thread.start()
-        time.sleep(5)
-
-        # Start the client thread
-        client_thread = threading.Thread(target=self.start_client)
-        client_thread.start()
-        time.sleep(5)
+        # Start listening, and the I/O loop that serves every socket of this machine
+        self.start_server()
+        io_thread = threading.Thread(target=self.io_loop)
+        io_thread.start()
+        # Give the other machines time to start listening; connections to them are opened on first send
+        self.pause(5)
 
         try:
-            initial_time = time.time()
-            # Run for 60 seconds
-            while (time.time() - initial_time < 60):
-                start_time = time.time()
+            self.scheduler.start()
+            # Run for `duration` seconds, or until the machine is terminated
+            while (self.scheduler.elapsed() < self.duration and not self.TERMINATED):
                 # If there are no messages in the queue, run a task chosen at random
                 if self.message_queue.empty():
-                    task = random.randint(1, 10)
-                    self.run_tasks(task, self.CLIENT, self.CONN)
+                    task = random.randint(1, self.tasks)
+                    self.run_tasks(task)
                 # If there are messages in the queue, process them
                 else:
                     self.pop_message()
-                end_time = time.time()
-                # Wait for the next clock tick before starting the next iteration
-                time.sleep(max(1/self.clock_speed - (start_time - end_time), 0))
+                # Wait for the next clock tick, which is due at a fixed time from the start rather than a fixed
+                # time after this one, so the time spent on each tick does not slow the clock down
+                self.scheduler.wait()
             print("DONE")
         # If the user interrupts the program, exit gracefully
         except KeyboardInterrupt:
             pass
+        self.recorder.close() # write out the buffered events, so the tick rate summary comes after them
+        self.write_rates()
 
-    def run_tasks(self, task, client, conn, write_data=True):
+    def write_rates(self):
+        """
+        Write the target and achieved tick rate of every second of the run to the rates csv file, and a summary
+        to the log file.
+
+        Args:
+        - None.
+
+        Returns:
+        - None.
+        """
+        os.makedirs(os.path.dirname(self.rates_log), exist_ok=True)
+        with open(self.rates_log, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["second", "target_rate", "achieved_rate", "skipped_ticks"])
+            writer.writerows(self.scheduler.rates())
+        logging.info(f"Tick Rate: Target - {self.clock_speed}, Achieved - {self.scheduler.achieved_rate():.3f}, Skipped - {self.scheduler.skipped}")
+
+    def run_tasks(self, task, write_data=True):
         """
         Sends messages or logs internal events based on the value of `task`.
 
         Args:
-            task (int): The task to be performed.
-            client (socket.socket): The client socket object.
-            conn (socket.socket): The server socket object.
+            task (int): The task to be performed. Tasks 1 and 2 send a message to one random
+                neighbour, task 3 sends it to `fanout` random neighbours, and any other task is
+                an internal event.
             write_data (bool, optional): If True, log the message information in a log file and write to csv. Defaults to True.
         """
-        if task <= 3:
-            message = "[machine {}, task {}] the time is {}".format(
-            self.name, task, self.logical_clock.get_time())
-            # If task is 1, send the message to client
-            if task == 1:
-                self.CLIENT_LISTEN = False
-                client.send(message.encode())
-                self.CLIENT_LISTEN = True
-            # If task is 2, send the message to server
-            elif task == 2:
-                self.SERVER_LISTEN = False
-                conn.send(message.encode())
-                self.SERVER_LISTEN = True
-            # If task is 3, send the message to both client and server
-            elif task == 3:
-                client.send(message.encode())
-                conn.send(message.encode())
-            # Increment the logical clock time and get the global time, logical clock time, and queue length
-            self.logical_clock.tick()
-            global_time, logical_clock_time, queue_length = time.time(), self.logical_clock.get_time(), self.message_queue.qsize()
-            # If specified, log the message information in a log file and write to csv
+        if send_count(task, self.fanout):
+            # Increment the logical clock time first: sending is the event, and the messages carry its time, so
+            # their receipt is ordered after it
+            logical_clock_time = self.logical_clock.tick()
+            payload = "task {}".format(task).encode(self.FORMAT)
+            sent = self.send_to_random_peers(payload, send_count(task, self.fanout))
+            # Get the global time and queue length
+            global_time, queue_length = time.time(), self.message_queue.qsize()
+            # If specified, record the event for the log file and csv
             if write_data:
-                logging.info(f"Sent Message: System Time - {global_time}, Logical Clock Time - {logical_clock_time}, Queue Length - {queue_length}, Message - {message}")
-                with open(self.csv_log, 'a', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow([global_time, logical_clock_time, queue_length, "Send"])
-        # If task is greater than 3, this is an internal event
+                self.recorder.record(global_time, logical_clock_time, queue_length, "Send", f"Task - {task}",
+                                     sent[0] if len(sent) == 1 else NO_PEER, self.vector_time())
+        # If task is greater than SEND_TASKS, this is an internal event
         else:
-            self.logical_clock.tick()
-            global_time, logical_clock_time, queue_length = time.time(), self.logical_clock.get_time(), self.message_queue.qsize()
-            # If specified, log the message information in a log file and write to csv
+            logical_clock_time = self.logical_clock.tick()
+            global_time, queue_length = time.time(), self.message_queue.qsize()
+            # If specified, record the event for the log file and csv
             if write_data:
-                logging.info(f"Internal Event: System Time - {global_time}, Logical Clock Time - {logical_clock_time}, Queue Length - {queue_length}")
-                with open(self.csv_log, 'a', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow([global_time, logical_clock_time, queue_length, "Internal"])
+                self.recorder.record(global_time, logical_clock_time, queue_length, "Internal",
+                                     vector=self.vector_time())
+
+    def vector_time(self):
+        """
+        Returns the vector time to record with an event: a copy of a vector clock's vector, or None for other clocks.
+        """
+        return self.logical_clock.get_vector() if isinstance(self.logical_clock, VectorClock) else None
 
     def pop_message(self, write_data=True):
         """
@@ -168,26 +216,55 @@ class Machine:
 
         """
         message = self.message_queue.get() #get a message off the queue
-        counterparty_clock = int(message.split()[-1]) # get the logical clock time of the sender machine
-        self.logical_clock.update(counterparty_clock) #update the logial clock based on its rules
+        logical_clock_time = self.logical_clock.merge(message) # update the logical clock with the sender's timestamp, based on its rules
 
         # Log message data and write to csv if specified
-        global_time, logical_clock_time, queue_length = time.time(), self.logical_clock.get_time(), self.message_queue.qsize()
+        global_time, queue_length = time.time(), self.message_queue.qsize()
         if write_data:
-            logging.info(f"Received Message: System Time - {global_time}, Logical Clock Time - {logical_clock_time}, Queue Length - {queue_length}")
-            with open(self.csv_log, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow([global_time, logical_clock_time, queue_length, "Received"])
+            self.recorder.record(global_time, logical_clock_time, queue_length, "Received", peer=message.sender,
+                                 vector=self.vector_time())
         print(message)
 
 
-    def cleanup(self, exitcode=None, exitstack=None):
+    def terminate(self, signum=None, frame=None):
+        """
+        SIGTERM handler. It only sets a flag: the handler runs on the main thread in between any two
+        bytecodes, maybe while record() holds the recorder's lock, so closing the recorder or the sockets
+        here could deadlock. run() sees the flag, stops ticking and writes out the buffered events, and
+        start_machine() then calls cleanup().
+
+        Args:
+        - signum, frame: the signal number and interrupted frame, as passed to signal handlers.
+
+        Returns:
+        - None.
+        """
+        self.TERMINATED = True
+
+    def pause(self, seconds):
+        """
+        Sleep for `seconds`, or until the machine is terminated.
+
+        Args:
+        - seconds: how long to sleep for.
+
+        Returns:
+        - None.
+        """
+        deadline = time.monotonic() + seconds
+        while not self.TERMINATED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.1))
+
+    def cleanup(self):
         """
         Cleanup the machine by setting flags to indicate that the sockets should be closed, and closing the server and client sockets.
+        Called from the main thread once run() has returned, never from a signal handler.
 
         Args:
-        - exitcode (Optional[int]): The exit code to return when the program exits. Default is `None`.
-        - exitstack (Optional): The exit stack to use for cleanup. Default is `None`.
+        - None.
 
         Returns:
         - None.
@@ -196,19 +273,20 @@ class Machine:
             print("Cleaning up...")
             self.CLEANED_UP = True
             # Set flags to indicate that the sockets should be closed
-            self.SERVER_LISTEN = False
-            self.CLIENT_LISTEN = False
             self.ACTIVE = False
+            self.recorder.close() # write out the events that are still buffered
             time.sleep(2)
-            # Close the server and client sockets
+            # Close the server socket and every incoming and outgoing connection
+            self.selector.close()
             self.SERVER.close()
-            self.CLIENT.close()
+            for conn in self.connections + list(self.peers.values()):
+                conn.close()
 
 
     def start_server(self):
         """
-        Start the server by binding to the server address and listening for incoming connections. 
-        Continuously listen for incoming data while the connection is active.
+        Start the server by binding to the server address and listening for incoming connections.
+        Connections are accepted by the I/O loop as the other machines connect.
 
         Args:
         - None.
@@ -217,95 +295,130 @@ class Machine:
         - None.
         """
         # Bind to the server address and start listening
+        self.SERVER.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # back-to-back runs reuse the same ports
         self.SERVER.bind(self.ADDR)
-        self.SERVER.listen()
+        self.SERVER.listen(max(len(self.neighbours), 1))
+        self.SERVER.setblocking(False)
+        self.selector.register(self.SERVER, selectors.EVENT_READ, self.accept_connection)
         print("machine {} connected and listening to {}".format(self.name, self.ADDR))
-        
-        # Accept incoming connections
-        self.CONN, addr = self.SERVER.accept()
+
+    def accept_connection(self, server):
+        """
+        Accept an incoming connection and start reading messages from it in the I/O loop.
+
+        Args:
+        - server: the listening socket that is ready to accept.
+
+        Returns:
+        - None.
+        """
+        conn, addr = server.accept()
         print(f"[NEW CONNECTION] {addr} connected.")
-        
-        # Continue listening for incoming data while the connection is active
-        while(self.ACTIVE):
-            if self.SERVER_LISTEN:
-                try:
-                    self.listen_through_socket(self.CONN) # listen for incoming messages
-                except socket.timeout:
-                    # Ignore timeouts and continue listening
-                    pass
-                except BlockingIOError:
-                    # Ignore blocking I/O errors and continue listening
-                    pass
-                except (ConnectionResetError, ConnectionAbortedError):
-                    # Connection was reset or aborted, break out of the loop
-                    print("CONNECTION ABORTED")
-                    break
+        self.connections.append(conn)
+        self.selector.register(conn, selectors.EVENT_READ, self.listen_through_socket)
 
+    def connection(self, peer):
+        """
+        Return the pooled connection to machine `peer`, connecting to it the first time it is needed.
 
+        Args:
+        - peer: the id of the machine to connect to.
 
-    def start_client(self):
+        Returns:
+        - The connected socket.
+        """
+        conn = self.peers.get(peer)
+        if conn is None:
+            conn = socket.create_connection((self.SERVER_HOST, self.BASE_PORT + peer), timeout=5)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # clock messages are small; send each one right away
+            self.peers[peer] = conn
+            print("machine {} connected to machine {}".format(self.name, peer))
+        return conn
+
+    def send_to_random_peers(self, payload, k):
         """
-        Start the client machine by connecting to the server and listening for incoming messages.
+        Send a message to `k` neighbours chosen at random, or to every neighbour if there are fewer than `k`.
+        Each message is stamped for the neighbour it goes to, since a vector clock may send each one
+        only what it has not sent it yet.
 
         Args:
-        - None.
+        - payload: the bytes to send in the message.
+        - k: the number of neighbours to send it to.
 
         Returns:
+        - The ids of the neighbours the message was sent to.
+        """
+        peers = random.sample(self.neighbours, min(k, len(self.neighbours)))
+        sent = []
+        for peer in peers:
+            try:
+                timestamp, vector = self.logical_clock.stamp(peer)
+                self.connection(peer).sendall(encode_message(self.name, timestamp, payload, vector))
+                sent.append(peer)
+            except OSError as e:
+                # the peer is not up or went away; drop the connection so the next send reconnects
+                print("machine {} could not send to machine {}: {}".format(self.name, peer, e))
+                conn = self.peers.pop(peer, None)
+                if conn is not None:
+                    conn.close()
+                self.logical_clock.forget(peer) # messages to it may have been lost
+        return sent
+
+    def io_loop(self):
+        """
+        Serve every socket of the machine from one thread. The thread sleeps in select() until a
+        socket is ready, then runs the callback it was registered with; the timeout only bounds
+        how long it takes to notice that the machine has stopped.
+
+        Args:
         - None.
 
+        Returns:
+        - None.
         """
-        client_connected = False # set a flag to track whether the client is connected to the server
-        time.sleep(1) # wait for 1 second before attempting to connect to the server
-        while(client_connected == False):
+        while(self.ACTIVE):
             try:
-                self.CLIENT.connect(self.CLIENT_ADDR) # connect to the server using the client's socket object and the server address
-                client_connected = True # set the flag to indicate that the client is now connected to the server
-                print("machine {} connected to server {}".format(self.name, self.CLIENT_ADDR))
+                events = self.selector.select(timeout=1)
+            except (OSError, ValueError):
+                # the selector was closed by cleanup()
                 break
-            except Exception as e:
-                print(e) # if there is an error connecting to the server, print the error message
-                time.sleep(1) # wait for 1 second before trying to connect again
-                client_connected = False # set the flag to indicate that the client is not yet connected to the server
-        while(self.ACTIVE): # continue running the loop as long as the machine is active
-            if self.CLIENT_LISTEN: # check if the client is set to listen for incoming messages
+            for key, _ in events:
                 try:
-                    self.listen_through_socket(self.CLIENT) # listen for incoming messages
-                except socket.timeout:
-                    # Ignore timeouts and continue listening
-                    pass
-                except BlockingIOError:
-                    # Ignore blocking I/O errors and continue listening
-                    pass
+                    if key.data(key.fileobj) is None and key.fileobj is not self.SERVER:
+                        # the other machine closed the connection
+                        self.selector.unregister(key.fileobj)
+                        self.connections.remove(key.fileobj)
+                        key.fileobj.close()
                 except (ConnectionResetError, ConnectionAbortedError):
-                    # Connection was reset or aborted, break out of the loop
+                    # Connection was reset or aborted, stop watching it
                     print("CONNECTION ABORTED")
-                    break# if there is a blocking I/O error, ignore the exception and continue listening for messages
-
+                    self.selector.unregister(key.fileobj)
 
         # refactored out for testing purposes
     def listen_through_socket(self, listener: socket):
         """
-        Listen for incoming messages through the provided socket.
+        Read the incoming messages from a socket that is ready to be read.
 
         Args:
         - listener: A socket object that is used to listen for incoming messages.
 
         Returns:
-        - The received message if one was received, or None if no message was received.
-
-        Raises:
-        - socket.timeout: If no message is received within the timeout period.
+        - The bytes that were received, or None if the connection was closed.
         """
-        listener.settimeout(1) # set a timeout of 1 second to prevent blocking indefinitely
-        message = listener.recv(self.HEADER, socket.MSG_DONTWAIT) # attempt to receive a message without blocking
-        if message.decode(self.FORMAT):
-            decoded_message = message.decode(self.FORMAT) # decode the message from bytes to string
-            self.message_queue.put(decoded_message) # add the decoded message to the message queue for processing
-            return message # return the received message
+        data = listener.recv(self.RECV_SIZE) # the socket is ready, so this returns without blocking
+        if not data:
+            self.decoders.pop(listener, None)
+            return None
+        decoder = self.decoders.setdefault(listener, MessageDecoder())
+        for message in decoder.feed(data): # a read can hold several messages, or only part of one
+            self.message_queue.put(message) # add the decoded message to the message queue for processing
+        return data # return the received bytes
 
 
 
-def start_machine(name, port, log_dir):
+def start_machine(name, port, log_dir, machines=3, topology="ring", fanout=2, degree=4, seed=262,
+                  speeds=(1, 6), tasks=10, duration=60, text_log=True, trace="csv",
+                  clock="lamport", behind="catch-up"):
     """
     Start a machine with the given name, port number, and log directory.
 
@@ -313,39 +426,64 @@ def start_machine(name, port, log_dir):
     - name: A string representing the name of the machine.
     - port: An integer representing the port number to use for the machine.
     - log_dir: A string representing the path to the directory where log files should be stored.
+    - machines, topology, fanout, degree: the simulated network, as described in Machine.
+    - seed: seed for the topology; each machine seeds its own random choices with seed + name.
+    - speeds, tasks, duration: the clock speed range, task range and run length, as described in Machine.
+    - text_log: whether to write the text log as well as the csv file.
+    - trace: "csv" to record events in a csv file, or "binary" for a binary trace.
+    - clock: the kind of clock the machine keeps, one of logical_clock.CLOCKS.
+    - behind: what to do about ticks that run late, "catch-up" or "skip" (see scheduler.TickScheduler).
 
     Returns:
     - None.
     """
-    client = Machine(name, port,log_dir) # create a new Machine object with the specified name, port, and log directory
+    random.seed(seed + name) # forked machines would otherwise share one random sequence, and one clock speed
+    client = Machine(name, port, log_dir, machines, topology, fanout, degree, seed, speeds, tasks, duration,
+                     text_log, trace, clock, behind) # create a new Machine object with the specified name, port, and log directory
     client.run() # start the machine by calling its `run()` method
-    time.sleep(5) # wait for 5 seconds to give the machine time to start up
+    client.pause(5) # wait for 5 seconds to let the other machines finish, unless this one was terminated
     client.cleanup() # clean up the machine by calling its `cleanup()` method, which closes open sockets and logs any remaining messages
 
 
 if __name__ == '__main__':
-    random.seed(262) # set the seed for the random number generator for reproducibility
-    try:
-        starting_port = int(sys.argv[1]) # get the starting port number from the command line arguments
-    except:
-        starting_port = 5000 # if no starting port is provided, use a default value of 5000
-    # create three separate processes to run the start_machine function
-    p = Process(target=start_machine, args=(0, starting_port,"experiment1",))
-    p2 = Process(target=start_machine, args=(1, starting_port,"experiment1",))
-    p3 = Process(target=start_machine, args=(2, starting_port,"experiment1",))
+    parser = argparse.ArgumentParser(description="Simulate machines that keep logical clocks and message each other")
+    parser.add_argument("port", nargs="?", type=int, default=5000, help="machine i listens on PORT + i")
+    parser.add_argument("--machines", type=int, default=3, help="number of machines to simulate")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="ring", help="which machines can message each other")
+    parser.add_argument("--fanout", type=int, default=2, help="number of random neighbours a task 3 message goes to")
+    parser.add_argument("--degree", type=int, default=4, help="average number of neighbours in the random topology")
+    parser.add_argument("--seed", type=int, default=262, help="seed for reproducibility")
+    parser.add_argument("--speeds", type=int, nargs=2, default=(1, 6), metavar=("MIN", "MAX"),
+                        help="range of clock speeds, in ticks per second")
+    parser.add_argument("--tasks", type=int, default=10, help="tasks are drawn from 1 to TASKS; above 3 is internal")
+    parser.add_argument("--duration", type=float, default=60, help="seconds each machine runs for")
+    parser.add_argument("--no-text-log", dest="text_log", action="store_false",
+                        help="only write the csv files, not the text logs")
+    parser.add_argument("--trace", choices=["csv", "binary"], default="csv",
+                        help="record events in csv files, or in compact binary traces (see event_trace.py)")
+    parser.add_argument("--clock", choices=CLOCKS, default="lamport",
+                        help="Lamport clocks, vector clocks (vector-delta sends only changed entries) or hybrid logical clocks")
+    parser.add_argument("--behind", choices=POLICIES, default="catch-up",
+                        help="when ticks run late, run the missed ticks back to back, or skip them")
+    parser.add_argument("--log-dir", default="experiment1", help="directory to write logs and csv files to")
+    args = parser.parse_args()
+
+    # create a separate process to run the start_machine function for every machine
+    processes = [Process(target=start_machine, args=(name, args.port, args.log_dir, args.machines, args.topology,
+                                                     args.fanout, args.degree, args.seed, tuple(args.speeds),
+                                                     args.tasks, args.duration, args.text_log,
+                                                     args.trace, args.clock, args.behind))
+                 for name in range(args.machines)]
     try:
         # start the processes
-        p.start()
-        p2.start()
-        p3.start()
+        for process in processes:
+            process.start()
         # wait for the processes to finish
-        p.join()
-        p2.join()
-        p3.join()
+        for process in processes:
+            process.join()
     except KeyboardInterrupt:
         print("Keyboard interrupt detected. Exiting program...") # if a keyboard interrupt is detected, print a message and exit the program
     finally:
         # terminate the processes
-        p.terminate()
-        p2.terminate()
-        p3.terminate()
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,104 @@
+from collections import namedtuple
+import struct
+
+VERSION = 2
+
+# Every message starts with a fixed header: version, flags, sender id, logical
+# timestamp, number of vector timestamp entries and payload length, all in
+# network byte order. The vector timestamp entries and then the payload
+# follow. A dense vector has one 8 byte entry per machine; with FLAG_SPARSE
+# each entry is a machine index (4 bytes) and its value (8 bytes), and the
+# entries that are left out have not changed.
+HEADER = struct.Struct("!BBIQHI")
+VECTOR_ENTRY = struct.Struct("!Q")
+SPARSE_ENTRY = struct.Struct("!IQ")
+FLAG_SPARSE = 1
+MAX_PAYLOAD = 1024 * 1024
+
+Message = namedtuple("Message", ["sender", "timestamp", "vector", "payload"])
+
+
+def encode_message(sender, timestamp, payload=b"", vector=None):
+    """
+    Encodes one clock message.
+
+    Args:
+        sender (int): id of the sending machine.
+        timestamp (int): the sender's logical clock time.
+        payload (bytes): optional application data. Defaults to no payload.
+        vector (list or dict): optional vector timestamp, either one entry per machine or, to send
+            only some entries, {machine index: value}. Defaults to None.
+
+    Returns:
+        bytes: the encoded message, ready for sendall().
+    """
+    vector = vector or ()
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError("Payload of {} bytes exceeds the maximum message size".format(len(payload)))
+    if isinstance(vector, dict):
+        flags = FLAG_SPARSE
+        entries = struct.pack("!" + "IQ" * len(vector), *[field for entry in vector.items() for field in entry])
+    else:
+        flags = 0
+        entries = struct.pack("!{}Q".format(len(vector)), *vector)
+    return b"".join([
+        HEADER.pack(VERSION, flags, sender, timestamp, len(vector), len(payload)),
+        entries,
+        payload,
+    ])
+
+
+class MessageDecoder:
+    """
+    Incremental decoder for a stream of clock messages. Bytes are fed in as
+    they are read from the socket and every complete message is returned, so
+    one read can yield many messages and a message can be split across reads.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Adds received bytes to the buffer and extracts all complete messages.
+
+        Args:
+            data (bytes): bytes read from the socket.
+
+        Returns:
+            list: the decoded Message tuples, in arrival order. `vector` is None
+            when the sender did not include a vector timestamp, a list if it sent
+            the whole vector and a dict of {machine index: value} if it sent some
+            entries.
+        """
+        self.buffer += data
+        messages = []
+        offset = 0
+        available = len(self.buffer)
+        view = memoryview(self.buffer)
+        try:
+            while available - offset >= HEADER.size:
+                version, flags, sender, timestamp, entries, length = HEADER.unpack_from(view, offset)
+                if version != VERSION:
+                    raise ValueError("Message versions do not match up")
+                if length > MAX_PAYLOAD:
+                    raise ValueError("Payload of {} bytes exceeds the maximum message size".format(length))
+                start = offset + HEADER.size
+                entry_size = SPARSE_ENTRY.size if flags & FLAG_SPARSE else VECTOR_ENTRY.size
+                end = start + entries * entry_size + length
+                if end > available:
+                    break
+                vector = None
+                if entries and flags & FLAG_SPARSE:
+                    fields = struct.unpack_from("!" + "IQ" * entries, view, start)
+                    vector = dict(zip(fields[::2], fields[1::2]))
+                elif entries:
+                    vector = list(struct.unpack_from("!{}Q".format(entries), view, start))
+                payload = bytes(view[start + entries * entry_size:end])
+                messages.append(Message(sender, timestamp, vector, payload))
+                offset = end
+        finally:
+            view.release()
+        if offset:
+            del self.buffer[:offset]
+        return messages
@@ -0,0 +1,71 @@
+"""
+Microbenchmarks for the logical clock building blocks.
+
+Usage: python microbench.py <benchmark>
+"""
+import argparse
+import time
+
+from logical_clock import make_clock
+from messages import Message
+
+
+def _best_of(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_clock(events=200000, machines=(3, 100)):
+    """
+    Measures the cost of one clock event, locked and single-owner, for every
+    kind of clock. "tick+get" is the old way of logging an event, a tick()
+    and then a separate get_time(), each taking the lock; "tick" and "merge"
+    return the new time directly. The merged message carries every entry of
+    the vector, decoded as it arrives off the wire, so a vector clock compares
+    them all.
+    """
+    print("{:>13} {:>9} {:>8} {:>12} {:>12} {:>12}".format("clock", "machines", "locked", "tick+get ns",
+                                                         "tick ns", "merge ns"))
+    for kind in ("lamport", "vector", "vector-delta", "hybrid"):
+        for count in machines if kind.startswith("vector") else machines[:1]:
+            for single_owner in (False, True):
+                clock = make_clock(kind, 0, count, single_owner=single_owner)
+                other = make_clock(kind, 1, count)
+                other.tick()
+                vector = {index: index + 1 for index in range(count)} if kind.startswith("vector") else None
+                message = Message(1, other.stamp()[0], vector, b"")
+
+                def tick_and_get():
+                    for _ in range(events):
+                        clock.tick()
+                        clock.get_time()
+
+                def tick():
+                    for _ in range(events):
+                        clock.tick()
+
+                def merge():
+                    for _ in range(events):
+                        clock.merge(message)
+
+                row = [_best_of(function) / events * 1e9 for function in (tick_and_get, tick, merge)]
+                print("{:>13} {:>9} {:>8} {:>12.0f} {:>12.0f} {:>12.0f}".format(kind, count, str(not single_owner),
+                                                                               *row))
+
+
+BENCHMARKS = {
+    "clock": bench_clock,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    args = parser.parse_args()
+    for name in sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]:
+        print("== {}".format(name))
+        BENCHMARKS[name]()
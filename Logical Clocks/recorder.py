@@ -0,0 +1,132 @@
+import csv
+import logging
+import threading
+
+from event_trace import NO_PEER, format_vector, pack_records
+
+# Text log line for each event type, as Machine used to write them.
+LOG_FORMATS = {
+    "Send": "Sent Message: System Time - {}, Logical Clock Time - {}, Queue Length - {}",
+    "Internal": "Internal Event: System Time - {}, Logical Clock Time - {}, Queue Length - {}",
+    "Received": "Received Message: System Time - {}, Logical Clock Time - {}, Queue Length - {}",
+}
+
+
+class EventRecorder:
+    """
+    Records a machine's events without touching the disk on the machine's loop.
+
+    record() only appends the event to in-memory columns. A background writer
+    thread takes the whole buffer and appends it to the csv file or binary
+    trace (and, if enabled, the text log) when `batch_size` events are
+    waiting, every `interval` seconds, and once more when the recorder is
+    closed. The file is opened once and kept open for the whole run.
+    """
+
+    def __init__(self, path, text_log=True, batch_size=1024, interval=1.0, binary=False, vectors=False):
+        """
+        Args:
+        - path: the csv file or trace file to append events to. Its header is written by the caller.
+        - text_log: if True, also write each event to the text log through `logging`. Defaults to True.
+        - batch_size: number of buffered events that wakes the writer early. Defaults to 1024.
+        - interval: most seconds an event waits in the buffer. Defaults to 1.
+        - binary: if True, `path` is a binary trace (see event_trace) rather than a csv file. Defaults to False.
+        - vectors: if True, every event carries the vector time of a vector clock, written after each trace
+          record or in the csv file's vector column. Defaults to False.
+        """
+        self.text_log = text_log
+        self.batch_size = batch_size
+        self.interval = interval
+        self.binary = binary
+        self.vectors = vectors
+        self.columns = self.empty_columns() # timestamps, logical clock times, queue lengths, event types, peers, details, vectors
+        self.lock = threading.Lock() # guards the columns, which the writer swaps out for empty ones
+        self.wake = threading.Event()
+        self.closed = False
+        if binary:
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'a', newline='')
+            self.writer = csv.writer(self.file)
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def empty_columns():
+        return [], [], [], [], [], [], []
+
+    def record(self, timestamp, logical_clock_time, queue_length, event_type, detail=None, peer=NO_PEER, vector=None):
+        """
+        Buffer one event.
+
+        Args:
+        - timestamp: system time of the event.
+        - logical_clock_time: the machine's logical clock time after the event.
+        - queue_length: number of messages waiting in the machine's queue.
+        - event_type: "Send", "Internal" or "Received".
+        - detail: optional text added to the event's text log line, e.g. the task.
+        - peer: the machine the message was sent to or received from, for the binary trace. Defaults to NO_PEER.
+        - vector: the vector time after the event, if the recorder was made with `vectors`. Defaults to None.
+
+        Returns:
+        - None.
+        """
+        with self.lock:
+            timestamps, clock_times, queue_lengths, event_types, peers, details, vectors = self.columns
+            timestamps.append(timestamp)
+            clock_times.append(logical_clock_time)
+            queue_lengths.append(queue_length)
+            event_types.append(event_type)
+            peers.append(peer)
+            details.append(detail)
+            vectors.append(vector)
+            full = len(timestamps) >= self.batch_size
+        if full:
+            self.wake.set()
+
+    def write_loop(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Write every buffered event to the csv file or trace, and the text log.
+
+        Returns:
+        - The number of events written.
+        """
+        with self.lock:
+            columns, self.columns = self.columns, self.empty_columns()
+        timestamps, clock_times, queue_lengths, event_types, peers, details, vectors = columns
+        if not timestamps or self.file.closed:
+            return 0
+        if self.binary:
+            self.file.write(pack_records(timestamps, clock_times, queue_lengths, event_types, peers,
+                                         vectors if self.vectors else None))
+        elif self.vectors:
+            self.writer.writerows(zip(timestamps, clock_times, queue_lengths, event_types, map(format_vector, vectors)))
+        else:
+            self.writer.writerows(zip(timestamps, clock_times, queue_lengths, event_types))
+        self.file.flush()
+        if self.text_log:
+            for row in zip(timestamps, clock_times, queue_lengths, event_types, details):
+                line = LOG_FORMATS[row[3]].format(*row[:3])
+                logging.info(line if row[4] is None else "{}, {}".format(line, row[4]))
+        return len(timestamps)
+
+    def close(self):
+        """
+        Stop the writer, write whatever is still buffered and close the file.
+
+        Returns:
+        - None.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
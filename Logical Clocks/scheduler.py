@@ -0,0 +1,92 @@
+import time
+
+POLICIES = ("catch-up", "skip")
+
+
+class TickScheduler:
+    def __init__(self, rate, policy="catch-up", clock=time.monotonic, sleep=time.sleep):
+        """
+        Paces a machine's clock ticks at `rate` ticks per second.
+
+        Tick n is due at start + n / rate, on the monotonic clock, so time spent on
+        the work of a tick, or oversleeping, never pushes the later ticks back.
+        When the machine falls more than a tick behind, the "catch-up" policy runs
+        the missed ticks back to back until it is on time again, and the "skip"
+        policy drops them and carries on from the tick that is due now.
+
+        Args:
+            rate (float): target ticks per second.
+            policy (str): "catch-up" or "skip". Defaults to "catch-up".
+            clock (function): monotonic time in seconds. Defaults to time.monotonic.
+            sleep (function): sleeps for a number of seconds. Defaults to time.sleep.
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy {}".format(policy))
+        self.rate = rate
+        self.policy = policy
+        self.clock = clock
+        self.sleep = sleep
+        self.start()
+
+    def start(self):
+        """
+        Starts counting ticks from now. The first tick is due immediately.
+        """
+        self.started = self.clock()
+        self.index = 0 # the tick that is due next
+        self.ticks = 0 # ticks that were run
+        self.skipped = 0 # ticks that were dropped by the skip policy
+        self.samples = [] # (second, ticks run, ticks skipped) at the end of every second
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def wait(self):
+        """
+        Called after a tick's work is done: sleeps until the next tick is due, or returns
+        right away if it is already late.
+
+        Returns:
+            int: the number of ticks skipped to get back on time.
+        """
+        self.ticks += 1
+        self.index += 1
+        now = self.clock()
+        deadline = self.started + self.index / self.rate
+        if now < deadline:
+            self.sleep(deadline - now)
+            self.sample(deadline) # count each tick in the second it started in
+            return 0
+        self.sample(now)
+        missed = int((now - self.started) * self.rate) - self.index
+        if self.policy == "skip" and missed > 0:
+            self.index += missed
+            self.skipped += missed
+            return missed
+        return 0
+
+    def sample(self, now):
+        second = int(now - self.started)
+        while len(self.samples) < second:
+            self.samples.append((len(self.samples) + 1, self.ticks, self.skipped))
+
+    def achieved_rate(self):
+        """
+        Returns the ticks run per second since start().
+        """
+        return self.ticks / max(self.elapsed(), 1e-9)
+
+    def rates(self):
+        """
+        Returns the target and achieved tick rate of every whole second since start().
+
+        Returns:
+            list: (second, target rate, achieved rate, ticks skipped) for every second.
+        """
+        self.sample(self.clock())
+        rows = []
+        previous_ticks, previous_skipped = 0, 0
+        for second, ticks, skipped in self.samples:
+            rows.append((second, self.rate, ticks - previous_ticks, skipped - previous_skipped))
+            previous_ticks, previous_skipped = ticks, skipped
+        return rows
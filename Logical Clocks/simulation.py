@@ -0,0 +1,186 @@
+"""
+Discrete-event simulation of the logical clock experiments.
+
+Runs every machine of an experiment in one process on a virtual clock.
+Clock ticks and message deliveries are events in a priority queue ordered
+by virtual time; each tick follows the same rules as Machine.run(): pop a
+message if one is queued, otherwise draw a task and send to random
+neighbours or do an internal event. Messages arrive after a simulated
+network delay instead of going through sockets, and nothing sleeps, so a
+60 second experiment takes a fraction of a second. Runs are deterministic
+for a given seed, and write the same CSV files as machine.py, with
+timestamps in virtual seconds and, for vector clocks, the vector column.
+"""
+import argparse
+import csv
+from collections import deque
+import heapq
+import itertools
+import os
+import random
+import time
+
+from event_trace import csv_header, format_vector
+from logical_clock import CLOCKS, VectorClock, make_clock
+from machine import send_count
+from messages import Message
+from topology import TOPOLOGIES, build_topology
+
+# Event kinds, in the order they are handled when they fall at the same time.
+DELIVER = 0
+TICK = 1
+
+
+class SimulatedMachine:
+    def __init__(self, name, clock_speed, neighbours, clock):
+        """
+        A machine of the simulation: its logical clock, message queue and recorded events.
+
+        Args:
+            name (int): the machine id.
+            clock_speed (int): ticks per virtual second.
+            neighbours (list): ids of the machines it can send to.
+            clock (LogicalClock): its clock, from logical_clock.make_clock().
+        """
+        self.name = name
+        self.clock_speed = clock_speed
+        self.neighbours = neighbours
+        self.logical_clock = clock
+        self.message_queue = deque()
+        self.ticks = 0
+        self.vectors = isinstance(clock, VectorClock) # record the vector time with each event
+        self.rows = [] # [timestamp, logical_clock_time, queue_length, event_type(, vector)], as in the csv files
+
+    def record(self, now, logical_clock_time, event_type):
+        row = [now, logical_clock_time, len(self.message_queue), event_type]
+        if self.vectors:
+            row.append(format_vector(self.logical_clock.get_vector()))
+        self.rows.append(row)
+
+
+class Simulation:
+    def __init__(self, machines=3, topology="ring", fanout=2, degree=4, speeds=(1, 6), tasks=10,
+                 duration=60, delay=(0.0001, 0.001), seed=262, clock="lamport"):
+        """
+        Sets up a simulated experiment.
+
+        Args:
+            machines (int): number of machines. Defaults to 3.
+            topology (str): one of topology.TOPOLOGIES. Defaults to "ring".
+            fanout (int): neighbours a task 3 message is sent to. Defaults to 2.
+            degree (int): average degree of the random topology. Defaults to 4.
+            speeds (tuple): inclusive range that clock speeds are drawn from. Defaults to (1, 6).
+            tasks (int): tasks are drawn from 1 to `tasks`; tasks above 3 are internal events. Defaults to 10.
+            duration (float): virtual seconds to run for. Defaults to 60.
+            delay (tuple): range of the uniformly drawn network delay, in seconds. Defaults to 0.1 to 1 ms.
+            seed (int): seed for every random choice of the run. Defaults to 262.
+            clock (str): the kind of clock the machines keep, one of logical_clock.CLOCKS. Defaults to "lamport".
+        """
+        self.random = random.Random(seed)
+        self.fanout = fanout
+        self.tasks = tasks
+        self.duration = duration
+        self.delay = delay
+        links = build_topology(topology, machines, degree, seed)
+        self.now = 0.0 # the virtual time, which is also the physical time of hybrid logical clocks
+        self.machines = [SimulatedMachine(name, self.random.randint(*speeds), links[name],
+                                          make_clock(clock, name, machines, lambda: int(self.now * 1000),
+                                                     single_owner=True))
+                         for name in range(machines)]
+        self.events = []
+        self.sequence = itertools.count() # breaks ties between events at the same time in scheduling order
+        self.arrivals = {} # (sender, receiver) -> arrival time of the last message, to deliver in order like TCP
+
+    def schedule(self, when, kind, name, message=None):
+        heapq.heappush(self.events, (when, kind, next(self.sequence), name, message))
+
+    def run(self):
+        """
+        Runs the simulation until `duration` virtual seconds have passed.
+
+        Returns:
+            list: the simulated machines, with their recorded events.
+        """
+        for machine in self.machines:
+            self.schedule(0.0, TICK, machine.name)
+        while self.events:
+            now, kind, _, name, message = heapq.heappop(self.events)
+            if now >= self.duration:
+                break
+            self.now = now
+            machine = self.machines[name]
+            if kind == DELIVER:
+                machine.message_queue.append(message)
+                continue
+            # the body of Machine.run(): read a message if there is one, otherwise run a random task
+            if machine.message_queue:
+                self.pop_message(machine, now)
+            else:
+                self.run_tasks(machine, self.random.randint(1, self.tasks), now)
+            # computed from the tick count rather than summed, so rounding never adds or drops a tick
+            machine.ticks += 1
+            self.schedule(machine.ticks / machine.clock_speed, TICK, name)
+        return self.machines
+
+    def run_tasks(self, machine, task, now):
+        """
+        Machine.run_tasks() on the virtual clock: messages are scheduled for delivery after a network delay.
+        """
+        count = send_count(task, self.fanout)
+        if count:
+            # the send is ticked first, so the messages carry the time of the send
+            logical_clock_time = machine.logical_clock.tick()
+            payload = "task {}".format(task).encode("utf-8")
+            for peer in self.random.sample(machine.neighbours, min(count, len(machine.neighbours))):
+                timestamp, vector = machine.logical_clock.stamp(peer)
+                message = Message(machine.name, timestamp, vector, payload)
+                arrival = max(now + self.random.uniform(*self.delay), self.arrivals.get((machine.name, peer), 0.0))
+                self.arrivals[(machine.name, peer)] = arrival
+                self.schedule(arrival, DELIVER, peer, message)
+            machine.record(now, logical_clock_time, "Send")
+        else:
+            machine.record(now, machine.logical_clock.tick(), "Internal")
+
+    def pop_message(self, machine, now):
+        """
+        Machine.pop_message() on the virtual clock.
+        """
+        message = machine.message_queue.popleft()
+        machine.record(now, machine.logical_clock.merge(message), "Received")
+
+    def write(self, log_directory):
+        """
+        Writes one csv file per machine to `log_directory`/csvs, named like machine.py's.
+        """
+        os.makedirs(f"{log_directory}/csvs", exist_ok=True)
+        for machine in self.machines:
+            with open(f"{log_directory}/csvs/log_{machine.name}_{machine.clock_speed}.csv", "w", newline="") as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(csv_header(machine.vectors))
+                writer.writerows(machine.rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a logical clock experiment on a virtual clock")
+    parser.add_argument("--machines", type=int, default=3, help="number of machines to simulate")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="ring", help="which machines can message each other")
+    parser.add_argument("--fanout", type=int, default=2, help="number of random neighbours a task 3 message goes to")
+    parser.add_argument("--degree", type=int, default=4, help="average number of neighbours in the random topology")
+    parser.add_argument("--speeds", type=int, nargs=2, default=(1, 6), metavar=("MIN", "MAX"),
+                        help="range of clock speeds, in ticks per second")
+    parser.add_argument("--tasks", type=int, default=10, help="tasks are drawn from 1 to TASKS; above 3 is internal")
+    parser.add_argument("--duration", type=float, default=60, help="virtual seconds to run for")
+    parser.add_argument("--delay", type=float, nargs=2, default=(0.0001, 0.001), metavar=("MIN", "MAX"),
+                        help="range of the network delay, in seconds")
+    parser.add_argument("--seed", type=int, default=262, help="seed for reproducibility")
+    parser.add_argument("--clock", choices=CLOCKS, default="lamport", help="the kind of clock the machines keep")
+    parser.add_argument("--log-dir", default="simulation1", help="directory to write csv files to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    simulation = Simulation(args.machines, args.topology, args.fanout, args.degree, tuple(args.speeds), args.tasks,
+                            args.duration, tuple(args.delay), args.seed, args.clock)
+    simulation.run()
+    simulation.write(args.log_dir)
+    events = sum(len(machine.rows) for machine in simulation.machines)
+    print("simulated {} events on {} machines in {:.3f}s".format(events, args.machines, time.perf_counter() - start))
@@ -0,0 +1,211 @@
+"""
+Parameter sweeps over the logical clock experiments.
+
+Runs one experiment for every combination of clock speed range, task range,
+machine count and seed, spread over a pool of processes. Each run gets its
+own directory under the output directory, named after its parameters, and
+its own block of ports, so runs that are going at the same time never
+collide. When every run has finished, index.csv in the output directory
+lists the runs with their parameters, where their results are and how long
+they took.
+
+The task range is what sets the probability of an internal event: tasks are
+drawn from 1 to TASKS and only 1 to 3 send, so it is (TASKS - 3) / TASKS.
+
+Example:
+    python sweep.py --speeds 1-6 1-2 --tasks 5 10 20 --machines 3 10 --seeds 1 2 3 --out sweep1
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from machine import SEND_TASKS
+from simulation import Simulation
+from topology import TOPOLOGIES
+
+INDEX_FIELDS = ["run", "machines", "topology", "min_speed", "max_speed", "tasks", "internal_probability",
+                "seed", "port", "directory", "events", "seconds", "status"]
+
+
+def parse_speeds(value):
+    """
+    Parses a clock speed range such as "1-6", or "4" for a single speed, into (min, max).
+    """
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+def internal_probability(tasks):
+    return max(tasks - SEND_TASKS, 0) / tasks
+
+
+def run_name(machines, speeds, tasks, seed):
+    return "m{}_s{}-{}_t{}_seed{}".format(machines, speeds[0], speeds[1], tasks, seed)
+
+
+def port_block_free(port, count):
+    """
+    Returns True if ports `port` to `port + count - 1` can all be listened on right now.
+    """
+    for candidate in range(port, port + count):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # as Machine.start_server does
+            try:
+                sock.bind(("", candidate))
+            except OSError:
+                return False
+    return True
+
+
+def allocate_ports(sizes, base_port=5000):
+    """
+    Gives every run a block of consecutive ports (a machine listens on its run's port + its id).
+    Blocks never overlap and blocks with a port that is already taken are skipped.
+
+    Args:
+        sizes (list): the number of machines of each run.
+        base_port (int): first port to hand out. Defaults to 5000.
+
+    Returns:
+        list: the first port of each run's block.
+    """
+    ports = []
+    port = base_port
+    for size in sizes:
+        while not port_block_free(port, size):
+            port += size
+            if port + size > 65536:
+                raise RuntimeError("Ran out of ports for the sweep")
+        ports.append(port)
+        port += size
+    return ports
+
+
+def build_runs(speeds, tasks, machines, seeds, topology, fanout, degree, duration, out, base_port=5000, simulate=False):
+    """
+    Lists the runs of a sweep: one per combination of the given clock speed ranges, task ranges,
+    machine counts and seeds.
+
+    Returns:
+        list: one dict per run, with its parameters, directory and (unless simulated) first port.
+    """
+    runs = []
+    for speed_range, task_range, count, seed in itertools.product(speeds, tasks, machines, seeds):
+        name = run_name(count, speed_range, task_range, seed)
+        runs.append({"run": name, "machines": count, "topology": topology, "fanout": fanout, "degree": degree,
+                     "speeds": speed_range, "tasks": task_range, "seed": seed, "duration": duration,
+                     "directory": os.path.join(out, name), "port": None, "simulate": simulate})
+    if not simulate:
+        for run, port in zip(runs, allocate_ports([run["machines"] for run in runs], base_port)):
+            run["port"] = port
+    return runs
+
+
+def count_events(directory):
+    """
+    Returns the number of events recorded in a run's csv files.
+    """
+    events = 0
+    csv_directory = os.path.join(directory, "csvs")
+    for filename in os.listdir(csv_directory):
+        with open(os.path.join(csv_directory, filename)) as csvfile:
+            events += sum(1 for _ in csvfile) - 1 # every file starts with a header
+    return events
+
+
+def execute_run(run):
+    """
+    Runs one experiment of the sweep, in a pool process.
+
+    A simulated run happens in the pool process itself. Otherwise machine.py is started as a
+    separate program, which forks one process per machine and listens on the run's port block.
+
+    Returns:
+        dict: the run's row of the sweep index.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    if run["simulate"]:
+        simulation = Simulation(run["machines"], run["topology"], run["fanout"], run["degree"], run["speeds"],
+                                run["tasks"], run["duration"], seed=run["seed"])
+        simulation.run()
+        simulation.write(run["directory"])
+    else:
+        os.makedirs(run["directory"], exist_ok=True)
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "machine.py"),
+                   str(run["port"]), "--machines", str(run["machines"]), "--topology", run["topology"],
+                   "--fanout", str(run["fanout"]), "--degree", str(run["degree"]), "--seed", str(run["seed"]),
+                   "--speeds", str(run["speeds"][0]), str(run["speeds"][1]), "--tasks", str(run["tasks"]),
+                   "--duration", str(run["duration"]), "--log-dir", run["directory"]]
+        with open(os.path.join(run["directory"], "output.txt"), "w") as output:
+            if subprocess.run(command, stdout=output, stderr=subprocess.STDOUT).returncode != 0:
+                status = "failed"
+    try:
+        events = count_events(run["directory"])
+    except OSError:
+        events, status = 0, "failed"
+    return {"run": run["run"], "machines": run["machines"], "topology": run["topology"],
+            "min_speed": run["speeds"][0], "max_speed": run["speeds"][1], "tasks": run["tasks"],
+            "internal_probability": internal_probability(run["tasks"]), "seed": run["seed"], "port": run["port"],
+            "directory": run["directory"], "events": events, "seconds": time.perf_counter() - start, "status": status}
+
+
+def run_sweep(runs, out, workers=None):
+    """
+    Runs every run of a sweep on a pool of `workers` processes and writes the index to `out`/index.csv.
+
+    Args:
+        runs (list): the runs, from build_runs().
+        out (str): the sweep's output directory.
+        workers (int): number of runs going at once. Defaults to the number of CPUs for simulated
+            runs, and to up to 16 runs otherwise, since real machines spend most of their time asleep.
+
+    Returns:
+        list: the index rows, in the order of `runs`.
+    """
+    os.makedirs(out, exist_ok=True)
+    if workers is None and runs and not runs[0]["simulate"]:
+        workers = min(len(runs), 16)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row in pool.map(execute_run, runs):
+            print("{run}: {status}, {events} events in {seconds:.1f}s".format(**row))
+            rows.append(row)
+    with open(os.path.join(out, "index.csv"), "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=INDEX_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run logical clock experiments over a grid of parameters")
+    parser.add_argument("--speeds", type=parse_speeds, nargs="+", default=[(1, 6)], metavar="MIN-MAX",
+                        help="clock speed ranges to sweep, e.g. 1-6 1-2")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10],
+                        help="task ranges to sweep; the internal event probability is (TASKS - 3) / TASKS")
+    parser.add_argument("--machines", type=int, nargs="+", default=[3], help="machine counts to sweep")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[262], help="seeds to sweep")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="ring", help="which machines can message each other")
+    parser.add_argument("--fanout", type=int, default=2, help="number of random neighbours a task 3 message goes to")
+    parser.add_argument("--degree", type=int, default=4, help="average number of neighbours in the random topology")
+    parser.add_argument("--duration", type=float, default=60, help="seconds each run lasts")
+    parser.add_argument("--workers", type=int, help="runs going at once; defaults to the number of CPUs when simulating, else up to 16")
+    parser.add_argument("--base-port", type=int, default=5000, help="first port handed out to the runs")
+    parser.add_argument("--simulate", action="store_true", help="run the simulation instead of real machines")
+    parser.add_argument("--out", default="sweep1", help="directory to write the runs and index.csv to")
+    args = parser.parse_args()
+
+    runs = build_runs(args.speeds, args.tasks, args.machines, args.seeds, args.topology, args.fanout, args.degree,
+                      args.duration, args.out, args.base_port, args.simulate)
+    start = time.perf_counter()
+    rows = run_sweep(runs, args.out, args.workers)
+    failed = sum(row["status"] != "ok" for row in rows)
+    print("{} runs, {} failed, in {:.1f}s; index at {}".format(len(rows), failed, time.perf_counter() - start,
+                                                              os.path.join(args.out, "index.csv")))
@@ -1,8 +1,28 @@
 from queue import Queue
-from unittest import TestCase
+import csv
+import os
+import tempfile
+import selectors
+import signal
+import socket
+import threading
+import time
+from unittest import TestCase, skipIf
 from unittest.mock import Mock, patch
-from logical_clock import LogicalClock
+from logical_clock import HybridLogicalClock, LogicalClock, VectorClock, compare, make_clock
 from machine import Machine
+from messages import Message, MessageDecoder, encode_message
+try:
+    import analysis
+except ImportError: # the analysis module needs numpy and pandas
+    analysis = None
+from recorder import EventRecorder
+import event_trace
+from event_trace import parse_vector
+from scheduler import TickScheduler
+from simulation import Simulation
+from sweep import build_runs, run_sweep
+from topology import build_topology
 
 class LogicalClockTests(TestCase):
 
@@ -35,7 +55,7 @@ class LogicalClockTests(TestCase):
         with patch('socket.socket', return_value=self.client):
 
             # create a mock message to simulate receiving a message through the socket
-            mock_message = 'test message'.encode(self.this_machine.FORMAT)
+            mock_message = encode_message(1, 5, 'test message'.encode(self.this_machine.FORMAT))
 
             # set the return value of recv to the mock message
             self.client.recv.return_value = mock_message
@@ -43,17 +63,51 @@ class LogicalClockTests(TestCase):
             # call the listen_through_socket method
             x = self.this_machine.listen_through_socket(self.client)
 
-            # assert that put was called on the message_queue with the message
-            self.this_machine.message_queue.put.assert_called_once_with(mock_message.decode(self.this_machine.FORMAT))
+            # assert that put was called on the message_queue with the decoded message
+            self.this_machine.message_queue.put.assert_called_once_with(Message(1, 5, None, b'test message'))
+
+
+    def test_io_loop(self):
+        '''
+        Description:
+        - This function tests that the I/O loop of a machine object reads from the sockets
+        registered with its selector. It connects a socket pair, registers one end, sends
+        a message through the other end and asserts that the message reached the message
+        queue, and that the loop stops once the machine is no longer active.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        self.this_machine.message_queue = Queue()
+        self.this_machine.ACTIVE = True
+        reader, writer = socket.socketpair()
+        self.this_machine.selector.register(reader, selectors.EVENT_READ,
+                                            self.this_machine.listen_through_socket)
+        io_thread = threading.Thread(target=self.this_machine.io_loop)
+        io_thread.start()
+        try:
+            writer.send(encode_message(1, 5))
+            self.assertEqual(self.this_machine.message_queue.get(timeout=5), Message(1, 5, None, b''))
+        finally:
+            self.this_machine.ACTIVE = False
+            io_thread.join()
+            self.this_machine.selector.unregister(reader)
+            reader.close()
+            writer.close()
+        self.assertFalse(io_thread.is_alive())
 
 
     def test_run_tasks(self):
         '''
         Description:
         - This function tests the functionality of the run_tasks method of a machine object. 
-        It sets up a mock socket object and simulates sending messages through the socket 
-        using different task types. It then asserts that the correct number of calls to the 
-        send method were made and that the logical clock was updated correctly.
+        It puts mock sockets in the machine's pool of peer connections and simulates sending
+        messages to random neighbours using different task types. It then asserts that the
+        correct number of calls to the send method were made, that each message carries the
+        time of its send event, and that the logical clock was updated correctly.
 
         Parameters:
         - self: the instance of the test class
@@ -64,63 +118,70 @@ class LogicalClockTests(TestCase):
 
         self.this_machine.logical_clock = LogicalClock()
 
-        # patch the socket module to return the mock socket object
-        with patch('socket.socket.send'):
+        # machine 0 of the default three machine ring has machines 1 and 2 as neighbours;
+        # pool a mock connection to each of them
+        client, conn = Mock(), Mock()
+        self.this_machine.peers = {1: client, 2: conn}
+        self.assertEqual(self.this_machine.neighbours, [1, 2])
+
+        # fix the random choice of neighbours: machine 1, then machine 2, then both
+        with patch('random.sample', side_effect=[[1], [2], [1, 2]]) as sample:
 
-            # test for task = 1 (send through client)
+            # test for task = 1 (send to one random neighbour)
             task = 1
 
             # create a mock message to simulate sending a message through the socket
-            mock_message = "[machine 0, task 1] the time is 0".encode()
+            mock_message = encode_message(0, 1, b"task 1")
 
-            # call the run_tasks method again
-            self.this_machine.run_tasks(task, self.client, self.conn, write_data=False)
+            # call the run_tasks method
+            self.this_machine.run_tasks(task, write_data=False)
 
-            # assert that the send function was called in the client socket, and that
-            # the logical clock was updated correctly
-            self.client.send.assert_called_once_with(mock_message)
+            # assert that the send function was called on the chosen neighbour's connection, and
+            # that the logical clock was updated correctly
+            client.sendall.assert_called_once_with(mock_message)
             self.assertEqual(self.this_machine.logical_clock.get_time(), 1)
 
-            # test for task = 2 (send through server)
+            # test for task = 2 (send to one random neighbour)
             task = 2
 
             # create a mock message to simulate sending a message through the socket
-            mock_message = "[machine 0, task 2] the time is 1".encode()
+            mock_message = encode_message(0, 2, b"task 2")
 
             # call the run_tasks method again
-            self.this_machine.run_tasks(task, self.client, self.conn, write_data=False)
+            self.this_machine.run_tasks(task, write_data=False)
 
-            # assert that the send function was called in the server socket, and that
-            # the logical clock was updated correctly
-            self.conn.send.assert_called_once_with(mock_message)
+            # assert that the send function was called on the chosen neighbour's connection, and
+            # that the logical clock was updated correctly
+            conn.sendall.assert_called_once_with(mock_message)
             self.assertEqual(self.this_machine.logical_clock.get_time(), 2)
 
-            # test for task = 3 (send through client and server)
+            # test for task = 3 (send to `fanout` random neighbours, here both)
             task = 3
-            # create a mock message to simulate sending a message through the socket
-            mock_message = "[machine 0, task 3] the time is 2".encode()
 
             # call the run_tasks method again
-            self.this_machine.run_tasks(task, self.client, self.conn, write_data=False)
+            self.this_machine.run_tasks(task, write_data=False)
             
-            # assert that the send function was called in the client and server socket, 
-            # and that the logical clock was updated correctly
-            self.assertEqual(self.client.send.call_count, 2)
-            self.assertEqual(self.conn.send.call_count, 2)
+            # assert that the send function was called on both connections, that two
+            # neighbours were asked for, and that the logical clock was updated correctly
+            self.assertEqual(client.sendall.call_count, 2)
+            self.assertEqual(conn.sendall.call_count, 2)
+            self.assertEqual([call.args[1] for call in sample.call_args_list], [1, 1, 2])
             self.assertEqual(self.this_machine.logical_clock.get_time(), 3)
 
             # test for task = 4 (Internal Event)
             task = 4
 
             # call the run_tasks method again
-            self.this_machine.run_tasks(task, self.client, self.conn, write_data=False)
+            self.this_machine.run_tasks(task, write_data=False)
 
-            # assert that the send function was not called in the client and server socket, 
-            # and that the logical clock was updated correctly
-            self.assertEqual(self.client.send.call_count, 2)
-            self.assertEqual(self.conn.send.call_count, 2)
+            # assert that the send function was not called again, and that the logical clock
+            # was updated correctly
+            self.assertEqual(client.sendall.call_count, 2)
+            self.assertEqual(conn.sendall.call_count, 2)
             self.assertEqual(self.this_machine.logical_clock.get_time(), 4)
 
+        self.this_machine.peers = {}
+
     def test_pop_message(self):
         '''
         Description:
@@ -140,7 +201,7 @@ class LogicalClockTests(TestCase):
         self.this_machine.logical_clock = LogicalClock()
 
         # queue up a message
-        self.this_machine.message_queue.put("[machine 1, task 3] the time is 0")
+        self.this_machine.message_queue.put(Message(1, 0, None, b""))
 
         # pop the message and assert that the queue is empty and the logical clock was updated
         self.this_machine.pop_message(write_data=False)
@@ -148,8 +209,8 @@ class LogicalClockTests(TestCase):
         self.assertEqual(self.this_machine.logical_clock.get_time(), 1)
 
         # queue up 2 messages
-        self.this_machine.message_queue.put("[machine 1, task 3] the time is 1")
-        self.this_machine.message_queue.put("[machine 2, task 3] the time is 6")
+        self.this_machine.message_queue.put(Message(1, 1, None, b""))
+        self.this_machine.message_queue.put(Message(2, 6, None, b""))
 
         # pop a message and assert that one message is still left, and that the logical clock
         # was updated
@@ -193,4 +254,461 @@ class LogicalClockTests(TestCase):
 
         # update the clock with a later time and assert that there was a time jump
         logical_clock.update(5)
-        self.assertEqual(logical_clock.get_time(), 6)
\ No newline at end of file
+        self.assertEqual(logical_clock.get_time(), 6)
+
+
+    def test_message_decoder(self):
+        '''
+        Description:
+        - This function tests the MessageDecoder used to read clock messages off a socket.
+        It feeds it several messages coalesced into one read and a message split across
+        reads, and asserts that every message is decoded intact, including large timestamps
+        and vector timestamps that the old text format could not carry reliably.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        decoder = MessageDecoder()
+        stream = (encode_message(1, 7) + encode_message(2, 2 ** 40, b"payload", [3, 0, 9])
+                  + encode_message(0, 12, b"split"))
+
+        # two whole messages and the start of a third arrive in one read
+        messages = decoder.feed(stream[:-4])
+        self.assertEqual(messages, [Message(1, 7, None, b""), Message(2, 2 ** 40, [3, 0, 9], b"payload")])
+
+        # the rest of the third message arrives in the next read
+        self.assertEqual(decoder.feed(stream[-4:]), [Message(0, 12, None, b"split")])
+        self.assertEqual(decoder.feed(b""), [])
+
+
+    def test_build_topology(self):
+        '''
+        Description:
+        - This function tests the topologies that machines can be linked in. It builds
+        each kind of topology and asserts that the links are symmetric and that the
+        ring, mesh and star have the expected neighbours.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        self.assertEqual(build_topology("ring", 5)[0], [1, 4])
+        self.assertEqual(build_topology("mesh", 5)[2], [0, 1, 3, 4])
+        star = build_topology("star", 5)
+        self.assertEqual(star[0], [1, 2, 3, 4])
+        self.assertEqual(star[3], [0])
+
+        # every machine that can send to another can also be sent to by it, and every
+        # machine builds the same random graph from the same seed
+        for topology in ("ring", "mesh", "star", "random"):
+            links = build_topology(topology, 50, degree=6)
+            for name, neighbours in links.items():
+                for neighbour in neighbours:
+                    self.assertIn(name, links[neighbour])
+        self.assertEqual(build_topology("random", 50, degree=6), build_topology("random", 50, degree=6))
+
+
+    def test_simulation(self):
+        '''
+        Description:
+        - This function tests the discrete-event simulation. It runs a short simulated
+        experiment twice with the same seed and asserts that both runs record the same
+        events, that every machine ticks at its clock speed, that logical clock
+        times only ever move forward, and that a vector clock's vector is recorded.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        first = Simulation(machines=5, topology="random", duration=10, seed=7).run()
+        second = Simulation(machines=5, topology="random", duration=10, seed=7).run()
+        self.assertEqual([machine.rows for machine in first], [machine.rows for machine in second])
+
+        for machine in first:
+            self.assertEqual(len(machine.rows), 10 * machine.clock_speed)
+            clock_times = [row[1] for row in machine.rows]
+            self.assertEqual(clock_times, sorted(set(clock_times)))
+        event_types = {row[3] for machine in first for row in machine.rows}
+        self.assertEqual(event_types, {"Send", "Received", "Internal"})
+
+        # with a vector clock every row also has the vector time, whose own entry counts the machine's events
+        for machine in Simulation(machines=3, duration=5, seed=7, clock="vector").run():
+            self.assertEqual([parse_vector(row[4])[machine.name] for row in machine.rows],
+                             list(range(1, len(machine.rows) + 1)))
+
+
+    def test_sweep(self):
+        '''
+        Description:
+        - This function tests the parameter sweep runner. It checks that a sweep has one
+        run per combination of parameters, that the port blocks given to the runs never
+        overlap, and that a simulated sweep writes every run's csv files and an index.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        with tempfile.TemporaryDirectory() as out:
+            runs = build_runs([(1, 6), (1, 2)], [5, 10], [3, 10], [1], "ring", 2, 4, 5, out, base_port=20000)
+            self.assertEqual(len(runs), 8)
+            self.assertEqual(len({run["directory"] for run in runs}), 8)
+            ports = [port for run in runs for port in range(run["port"], run["port"] + run["machines"])]
+            self.assertEqual(len(ports), len(set(ports)))
+
+            runs = build_runs([(1, 6)], [5, 20], [3], [1, 2], "ring", 2, 4, 5, out, simulate=True)
+            rows = run_sweep(runs, out, workers=2)
+            self.assertEqual([row["run"] for row in rows], [run["run"] for run in runs])
+            self.assertTrue(all(row["status"] == "ok" and row["events"] > 0 for row in rows))
+            self.assertEqual(rows[0]["internal_probability"], 0.4)
+            for run in runs:
+                self.assertEqual(len(os.listdir(os.path.join(run["directory"], "csvs"))), 3)
+            with open(os.path.join(out, "index.csv")) as index:
+                self.assertEqual(len(list(csv.DictReader(index))), 4)
+
+
+    def test_event_recorder(self):
+        '''
+        Description:
+        - This function tests the buffered event recorder. It records events and asserts
+        that they stay in memory until a batch is full or the recorder is closed, and that
+        they are then appended to the csv file in the order they were recorded.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "log.csv")
+            recorder = EventRecorder(path, text_log=False, batch_size=3, interval=60)
+            recorder.record(1.0, 1, 0, "Internal")
+            recorder.record(2.0, 2, 1, "Send", "Task - 1")
+            self.assertEqual(os.path.getsize(path), 0)
+
+            # filling a batch wakes the writer, and closing writes out the rest
+            recorder.record(3.0, 3, 0, "Received")
+            recorder.record(4.0, 4, 0, "Internal")
+            recorder.close()
+            with open(path, newline='') as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows, [["1.0", "1", "0", "Internal"], ["2.0", "2", "1", "Send"],
+                                    ["3.0", "3", "0", "Received"], ["4.0", "4", "0", "Internal"]])
+
+
+    @skipIf(analysis is None, "numpy and pandas are not installed")
+    def test_analysis(self):
+        '''
+        Description:
+        - This function tests the analysis module. It writes a simulated experiment,
+        loads it once from the csv files and once from the cache, and asserts that both
+        loads match, that the clock jumps and drift agree with the recorded clock times,
+        and that a csv file with only a header loads, uncached, as numbers without any rows.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        with tempfile.TemporaryDirectory() as root:
+            simulation = Simulation(machines=3, duration=10, seed=3)
+            simulation.run()
+            simulation.write(os.path.join(root, "experiment1"))
+
+            events = analysis.load_experiment(root)
+            self.assertTrue(os.path.exists(os.path.join(root, analysis.CACHE_NAME)))
+            cached = analysis.load_experiment(root)
+            self.assertTrue(events.equals(cached))
+            self.assertEqual(len(events), sum(len(machine.rows) for machine in simulation.machines))
+
+            # the jumps of each machine add back up to its final clock time
+            jumps = analysis.jump_sizes(events)
+            for machine in simulation.machines:
+                self.assertEqual(jumps[events["machine"] == machine.name].sum(), machine.logical_clock.get_time())
+
+            final = analysis.drift(events).iloc[-1]
+            times = [machine.logical_clock.get_time() for machine in simulation.machines]
+            self.assertEqual(final["drift"], max(times) - min(times))
+
+            # a machine that recorded nothing leaves a csv file with only a header, which loads as no rows
+            with open(os.path.join(root, "experiment1", "csvs", "log_3_1.csv"), "w", newline='') as csvfile:
+                csv.writer(csvfile).writerow(analysis.COLUMNS)
+            uncached = analysis.load_experiment(root, use_cache=False)
+            self.assertTrue(events.equals(uncached))
+            self.assertEqual(uncached["queue_length"].dtype, "int32")
+            self.assertEqual(len(analysis.queue_percentiles(uncached)), 3)
+
+
+    def test_event_trace(self):
+        '''
+        Description:
+        - This function tests the binary trace format. It records events to a trace
+        through the event recorder, reads the trace back through a memory map, and
+        converts it to a csv file in the usual layout, for a scalar clock and for a
+        vector clock, whose vector is recorded with every event.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = event_trace.trace_path(directory, 2, 5)
+            os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as tracefile:
+                event_trace.write_header(tracefile, 2, 5)
+            recorder = EventRecorder(path, text_log=False, binary=True)
+            recorder.record(1.5, 1, 0, "Send", peer=1)
+            recorder.record(2.5, 7, 3, "Received", peer=0)
+            recorder.record(3.5, 8, 2, "Internal")
+            recorder.close()
+
+            # every record has the same fixed size
+            self.assertEqual(os.path.getsize(path), event_trace.HEADER.size + 3 * event_trace.RECORD.size)
+            name, clock_speed, events = event_trace.read_trace(path)
+            self.assertEqual((name, clock_speed), (2, 5))
+            self.assertEqual(events, [(1.5, 1, 0, "Send", 1, None), (2.5, 7, 3, "Received", 0, None),
+                                      (3.5, 8, 2, "Internal", event_trace.NO_PEER, None)])
+
+            self.assertEqual(event_trace.convert_run(directory), 1)
+            with open(os.path.join(directory, "csvs", "log_2_5.csv"), newline='') as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows[0], ["timestamp", "logical_clock_time", "queue_length", "event_type"])
+            self.assertEqual(rows[2], ["2.5", "7", "3", "Received"])
+
+            # a vector clock's trace has its vector after every record, and in the csv file's vector column
+            path = event_trace.trace_path(directory, 3, 4)
+            with open(path, "wb") as tracefile:
+                event_trace.write_header(tracefile, 3, 4, 3)
+            recorder = EventRecorder(path, text_log=False, binary=True, vectors=True)
+            recorder.record(1.5, 1, 0, "Internal", vector=[0, 0, 1])
+            recorder.record(2.5, 6, 0, "Received", peer=1, vector=[2, 5, 2])
+            recorder.close()
+            self.assertEqual(os.path.getsize(path), event_trace.HEADER.size + 2 * (event_trace.RECORD.size + 3 * 8))
+            self.assertEqual(event_trace.read_trace(path), (3, 4, [(1.5, 1, 0, "Internal", event_trace.NO_PEER, (0, 0, 1)),
+                                                                (2.5, 6, 0, "Received", 1, (2, 5, 2))]))
+            self.assertEqual(event_trace.convert_run(directory), 2)
+            with open(os.path.join(directory, "csvs", "log_3_4.csv"), newline='') as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows, [["timestamp", "logical_clock_time", "queue_length", "event_type", "vector"],
+                                    ["1.5", "1", "0", "Internal", "0 0 1"], ["2.5", "6", "0", "Received", "2 5 2"]])
+            if analysis is not None:
+                self.assertEqual(list(analysis.read_trace(path)["logical_clock_time"]), [1, 6])
+
+
+    def test_vector_clock(self):
+        '''
+        Description:
+        - This function tests the vector clock. It sends messages between three vector
+        clocks through the wire format, with and without delta encoding, and asserts that
+        the vectors are merged correctly, that delta messages only carry changed entries,
+        and that compare tells ordered events from concurrent ones.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        def send(sender, receiver):
+            # the send is an event of the sender, and the message carries its time
+            sender.tick()
+            timestamp, vector = sender.stamp(receiver.name)
+            message, = MessageDecoder().feed(encode_message(sender.name, timestamp, b"", vector))
+            receiver.merge(message)
+            return message
+
+        for delta in (False, True):
+            clocks = [VectorClock(name, 3, delta) for name in range(3)]
+            clocks[0].tick()
+            send(clocks[0], clocks[1])
+            self.assertEqual(clocks[1].get_vector(), [2, 1, 0])
+            # the send happened before its receipt
+            self.assertEqual(compare(clocks[0].get_vector(), clocks[1].get_vector()), "before")
+            clocks[2].tick()
+            # machine 2 has not heard from the others: its event is concurrent with theirs
+            self.assertEqual(compare(clocks[2].get_vector(), clocks[1].get_vector()), "concurrent")
+            before = clocks[1].get_vector()
+            send(clocks[1], clocks[2])
+            self.assertEqual(clocks[2].get_vector(), [2, 2, 2])
+            self.assertEqual(compare(before, clocks[2].get_vector()), "before")
+            self.assertEqual(compare(clocks[2].get_vector(), before), "after")
+            self.assertEqual(compare(before, before), "equal")
+
+            # messages only carry the entries that are not zero
+            clocks[0].tick()
+            message = send(clocks[0], clocks[1])
+            self.assertEqual(message.vector, {0: 4})
+            self.assertEqual(clocks[1].get_vector(), [4, 3, 0])
+            send(clocks[2], clocks[0])
+            send(clocks[0], clocks[1])
+            self.assertEqual(clocks[1].get_vector(), [6, 4, 3])
+
+            # with delta encoding, a second message from 1 to 0 only carries the entry that changed
+            send(clocks[1], clocks[0])
+            message = send(clocks[1], clocks[0])
+            self.assertEqual(message.vector, {1: 6} if delta else {0: 6, 1: 6, 2: 3})
+            self.assertEqual(clocks[0].get_vector(), [8, 6, 3])
+
+            # a lost connection makes the next message carry the whole vector again
+            clocks[1].forget(0)
+            self.assertEqual(clocks[1].stamp(0)[1], {0: 6, 1: 6, 2: 3})
+
+    def test_hybrid_logical_clock(self):
+        '''
+        Description:
+        - This function tests the hybrid logical clock. It drives two clocks with a fake
+        physical clock and asserts that their times follow physical time, and that the
+        counter orders events when physical time stands still or a message comes from a
+        machine whose physical clock is ahead.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        physical = [100]
+        clock = HybridLogicalClock(lambda: physical[0])
+        ahead = HybridLogicalClock(lambda: physical[0] + 50)
+
+        clock.tick()
+        self.assertEqual(HybridLogicalClock.unpack(clock.get_time()), (100, 0))
+        clock.tick()
+        self.assertEqual(HybridLogicalClock.unpack(clock.get_time()), (100, 1))
+
+        # a message from a clock that is ahead moves this one forward past it
+        ahead.tick()
+        clock.merge(Message(1, ahead.stamp()[0], None, b""))
+        self.assertEqual(HybridLogicalClock.unpack(clock.get_time()), (150, 1))
+        self.assertGreater(clock.get_time(), ahead.get_time())
+
+        # once physical time passes it, the counter starts over
+        physical[0] = 200
+        clock.tick()
+        self.assertEqual(HybridLogicalClock.unpack(clock.get_time()), (200, 0))
+
+
+    def test_single_owner_clock(self):
+        '''
+        Description:
+        - This function tests the values returned by the clock methods and the single
+        owner mode. It asserts that tick and merge return the time they set, and that a
+        single owner clock keeps the same time as a locked one without taking its lock.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        for kind in ("lamport", "vector", "hybrid"):
+            locked = make_clock(kind, 0, 3, physical_time=lambda: 10)
+            owned = make_clock(kind, 0, 3, physical_time=lambda: 10, single_owner=True)
+            with owned.lock: # a single owner clock never takes its lock, so this would deadlock otherwise
+                for clock in (locked, owned):
+                    self.assertEqual(clock.tick(), clock.get_time())
+                    self.assertEqual(clock.merge(Message(1, clock.stamp(1)[0] + 5, {1: 4} if kind == "vector" else None,
+                                                         b"")), clock.get_time())
+                self.assertEqual(owned.get_time(), locked.get_time())
+                self.assertEqual(owned.stamp(1), locked.stamp(1))
+
+        # the Lamport clock returns the times it is set to
+        clock = LogicalClock(single_owner=True)
+        self.assertEqual(clock.tick(), 1)
+        self.assertEqual(clock.update(5), 6)
+        self.assertEqual(clock.merge(Message(1, 2, None, b"")), 7)
+
+
+    def test_tick_scheduler(self):
+        '''
+        Description:
+        - This function tests the tick scheduler with a fake clock. It asserts that ticks
+        are due at fixed times from the start however long each one takes, that late ticks
+        are run back to back with the catch-up policy and dropped with the skip policy, and
+        that the achieved rate of every second is recorded.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        # ticks that take 30 ms at 10 ticks per second still start every 100 ms
+        scheduler = TickScheduler(10, clock=lambda: now[0], sleep=sleep)
+        starts = []
+        while scheduler.elapsed() < 2:
+            starts.append(now[0])
+            now[0] += 0.03
+            scheduler.wait()
+        self.assertEqual(len(starts), 20)
+        self.assertAlmostEqual(starts[-1], 1.9)
+        self.assertEqual(scheduler.rates(), [(1, 10, 10, 0), (2, 10, 10, 0)])
+
+        for policy, ticks, skipped in (("catch-up", 10, 0), ("skip", 8, 2)):
+            now[0] = 0.0
+            scheduler = TickScheduler(10, policy, clock=lambda: now[0], sleep=sleep)
+            starts = []
+            while scheduler.elapsed() < 1:
+                starts.append(round(now[0], 3))
+                # the second tick stalls until 450 ms, past the due times of the ticks at 200 and 300 ms
+                now[0] += 0.35 if len(starts) == 2 else 0.01
+                scheduler.wait()
+            self.assertEqual(len(starts), ticks)
+            self.assertEqual(scheduler.skipped, skipped)
+            # either way, the ticks after the stall are back on their original schedule
+            self.assertEqual(starts[-2:], [0.8, 0.9])
+
+
+    def test_sigterm(self):
+        '''
+        Description:
+        - This function tests how a machine handles SIGTERM. It sends the signal to itself
+        while an event is buffered and asserts that the handler only marks the machine as
+        terminated, leaving the recorder open, and that run() then stops without ticking
+        and writes out the buffered event before cleanup() closes the machine.
+
+        Parameters:
+        - self: the instance of the test class
+
+        Return:
+        - None
+        '''
+        previous = signal.getsignal(signal.SIGTERM)
+        with tempfile.TemporaryDirectory() as directory:
+            machine = Machine(1, 3100, directory, text_log=False)
+            try:
+                machine.recorder.record(1.0, 1, 0, "Internal")
+                os.kill(os.getpid(), signal.SIGTERM)
+                self.assertTrue(machine.TERMINATED)
+                self.assertFalse(machine.recorder.closed)
+
+                # run() doesn't wait for the other machines or tick, but still writes out the events
+                started = time.monotonic()
+                with patch.object(machine, "start_server"), patch.object(machine, "io_loop"):
+                    machine.run()
+                self.assertLess(time.monotonic() - started, 1)
+                self.assertEqual(machine.scheduler.ticks, 0)
+                self.assertTrue(machine.recorder.closed)
+                with open(machine.csv_log, newline='') as csvfile:
+                    self.assertEqual(list(csv.reader(csvfile))[1:], [["1.0", "1", "0", "Internal"]])
+                self.assertTrue(os.path.exists(machine.rates_log))
+            finally:
+                machine.cleanup()
+                signal.signal(signal.SIGTERM, previous)
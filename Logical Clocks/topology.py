@@ -0,0 +1,45 @@
+import random
+
+TOPOLOGIES = ("ring", "mesh", "star", "random")
+
+
+def build_topology(topology, machines, degree=4, seed=262):
+    """
+    Builds an undirected graph over machines 0 .. machines - 1.
+
+    Args:
+        topology (str): "ring" (each machine linked to the next and previous), "mesh" (every pair
+            linked), "star" (machine 0 linked to all others) or "random" (a ring plus random extra
+            links, so the graph stays connected, for an average degree of about `degree`).
+        machines (int): the number of machines.
+        degree (int): target average degree of the random graph. Defaults to 4.
+        seed (int): seed for the random graph, so every machine process builds the same one. Defaults to 262.
+
+    Returns:
+        dict: machine id -> sorted list of the ids it is linked to.
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError("Unknown topology {}".format(topology))
+    links = {name: set() for name in range(machines)}
+
+    def link(a, b):
+        if a != b:
+            links[a].add(b)
+            links[b].add(a)
+
+    if topology == "mesh":
+        for a in range(machines):
+            for b in range(a + 1, machines):
+                link(a, b)
+    elif topology == "star":
+        for name in range(1, machines):
+            link(0, name)
+    else:
+        for name in range(machines):
+            link(name, (name + 1) % machines)
+        if topology == "random" and machines > 3:
+            generator = random.Random(seed)
+            extra = max(degree - 2, 0) * machines // 2
+            for _ in range(extra):
+                link(generator.randrange(machines), generator.randrange(machines))
+    return {name: sorted(peers) for name, peers in links.items()}